@@ -1,67 +1,52 @@
 import streamlit as st
 import pandas as pd
-import folium
-import base64
-from streamlit_folium import st_folium
-import networkx as nx
-from bokeh.plotting import figure, from_networkx
-from bokeh.models import Range1d, Circle, ColumnDataSource, MultiLine
-
-st.set_page_config(page_title="Graph Representation", page_icon="🌍")
-
-# # background image
-def add_bg_from_local(image_file):
-    with open(image_file, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read())
-    st.markdown(
-    f"""
-    <style>
-    .stApp {{
-        background-image: url(data:image/{"jpg"};base64,{encoded_string.decode()});
-        background-size: cover;
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True
-    )
-
-add_bg_from_local('faint_bg.jpg')
+import streamlit.components.v1 as components
 
+from tube_twin.app import setup_page
+from tube_twin.graph_view import graph_figure, graph_renderer, graph_sources
+from tube_twin.instrument import finish_run, timed
+from tube_twin.map_layer import map_html
+from tube_twin.network import get_network, month_options
+from tube_twin.playback import network_playback
+from tube_twin.profiles import DAY_TYPES, get_profiles
+from tube_twin.simulation import simulate
+from tube_twin.spatial import nearest_stations
+
+# page config, background and page timing (see tube_twin.app)
+setup_page("Graph Representation", "🌍", "map")
 
 st.markdown("# The London Tube Map & Graph")
 st.markdown("## Stations Map...")
 # st.sidebar.header("Mapping Demo")
 st.write(
-    """The below Map, shows the locations of london underground stations"""
+    """The below Map, shows the locations of london underground stations, circles grow with the station's
+    passenger count for the month selected in the sidebar, or with its entries and exits at a time of day"""
 )
 
-# Reading our Datasets
-lu_stations = pd.read_csv("Graph_Data/london.stations.csv")
-lu_conns = pd.read_csv("Graph_Data/london.connections.csv")
-crowding_df = pd.read_csv("Graph_Data/station_counts_grouped_per_station.csv")
-
-# creating a folium map using London Coordinates
-london_map = folium.Map(zoom_start=12, width=1200, height=700, location=[51.529865, -0.128092])
-
-# looping through stations rows
-for i, r in lu_stations.iterrows():
-    # setting for the popup
-    popup = folium.Popup(r['name'], max_width=1000)
-    # Plotting the Marker for each stationsト
-    folium.map.Marker(
-        location=[r['latitude'], r['longitude']],
-        popup=popup,
-        icon=folium.Icon(color="green", icon="train", prefix='fa')
-    ).add_to(london_map)
-    folium.vector_layers.CircleMarker(
-        location=[r['latitude'], r['longitude']],
-        # radius=r['count']/10000,
-        color='#3186cc',
-        fill_color='#3186cc'
-    ).add_to(london_map)
-
-# # lets view the london map
-st_folium(london_map, width=725)
+# month shown on the map, the graph and the simulation below
+months = month_options()
+month = st.sidebar.selectbox("Month", list(months), index=list(months).index("2021-01"))
+
+# stations drawn as one GeoJSON layer sized by the month's passenger count, rendered once per month
+# (see tube_twin.map_layer)
+time_of_day = st.checkbox("Size stations by time of day (2020 quarter-hour profiles)")
+walking = st.checkbox("Show walking links between nearby stations")
+if time_of_day:
+    col1, col2 = st.columns([1, 3])
+    map_day = col1.selectbox("Day type", DAY_TYPES, key="map_day")
+    map_slot = col2.select_slider("Quarter-hour", options=get_profiles().slots, value="0800-0815", key="map_slot")
+    components.html(map_html(*months[month], slot=map_slot, day=map_day, walking=walking), height=700)
+else:
+    components.html(map_html(*months[month], walking=walking), height=700)
+
+# nearest stations of any point, from the spatial index of the stations (see tube_twin.spatial)
+with st.expander("Nearest stations to a location"):
+    col1, col2, col3 = st.columns(3)
+    latitude = col1.number_input("Latitude", value=51.5074, format="%.4f")
+    longitude = col2.number_input("Longitude", value=-0.1278, format="%.4f")
+    nearest_k = col3.number_input("Stations", min_value=1, max_value=20, value=5)
+    st.dataframe(nearest_stations(latitude, longitude, int(nearest_k)).round(1), use_container_width=True,
+                 hide_index=True)
 
 st.markdown("## Graph Network simulation...")
 st.write(
@@ -71,67 +56,18 @@ st.write(
     - Hoover onto a particular Node to view its details, i.e Station artributes
     - The Red edges represent interconnection of stations in different zones
     - The Green edges show station links not in the same zone
+    - Colour the edges by line instead to see which lines run along them
     """
 )
 
-
-def stations_crowding_df(stations_df, crowding_df, year, month):
-    """
-      creates a dataframe with station details with their respective crowding information to be simulated from the graph network
-
-      parameters: stations_df - dataframe of London Underground station details
-                  crowding_df - dataframe with monthly crowding information of stations
-                  year - year of interest
-                  month - month of interest
-    """
-    # filter crowding data based on year and month of interest
-    df = crowding_df[crowding_df['Calendar Year (Travel Date)'] == int(year)]
-    df2 = df[df['Month Name (Travel Date)'] == str(month)]
-    df3 = df2[['NLC', 'Count of Taps']]
-    df3['NLC'] = df3['NLC'].astype('float64')
-
-    # merged dataframe
-    df4 = pd.merge(stations_df, df3, how='outer', on="NLC")
-    # dropping nulls ni coordinates column
-    final_df = df4.dropna(subset=['latitude', 'longitude'], axis=0)
-
-    return final_df
+colour_by = st.radio("Colour links by", ["Zone", "Line"], horizontal=True)
 
 
-# creating df to visualize
-final_df = stations_crowding_df(lu_stations, crowding_df, 2021, "January")
 # Graph title
-
 Title = "Graph Interaction Demonstration"
 
-# creating a graph object
-G = nx.Graph()
-G.add_nodes_from(final_df['id'])
-G.add_edges_from(list(zip(lu_conns['station1'], lu_conns['station2'])))
-
-# getting geographical coordinates
-cordinates = list(zip(lu_stations['longitude'], lu_stations['latitude']))
-positions = dict(zip(lu_stations['id'], cordinates))
-
-# setting node attributes
-mapping_dict = dict(zip(final_df.id, final_df.name))
-zones_dict = dict(zip(final_df.id, final_df.zone))
-counts_dict = dict(zip(final_df['id'], final_df['Count of Taps']))
-
-nx.set_node_attributes(G, name="Name", values=mapping_dict)
-nx.set_node_attributes(G, name="Zone", values=zones_dict)
-nx.set_node_attributes(G, name="Passenger_Count", values=counts_dict)
-
-# visualizing stations based on zones
-SAME_ZONE_COLOR, DIFFERENT_ZONE_COLOR = "green", "red"
-edge_attrs = {}
-
-for start_node, end_node, _ in G.edges(data=True):
-    edge_color = SAME_ZONE_COLOR if G.nodes[start_node]["Zone"] == G.nodes[end_node]["Zone"] else DIFFERENT_ZONE_COLOR
-    edge_attrs[(start_node, end_node)] = edge_color
-
-# setting edge attributes
-nx.set_edge_attributes(G, edge_attrs, "edge_color")
+# attributed graph of the network for the month, shared with the insights page (see tube_twin.network)
+G, positions = get_network(*months[month])
 
 # Establish which categories will appear when hovering over each node
 HOVER_TOOLTIPS = [("Station", "@Name"),
@@ -139,16 +75,47 @@ HOVER_TOOLTIPS = [("Station", "@Name"),
                   ("Passenger Count", "@Passenger_Count")]
 
 # Create a plot — set dimensions, toolbar, and title
-plot = figure(tooltips=HOVER_TOOLTIPS, width=700, height=500, tools="pan,wheel_zoom,save,reset",
-              active_scroll='wheel_zoom')
-
-# Create a network graph object
-network_graph = from_networkx(G, positions, scale=1, center=(0, 0))
+plot = graph_figure(HOVER_TOOLTIPS)
 
-network_graph.node_renderer.glyph = Circle(size=7, fill_color="grey")
-network_graph.edge_renderer.glyph = MultiLine(line_color="edge_color", line_alpha=0.8, line_width=1)
+# Create a network graph object, only the attributes shown are sent to the browser (see tube_twin.graph_view)
+edge_colour = "edge_color" if colour_by == "Zone" else "line_color"
+network_graph = graph_renderer(graph_sources(G, positions, edge_columns=(edge_colour,)), line_color=edge_colour,
+                               line_width=1 if colour_by == "Zone" else 2)
 
 # Add network graph to the plot
 plot.renderers.append(network_graph)
 
-st.bokeh_chart(plot, use_container_width=True)
+with timed("bokeh.chart"):
+    st.bokeh_chart(plot, use_container_width=True)
+
+st.markdown("## Passenger flow simulation...")
+st.write(
+    """Quarter-hour entries and exits of a typical day, scaled to the month selected in the sidebar, are spread over
+    the network with a gravity model and assigned to the quickest routes (see tube_twin.simulation).
+    """
+)
+
+
+@st.cache_resource(max_entries=8)
+def simulated_day(day, year, month):
+    return simulate(day=day, year=year, month=month)
+
+
+day = st.selectbox("Day type", DAY_TYPES)
+flows = simulated_day(day, *months[month])
+st.line_chart(pd.DataFrame({"Passengers on links": flows.link_load.sum(axis=1)}, index=flows.slots))
+st.caption(f"{flows.walked.sum():,.0f} trips of the day between nearby stations are quicker on foot and are "
+           "walked instead (see tube_twin.spatial)")
+# loads of the day summed per line (see tube_twin.multilayer)
+st.bar_chart(flows.line_loads().sum().sort_values(ascending=False).rename("Passengers on the line's links"))
+
+# the day's station loads go to the browser once and are played back there (see tube_twin.playback)
+with timed("bokeh.chart"):
+    st.bokeh_chart(network_playback(G, positions, flows.station_loads(), flows.slots, title="Quarter-hour",
+                                    tooltips=[("Station", "@Name"), ("Zone", "@Zone")]),
+                   use_container_width=True)
+
+slot = st.select_slider("Time of day", options=flows.slots, value="0800-0815")
+st.dataframe(flows.busiest_links(slot)[['From', 'To', 'load']].round(0), use_container_width=True, hide_index=True)
+
+finish_run()
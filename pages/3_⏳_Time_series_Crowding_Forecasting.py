@@ -1,35 +1,17 @@
 import streamlit as st
-import time
-import pandas as pd
-import base64
 from urllib.error import URLError
 from datetime import datetime
-from tqdm import tqdm_notebook
-from itertools import product
-
-# Stats packages
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-
-st.set_page_config(page_title="Time series Plotting", page_icon="📈")
-
-# # background image
-def add_bg_from_local(image_file):
-    with open(image_file, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read())
-    st.markdown(
-    f"""
-    <style>
-    .stApp {{
-        background-image: url(data:image/{"jpg"};base64,{encoded_string.decode()});
-        background-size: cover;
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True
-    )
 
-add_bg_from_local('faint_bg.jpg')
+from tube_twin.app import setup_page
+from tube_twin.data import load_forecasting_data, load_station_codes
+from tube_twin.forecasters import FORECASTERS, fast_forecast_all, fast_forecasting
+from tube_twin.instrument import finish_run, timed
+from tube_twin.jobs import DONE, FAILED, QUEUED, RUNNING, job_status, submit_forecast
+from tube_twin.monthly import get_monthly
+from tube_twin.playback import timeline_playback
 
+# page config, background and page timing (see tube_twin.app)
+setup_page("Time series Plotting", "📈", "forecasting")
 
 st.markdown("# Time series plotting per station")
 st.sidebar.header("Plotting Demo")
@@ -39,85 +21,8 @@ st.write(
 )
 
 # reading entry data for modelling
-df = pd.read_parquet('Forecasting_Data/data/data.parquet')
-format = '%Y-%m'
-date_time = []
-for i in df.reset_index()['Month-Year']:
-    date_time.append(datetime.strptime(i, format))
-df['timestamp'] = date_time
-df = df.set_index('timestamp')
-
-
-# prediction function
-def sarimax(parameters_list, d, D, s, exog):
-    results = []
-    for param in tqdm_notebook(parameters_list):
-        try:
-            model = SARIMAX(exog,
-                            order=(param[0], d, param[1]),
-                            seasonal_order=(param[2], D, param[3], s)).fit(disp=-1)
-        except:
-            continue
-
-        aic = model.aic
-        results.append([param, aic])
-    result_df = pd.DataFrame(results)
-    result_df.columns = ['(p,q)x(P,Q)', 'AIC']
-    # Sort in ascending order, lower AIC is better
-    result_df = result_df.sort_values(by='AIC', ascending=True).reset_index(drop=True)
-
-    return result_df
-
-
-def timedelta(date, df_station):
-    # function to determine period between two dates in terms of months
-    y = ((date.year - df_station.index[len(df_station) - 1].year) * 12)
-    if date.month > df_station.index[len(df_station) - 1].year:
-        m = date.month - df_station.index[len(df_station) - 1].year
-    else:
-        m = date.month
-    return y + m
-
-
-# forecasting function
-def forecasting(date, station):
-    if len(date) == 2:
-        # from_date = datetime.datetime.strptime(date[0], '%Y-%m-%d')
-        start = timedelta(date[0], df_station)
-        # to_date = datetime.datetime.strptime(date[1], '%Y-%m-%d')
-        end = timedelta(date[1], df_station)
-    elif len(date) == 1:
-        # from_date = datetime.datetime.strptime(date[0]
-        start = timedelta(date[0], df_station)
-        st.write(start)
-
-    p = range(0, 4, 1)
-    d = 1
-    q = range(0, 4, 1)
-    P = range(0, 4, 1)
-    D = 1
-    Q = range(0, 4, 1)
-    s = 4
-
-    parameters = product(p, q, P, Q)
-    parameters_list = list(parameters)
-
-    result_df = sarimax(parameters_list, 1, 1, 4, df_station)
-
-    p = result_df['(p,q)x(P,Q)'][0][0]
-    q = result_df['(p,q)x(P,Q)'][0][1]
-    P = result_df['(p,q)x(P,Q)'][0][2]
-    Q = result_df['(p,q)x(P,Q)'][0][3]
-    best_model = SARIMAX(df_station, order=(p, d, q), seasonal_order=(P, D, Q, s)).fit(dis=-1)
-    # forecasting
-
-    if len(date) == 2:
-        forecast = best_model.predict(start=start, end=end)
-    elif len(date) == 1:
-        st.write(start)
-        forecast = best_model.predict(start=start)
-
-    return list(forecast)
+df = load_forecasting_data()
+
 
 # # plotting
 # def plot(forecast):
@@ -128,13 +33,72 @@ def forecasting(date, station):
 #     plt.plot(df_station, label='actual')
 #     plt.legend()
 
-# reading our preprocessed entry_exit data
-grouped_df = pd.read_csv("Graph_Data/station_counts_grouped_per_station.csv")
-station_codes = pd.read_csv("Graph_Data/station_nlc_codes.csv")
+# monthly counts pivoted per station and month, a station's series is one row of it (see tube_twin.monthly)
+monthly = get_monthly()
+station_codes = load_station_codes()
 
 # creating a dictionary for station to NLC codes key value pairs
 stations_dict = dict(zip(station_codes.Station, station_codes.NLC))
 
+
+def show_forecast(job_id):
+    # renders the job's status once, returns its state
+    job = job_status(job_id)
+    when = datetime.strptime(job["dates"][0], '%Y-%m-%d')
+    if job["state"] == "done":
+        st.write('Forecast Population for ', when.strftime("%B"), 'in ', str(when.year), ': ', job["result"])
+    elif job["state"] == "failed":
+        st.error(f"Forecast failed: {job['error']}")
+    else:
+        st.info(f"Forecast {job['state']} for {when:%B %Y} ({job['elapsed']:.0f}s)...")
+        if fragment is None:
+            st.button("Refresh", key=f"refresh_{job_id}")
+    return job["state"]
+
+
+def poll_forecast(job_id):
+    # a finished job reruns the page once, which renders it with show_forecast and stops the polling
+    if show_forecast(job_id) in (DONE, FAILED):
+        st.rerun()
+
+
+# re-run only the forecast status every few seconds while the job is pending and the rest of the page stays as it is
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if fragment is not None:
+    poll_forecast = fragment(run_every=2)(poll_forecast)
+
+mode = st.sidebar.radio("Forecast mode", ["Single station", "All stations"])
+# fast models fit every station at once in milliseconds, accurate runs the SARIMAX order search
+speed = st.sidebar.radio("Model", ["Fast", "Accurate (SARIMAX)"])
+fast_model = st.sidebar.selectbox("Fast model", list(FORECASTERS), index=list(FORECASTERS).index("holt_winters"),
+                                  disabled=speed != "Fast")
+if mode == "All stations":
+    st.markdown("### All stations forecast")
+    horizon = st.number_input("Months ahead", min_value=1, max_value=24, value=6)
+    if st.button("Forecast all stations"):
+        if speed == "Fast":
+            all_forecasts = fast_forecast_all(int(horizon), df=df,
+                                              stations={nlc: name for name, nlc in stations_dict.items()},
+                                              model=fast_model)
+        else:
+            # imported on first use, like the SARIMAX fitting behind it
+            from tube_twin.forecast import forecast_all
+
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+
+            def show_progress(done, total, rate):
+                progress_bar.progress(done / total)
+                status_text.text(f"{done}/{total} stations - {rate:.1f} stations/s")
+
+            all_forecasts = forecast_all(int(horizon), df=df,
+                                         stations={nlc: name for name, nlc in stations_dict.items()},
+                                         progress=show_progress)
+        st.dataframe(all_forecasts, use_container_width=True)
+        st.download_button("Download CSV", all_forecasts.to_csv(index=False), "station_forecasts.csv")
+    finish_run()
+    st.stop()
+
 try:
     stations = st.multiselect(
         "Choose Station to view Plot", list(stations_dict.keys()), ["Green Park"]
@@ -155,27 +119,17 @@ try:
                          ### {station} Station
                     """
                 )
-                green_park_data = grouped_df[grouped_df['NLC'] == stations_dict.get(station)].reset_index()[
-                    ['Month-Year', 'Count of Taps']]
                 # progress_bar = st.sidebar.progress(0)
                 # status_text = st.sidebar.empty()
                 # df = green_park_data.to_numpy()
-                data = green_park_data.set_index('Month-Year')
-                last_rows = data[:1]
-                chart = st.line_chart(last_rows, use_container_width=True
-                                      )
-                for i in range(green_park_data.shape[0]):
-                    new_rows = data[:i + 1]
-                    # status_text.text("%i%% Complete" % i)
-                    chart.add_rows(new_rows)
-                    # progress_bar.progress(i)
-                    last_rows = new_rows
-                    time.sleep(0.05)
+                data = monthly.station(stations_dict.get(station)).to_frame()
+                # the whole series goes to the browser once, the slider and play button animate it there
+                # (see tube_twin.playback)
+                with timed("bokeh.chart"):
+                    st.bokeh_chart(timeline_playback(data, title="Month"), use_container_width=True)
             with col2:
-                station = int(station_codes['NLC'][station_codes['Station'] == station].unique())
-                df_station = df['Count of Taps'][df['NLC'] == station].copy()
+                station = int(stations_dict[station])
 
-                date = []
                 st.write("Choose Date:")
                 # col3, col4 = st.columns(2, gap = "small")
                 # with col3:
@@ -183,17 +137,25 @@ try:
                 # with col4:
                 # e = st.date_input("To", key = count+1)
                 count += 1
+                # forecasts run as background jobs (see tube_twin.jobs), the page only polls them; a forecast
+                # already asked for by any session is picked up instead of being searched again
+                job_key = f"forecast_job_{station}"
                 if st.button("Predict", key=count):
-                    y = str(d.year)
-                    m = str(d.month)
-                    m_n = d.strftime("%B")
-                    y_m = y + '-' + m + '-' + '01'
-                    da = datetime.strptime(y_m, '%Y-%m-%d')
-                    date.append(d)
-
-                    forecast = forecasting(date, station)
-                    st.write('Forecast Population for ', m_n, 'in ', y, ': ', forecast)
-                    # plot(forecast)
+                    if speed == "Fast":
+                        st.session_state.pop(job_key, None)
+                        try:
+                            forecast = fast_forecasting([d], station, df=df, model=fast_model)
+                            st.write('Forecast Population for ', d.strftime("%B"), 'in ', str(d.year), ': ', forecast)
+                        except (KeyError, ValueError) as e:
+                            st.error(f"No fast forecast for this station and date: {e}")
+                    else:
+                        st.session_state[job_key] = submit_forecast(station, [d])
+                if job_key in st.session_state:
+                    job_id = st.session_state[job_key]
+                    if fragment is not None and job_status(job_id)["state"] in (QUEUED, RUNNING):
+                        poll_forecast(job_id)
+                    else:
+                        show_forecast(job_id)
 
 
 except URLError as e:
@@ -206,4 +168,6 @@ except URLError as e:
     )
 
 # rerun.
-st.button("Re-run")
\ No newline at end of file
+st.button("Re-run")
+
+finish_run()
@@ -0,0 +1,54 @@
+import os
+
+import streamlit as st
+
+from tube_twin.app import setup_page
+from tube_twin.instrument import (cache_stats, histogram, last_profile, profile_armed, prometheus_text,
+                                  request_profile, reset, stage_stats)
+
+# page config and background like every page (see tube_twin.app); its own runs are not timed, they would only
+# add noise to the numbers it shows
+setup_page("Diagnostics", "🩺")
+
+# the page stays in the sidebar of every user on purpose, so operators can find it, but its numbers are only
+# shown when asked for with ?diagnostics=1 or TUBE_TWIN_DIAGNOSTICS=1
+if st.query_params.get("diagnostics") != "1" and os.environ.get("TUBE_TWIN_DIAGNOSTICS") != "1":
+    st.markdown("# Diagnostics")
+    st.info("Server diagnostics are switched off. Operators can open this page with ?diagnostics=1, or start "
+            "the server with TUBE_TWIN_DIAGNOSTICS=1.")
+    st.stop()
+
+st.markdown("# Diagnostics")
+st.write(
+    """Latency of the instrumented stages and cache hit rates of this server process since it started
+    (see tube_twin.instrument)."""
+)
+
+st.markdown("### Stages")
+stages = stage_stats().sort_values('total_s', ascending=False)
+st.dataframe(stages.round(4), use_container_width=True, hide_index=True)
+if len(stages):
+    stage = st.selectbox("Latency histogram of", list(stages['stage']))
+    st.bar_chart(histogram(stage))
+
+st.markdown("### Caches")
+st.dataframe(cache_stats().round(3), use_container_width=True, hide_index=True)
+
+st.markdown("### Profiling")
+if st.button("Profile the next page run"):
+    request_profile()
+if profile_armed():
+    st.write("Armed: the next run of the map, insights or forecasting page is profiled with cProfile.")
+profile = last_profile()
+if profile is not None:
+    st.write(f"Last profile: {profile['page']} page, {profile['seconds']:.2f}s")
+    st.code(profile["stats"], language="text")
+
+st.markdown("### Export")
+metrics = prometheus_text()
+with st.expander("Prometheus metrics"):
+    st.code(metrics, language="text")
+st.download_button("Download metrics", metrics, "tube_twin.prom")
+if st.button("Reset counters"):
+    reset()
+    st.rerun()
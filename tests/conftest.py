@@ -0,0 +1,12 @@
+import pytest
+
+from tube_twin import paths
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cache_dir(tmp_path_factory):
+    # every test run gets an empty cache instead of the one the dashboard uses
+    with pytest.MonkeyPatch.context() as mp:
+        folder = tmp_path_factory.mktemp("cache")
+        mp.setattr(paths, "CACHE_DIR", folder)
+        yield folder
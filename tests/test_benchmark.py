@@ -0,0 +1,31 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from tube_twin import benchmark
+
+
+def test_origins_leave_horizon_months_after_every_cut():
+    assert benchmark.origins(24, folds=3, horizon=3) == [15, 18, 21]
+    assert benchmark.origins(5, folds=3, horizon=3) == [2]
+
+
+def test_errors_match_their_definitions():
+    actual = np.array([100.0, 0.0, 50.0])
+    predicted = np.array([90.0, 5.0, 60.0])
+    mape, rmse = benchmark.errors(actual, predicted)
+    assert math.isclose(mape, (10 / 100 + 10 / 50) / 2 * 100)
+    assert math.isclose(rmse, math.sqrt((100 + 25 + 100) / 3))
+
+
+def test_backtest_station_times_and_traces_separately():
+    index = pd.date_range("2019-01-01", periods=24, freq="MS")
+    series = pd.Series(1000 + 100 * np.sin(np.arange(24) * np.pi / 2) + np.arange(24), index=index)
+    config = benchmark.configurations(max_orders=(2,))[0]
+    [record] = benchmark.backtest_station(500, series, config, folds=1, horizon=3)
+    assert record["origin"] == "2020-09" and record["error"] is None
+    assert record["fit_seconds"] > 0 and record["peak_mib"] > 0
+
+    untraced = benchmark.backtest_station(500, series, config, folds=1, horizon=3, memory=False)
+    assert math.isnan(untraced[0]["peak_mib"])
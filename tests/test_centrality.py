@@ -0,0 +1,44 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from tube_twin.centrality import CentralityStore, weighted_graph
+from tube_twin.data import load_connections, load_stations
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return weighted_graph(load_connections(), nodes=load_stations()['id'])
+
+
+@pytest.fixture(scope="module")
+def store(graph):
+    return CentralityStore(graph)
+
+
+def assert_matches_networkx(store, G):
+    metrics = store.metrics
+    betweenness = nx.betweenness_centrality(G, weight='time')
+    closeness = nx.closeness_centrality(G, distance='time')
+    assert np.allclose(metrics['betweenness'], [betweenness[n] for n in metrics.index])
+    assert np.allclose(metrics['closeness'], [closeness[n] for n in metrics.index])
+    assert list(metrics['degree']) == [G.degree(n) for n in metrics.index]
+
+
+def test_metrics_match_networkx(store, graph):
+    assert_matches_networkx(store, graph)
+
+
+def test_incremental_update_matches_a_fresh_computation(store, graph):
+    u, v = next(iter(graph.edges()))
+    w, x = list(graph.edges())[100]
+    updated = store.copy()
+    recomputed = updated.update_edges(removed=[(u, v)], changed={(w, x): graph[w][x]['time'] * 3})
+    assert 0 < len(recomputed) <= len(store.nodes)
+
+    changed = graph.copy()
+    changed.remove_edge(u, v)
+    changed[w][x]['time'] *= 3
+    assert_matches_networkx(updated, changed)
+    # the shared store is left as it was
+    assert_matches_networkx(store, graph)
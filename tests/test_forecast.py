@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from tube_twin import forecast, registry
+
+
+def test_reduced_grid_forecast_is_not_served_as_canonical():
+    index = pd.date_range("2019-01-01", periods=36, freq="MS")
+    noise = np.random.default_rng(0).normal(0, 20, 36)
+    counts = 1000 + 100 * np.sin(np.arange(36) * np.pi / 2) + 3 * np.arange(36) + noise
+    df = pd.DataFrame({'NLC': 905, 'Rail Station Name': 'Test', 'Count of Taps': counts}, index=index)
+    result = forecast.forecast_all(3, df=df, workers=1, max_order=2)
+    assert len(result) == 3 and result['forecast'].notna().all()
+    series = df['Count of Taps']
+    assert registry.lookup(905, series)["max_order"] == 2
+    # full grid callers search again instead of reusing the reduced model
+    assert forecast.load_model(905, series) is None
+    # a second reduced run reuses it without searching
+    before = registry.read_index()["905"]["version"]
+    forecast.forecast_all(3, df=df, workers=1, max_order=2)
+    assert registry.read_index()["905"]["version"] == before
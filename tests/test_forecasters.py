@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from tube_twin.forecasters import FORECASTERS, Forecaster, HoltWinters, RidgeLags, SeasonalNaive, panel
+
+
+@pytest.fixture(scope="module")
+def Y():
+    return panel().to_numpy()
+
+
+def test_incomplete_forecaster_cannot_be_created():
+    class FitOnly(Forecaster):
+        def fit(self, Y):
+            return self
+
+    with pytest.raises(TypeError):
+        FitOnly()
+
+
+def test_seasonal_naive_repeats_last_season(Y):
+    predicted = SeasonalNaive(season=12).fit(Y).predict(18)
+    assert np.array_equal(predicted[:12], Y[-12:])
+    assert np.array_equal(predicted[12:], Y[-12:-6])
+
+
+def holt_winters_reference(y, m, alpha, beta, gamma, phi, horizon):
+    # one station, one set of constants, plain Python
+    level = y[:m].mean()
+    trend = (y[m:2 * m].mean() - level) / m
+    seasonal = list(y[:m] - level)
+    for t in range(m, len(y)):
+        s = seasonal[t % m]
+        new_level = alpha * (y[t] - s) + (1 - alpha) * (level + phi * trend)
+        trend = beta * (new_level - level) + (1 - beta) * phi * trend
+        seasonal[t % m] = gamma * (y[t] - new_level) + (1 - gamma) * s
+        level = new_level
+    return [max(level + sum(phi ** i for i in range(1, h + 1)) * trend + seasonal[(len(y) + h - 1) % m], 0.0)
+            for h in range(1, horizon + 1)]
+
+
+def test_holt_winters_matches_scalar_reference(Y):
+    model = HoltWinters(season=12, grid=((0.5,), (0.1,), (0.3,))).fit(Y)
+    predicted = model.predict(6)
+    for j in (0, 50, 200):
+        expected = holt_winters_reference(Y[:, j], 12, 0.5, 0.1, 0.3, model.damping, 6)
+        assert np.allclose(predicted[:, j], expected)
+
+
+def test_ridge_network_feature_leaves_the_station_out(Y):
+    model = RidgeLags().fit(Y)
+    others = (Y.sum(axis=1)[:, None] - Y) / model.total_scale
+    assert np.allclose(model.network, others)
+    features = model._features(model.Z, model.network, len(Y) - 1)
+    assert np.allclose(features[:, len(model.lags)], others[len(Y) - 2])
+
+
+@pytest.mark.parametrize("name", sorted(FORECASTERS))
+def test_forecasts_are_finite_and_non_negative(Y, name):
+    model = FORECASTERS[name]().fit(Y)
+    predicted = model.predict(6)
+    assert predicted.shape == (6, Y.shape[1])
+    assert np.isfinite(predicted).all() and (predicted >= 0).all()
+    assert np.isfinite(model.interval(6)).all()
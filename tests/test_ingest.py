@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from tube_twin import ingest, paths
+from tube_twin.data import load_crowding
+from tube_twin.paths import GRAPH_DATA
+
+EXPORT = GRAPH_DATA / "Entry_and_Exit data.csv"
+
+
+@pytest.fixture(scope="module")
+def ingested():
+    # small chunks, every month spans several of them and is written out while the export is still read
+    written = ingest.ingest_monthly([EXPORT], chunksize=2000, log=lambda message: None)
+    return written
+
+
+def test_partitions_go_to_the_cache_directory(ingested):
+    assert ingest.monthly_root().is_relative_to(paths.CACHE_DIR)
+    assert len(ingested) == len(ingest.stored_partitions(ingest.monthly_root(), 'year', 'month'))
+
+
+def test_read_monthly_matches_the_grouped_counts(ingested):
+    key = ['Month-Year', 'NLC']
+    crowding = load_crowding()
+    merged = ingest.read_monthly().merge(crowding, on=key, suffixes=('', '_grouped'))
+    assert len(merged) > 0.9 * len(crowding)
+    pd.testing.assert_series_equal(merged['Count of Taps'], merged['Count of Taps_grouped'], check_names=False,
+                                   check_dtype=False)
+
+
+def test_a_second_run_skips_every_stored_month(ingested, monkeypatch):
+    aggregated = []
+    sums = ingest.monthly_sums
+
+    def counting(chunks, names=None):
+        for period, partial in sums(chunks, names):
+            aggregated.append(period)
+            yield period, partial
+
+    monkeypatch.setattr(ingest, "monthly_sums", counting)
+    assert ingest.ingest_monthly([EXPORT], chunksize=2000, log=lambda message: None) == []
+    assert aggregated == []
+
+
+def test_unordered_rows_of_a_written_month_are_added_to_it(ingested, tmp_path):
+    rows = pd.read_csv(EXPORT).sample(frac=1, random_state=0)
+    rows.to_csv(tmp_path / "shuffled.csv", index=False)
+    ingest.ingest_monthly([tmp_path / "shuffled.csv"], root=tmp_path / "monthly", chunksize=10000,
+                          log=lambda message: None)
+    key = ['Month-Year', 'NLC']
+    expected = ingest.read_monthly().sort_values(key, ignore_index=True)
+    pd.testing.assert_frame_equal(ingest.read_monthly(tmp_path / "monthly").sort_values(key, ignore_index=True),
+                                  expected)
@@ -0,0 +1,48 @@
+import os
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from tube_twin import jobs
+
+
+@pytest.fixture
+def quick_forecast(monkeypatch):
+    series = pd.Series([1.0, 2.0, 3.0], index=["2021-01", "2021-02", "2021-03"])
+    monkeypatch.setattr(jobs, "station_series", lambda nlc, df=None: series * nlc)
+    monkeypatch.setattr(jobs, "forecasting", lambda dates, series, nlc: [float(nlc)])
+
+
+def wait_done(job_id):
+    for _ in range(100):
+        status = jobs.job_status(job_id)
+        if status["state"] in (jobs.DONE, jobs.FAILED):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_finished_jobs_are_forgotten(quick_forecast):
+    job_id = jobs.submit_forecast(501, [date(2022, 6, 1)])
+    assert wait_done(job_id)["result"] == [501.0]
+    for _ in range(100):
+        if job_id not in jobs._futures:
+            break
+        time.sleep(0.01)
+    assert job_id not in jobs._futures
+    assert jobs.submit_forecast(501, [date(2022, 6, 1)]) == job_id
+
+
+def test_jobs_of_other_hosts_live_while_their_lease_is_fresh(quick_forecast):
+    job_id = jobs.forecast_job_id(502, [date(2022, 6, 1)], jobs.station_series(502))
+    # a pid that is alive here says nothing about the other host
+    jobs._write_status(job_id, id=job_id, state=jobs.RUNNING, submitted=time.time(), host="elsewhere",
+                       pid=os.getpid())
+    assert jobs.job_status(job_id)["state"] == jobs.RUNNING
+
+    stale = time.time() - 2 * jobs.LEASE
+    os.utime(jobs._status_path(job_id), (stale, stale))
+    status = jobs.job_status(job_id)
+    assert status["state"] == jobs.FAILED and status["error"] == jobs.INTERRUPTED
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tube_twin.data import load_crowding, load_stations
+from tube_twin.monthly import build_monthly
+from tube_twin.network import stations_crowding_df
+
+
+@pytest.fixture(scope="module")
+def crowding():
+    return load_crowding()
+
+
+@pytest.fixture(scope="module")
+def monthly(crowding):
+    return build_monthly(crowding)
+
+
+@pytest.fixture(scope="module")
+def pivot(crowding):
+    return crowding.pivot_table(index='NLC', columns='Month-Year', values='Count of Taps', aggfunc='sum')
+
+
+def test_matrix_matches_a_pandas_pivot(monthly, pivot):
+    assert monthly.counts.dtype == np.int64
+    assert np.array_equal(monthly.nlc, pivot.index.to_numpy())
+    assert monthly.labels == list(pivot.columns)
+    assert np.allclose(monthly.values(), pivot.to_numpy(), equal_nan=True)
+
+
+def test_month_and_station_lookups(monthly, crowding):
+    month = crowding[crowding['Month-Year'] == "2021-01"].set_index('NLC')['Count of Taps'].sort_index()
+    assert monthly.month("2021-01").to_dict() == month.to_dict()
+    assert monthly.month("January", 2021).to_dict() == month.to_dict()
+    station = crowding[crowding['NLC'] == 541].set_index('Month-Year')['Count of Taps'].sort_index()
+    assert monthly.station(541).to_dict() == station.to_dict()
+    assert monthly.station(-1).empty
+
+
+def test_yoy_and_rolling_match_pandas(monthly, pivot):
+    frame = pivot.astype('float64')
+    assert np.allclose(monthly.yoy(), frame - frame.shift(12, axis=1), equal_nan=True)
+    ratio = frame / frame.shift(12, axis=1) - 1
+    assert np.allclose(monthly.yoy(ratio=True), ratio.where(frame.shift(12, axis=1) > 0), equal_nan=True)
+    for stat in ('mean', 'sum', 'std'):
+        expected = getattr(frame.T.rolling(3), stat)().T
+        # pandas' online rolling std drifts by up to about 1e-4 relative on counts in the millions
+        assert np.allclose(monthly.rolling(3, stat), expected, rtol=1e-4, equal_nan=True)
+    with pytest.raises(ValueError):
+        monthly.rolling(3, 'median')
+
+
+def test_stations_crowding_df_matches_the_filter_and_merge(monthly, crowding):
+    stations = load_stations()
+    for year, month in monthly.periods[::5]:
+        rows = crowding[(crowding['Calendar Year (Travel Date)'] == year) &
+                        (crowding['Month Name (Travel Date)'] == month)]
+        merged = pd.merge(stations, rows[['NLC', 'Count of Taps']].astype({'NLC': 'float64'}), how='outer', on='NLC')
+        expected = merged.dropna(subset=['latitude', 'longitude']).sort_values('id')
+        result = stations_crowding_df(stations, monthly, year, month).sort_values('id')
+        assert np.array_equal(result['id'], expected['id'])
+        assert np.allclose(result['Count of Taps'], expected['Count of Taps'], equal_nan=True)
+
+
+def test_missing_month_keeps_columns_a_month_apart(crowding, pivot):
+    gap = build_monthly(crowding[crowding['Month-Year'] != "2020-06"])
+    assert gap.labels == list(pivot.columns)
+    j = gap.column["2020-06"]
+    assert not gap.reported[j] and gap.reported.sum() == len(gap.labels) - 1
+    assert gap.month("2020-06").empty and np.isnan(gap.totals()["2020-06"])
+
+    frame = pivot.astype('float64')
+    frame["2020-06"] = np.nan
+    assert np.allclose(gap.yoy(), frame - frame.shift(12, axis=1), equal_nan=True)
+    # 2020-06 has no change on 2019-06, 2020-07 still compares with 2019-07
+    assert gap.yoy()["2020-06"].isna().all() and gap.yoy()["2020-07"].notna().any()
+    assert np.allclose(gap.rolling(3), frame.T.rolling(3).mean().T, equal_nan=True)
+    assert gap.rolling(3)[["2020-06", "2020-07", "2020-08"]].isna().all().all()
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from tube_twin.data import load_connections, load_lines
+from tube_twin.multilayer import INTERCHANGE, build_multilayer
+
+
+@pytest.fixture(scope="module")
+def conns():
+    return load_connections()
+
+
+@pytest.fixture(scope="module")
+def net(conns):
+    return build_multilayer(conns, load_lines())
+
+
+def test_line_links_are_the_connections_in_both_directions(conns, net):
+    expected = {(u, v, line) for u, v, line in conns[['station1', 'station2', 'line']].itertuples(index=False)}
+    expected |= {(v, u, line) for u, v, line in expected}
+    links = net.line_links()
+    assert len(links) == len(expected)
+    assert {tuple(map(int, link)) for link in links} == expected
+    times = dict(zip(map(tuple, links.tolist()), net.line_link_times()))
+    for u, v, line, time in conns.itertuples(index=False):
+        assert times[(u, v, line)] == times[(v, u, line)] == time
+
+
+def test_interchanges_join_every_pair_of_nodes_of_a_station(net):
+    sources = net.edge_sources()
+    changes = net.edge_line == INTERCHANGE
+    assert np.array_equal(net.node_station[sources[changes]], net.node_station[net.indices[changes]])
+    per_station = net.station_lines()
+    assert changes.sum() == (per_station * (per_station - 1)).sum()
+
+
+def test_adjacency_is_symmetric_with_penalised_interchanges(net):
+    matrix = net.adjacency(penalty=5.0)
+    assert (abs(matrix - matrix.T) > 1e-9).nnz == 0
+    assert np.allclose(matrix.data[net.edge_line == INTERCHANGE], 5.0)
+
+
+def test_line_summary_counts_match_the_connections(conns, net):
+    summary = net.line_summary().set_index('line')
+    for line, group in conns.groupby('line'):
+        stations = np.unique(group[['station1', 'station2']].to_numpy())
+        assert summary.at[line, 'stations'] == len(stations)
+        assert summary.at[line, 'links'] == len(group)
+        assert summary.at[line, 'time'] == group['time'].sum()
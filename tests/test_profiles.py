@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tube_twin import profiles
+from tube_twin.paths import GRAPH_DATA
+
+
+@pytest.fixture(scope="module")
+def wide():
+    # the rows as published, read without the loader's cleaning
+    df = pd.read_csv(GRAPH_DATA / "2020.csv", skipinitialspace=True)
+    df.columns = df.columns.str.strip()
+    return df[df['Mode'] == 'LU']
+
+
+@pytest.fixture(scope="module")
+def store():
+    return profiles.get_profiles('LU')
+
+
+def _rows(wide, day, direction):
+    rows = wide[(wide['day'] == day) & (wide['dir'] == direction)]
+    return rows.groupby('NLC')[[c for c in wide.columns if c[:4].isdigit()]].sum()
+
+
+@pytest.mark.parametrize("day", profiles.DAY_TYPES)
+def test_slot_matches_the_wide_rows(store, wide, day):
+    entries, exits = _rows(wide, day, 'IN'), _rows(wide, day, 'OUT')
+    for slot in ("0500-0515", "0800-0815", "1745-1800", "0045-0100"):
+        at = store.at(slot, day, 'IN')
+        assert at[at > 0].to_dict() == entries[slot][entries[slot] > 0].to_dict()
+        both = store.at(slot, day)
+        expected = entries[slot].add(exits[slot], fill_value=0).reindex(both.index, fill_value=0)
+        assert np.array_equal(both.to_numpy(), expected.to_numpy())
+
+
+def test_station_matches_its_wide_row(store, wide):
+    for nlc in (500, 632, 717):
+        for day in profiles.DAY_TYPES:
+            for direction in profiles.DIRECTIONS:
+                row = _rows(wide, day, direction).loc[nlc]
+                series = store.station(nlc, day, direction)
+                assert series.index.tolist() == row.index.tolist()
+                assert np.array_equal(series.to_numpy(), row.to_numpy())
+
+
+def test_store_is_reused_and_bounded(store, monkeypatch):
+    assert profiles.get_profiles('LU') is store
+    # a new version of 2020.csv replaces the mode's store rather than adding to it
+    monkeypatch.setattr(profiles, "files_stamp", lambda *paths: "newer")
+    monkeypatch.setattr(profiles, "_stores", dict(profiles._stores))
+    before = len(profiles._stores)
+    newer = profiles.get_profiles('LU')
+    assert newer is not store and np.array_equal(newer.counts, store.counts)
+    assert len(profiles._stores) == before and profiles._stores['LU'][0] == "newer"
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from tube_twin import registry
+
+
+@pytest.fixture
+def series():
+    return pd.Series([100.0, 120.0, 90.0, 110.0], index=["2021-01", "2021-02", "2021-03", "2021-04"])
+
+
+def test_register_and_lookup(series):
+    entry = registry.register(900, series, (1, 0, 1, 0), 12.5, [0.1, 0.2], 12)
+    assert registry.lookup(900, series) == entry
+    assert registry.lookup(900, series * 2) is None
+
+
+def test_concurrent_register_keeps_index_valid(series):
+    # the forecast job pool registers models from several threads of one process
+    def register_many(nlc):
+        for _ in range(50):
+            registry.register(nlc, series, (1, 0, 1, 0), 12.5, [0.1, 0.2], 12)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(register_many, [901, 901, 902, 902]))
+
+    index = registry.read_index()
+    assert index["901"]["version"] == 100
+    assert index["902"]["version"] == 100
+    assert not list(registry._root().glob("*.tmp"))
+
+
+def test_lookup_treats_a_smaller_grid_as_stale(series):
+    registry.register(903, series, (1, 0, 1, 0), 12.5, [0.1, 0.2], 12, max_order=2)
+    assert registry.lookup(903, series)["max_order"] == 2
+    assert registry.lookup(903, series, max_order=2) is not None
+    assert registry.lookup(903, series, max_order=4) is None
+    # entries of an unknown grid never pass for a searched one
+    registry.register(904, series, (1, 0, 1, 0), 12.5, [0.1, 0.2], 12)
+    assert registry.lookup(904, series, max_order=1) is None
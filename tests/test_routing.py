@@ -0,0 +1,103 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from tube_twin import routing
+from tube_twin.data import load_connections, load_stations
+from tube_twin.paths import cache_path, staged_folder
+from tube_twin.routing import build_routing
+
+PENALTY = 5.0
+
+
+@pytest.fixture(scope="module")
+def conns():
+    return load_connections()
+
+
+@pytest.fixture(scope="module")
+def table(conns):
+    return build_routing(conns, load_stations()['id'], PENALTY)
+
+
+@pytest.fixture(scope="module")
+def reference(conns):
+    # the line-aware graph built directly in networkx: one node per (station, line), interchanges cost PENALTY
+    G = nx.DiGraph()
+    for u, v, line, time in conns.itertuples(index=False):
+        G.add_edge((u, line), (v, line), time=float(time))
+        G.add_edge((v, line), (u, line), time=float(time))
+    lines = {}
+    for station, line in G.nodes:
+        lines.setdefault(station, []).append(line)
+    for station, served in lines.items():
+        for a in served:
+            for b in served:
+                if a != b:
+                    G.add_edge((station, a), (station, b), time=PENALTY)
+    return G, lines
+
+
+def test_journey_times_match_networkx(table, reference):
+    G, lines = reference
+    origins = table.stations[::7]
+    for origin in origins:
+        if int(origin) not in lines:
+            assert np.isinf(table.times[table.position[int(origin)]]).sum() == len(table.stations) - 1
+            continue
+        dist = nx.multi_source_dijkstra_path_length(G, {(int(origin), line) for line in lines[int(origin)]},
+                                                    weight='time')
+        expected = np.full(len(table.stations), np.inf)
+        for (station, _), minutes in dist.items():
+            i = table.position[station]
+            expected[i] = min(expected[i], minutes)
+        expected[table.position[int(origin)]] = 0.0
+        assert np.allclose(table.times[table.position[int(origin)]], expected, atol=1e-3)
+
+
+def test_legs_add_up_to_the_journey_time(table, conns):
+    times = {}
+    for u, v, line, time in conns.itertuples(index=False):
+        times[(u, v, line)] = times[(v, u, line)] = time
+    rng = np.random.default_rng(0)
+    for origin, destination in rng.choice(table.stations, size=(50, 2)):
+        legs = table.legs(int(origin), int(destination))
+        if not legs:
+            continue
+        minutes = 0.0
+        for (a, line_a), (b, line_b) in zip(legs, legs[1:]):
+            minutes += PENALTY if a == b else times[(a, b, line_a)]
+            assert a == b or line_a == line_b
+        assert legs[0][0] == origin and legs[-1][0] == destination
+        assert minutes == pytest.approx(table.journey_time(int(origin), int(destination)), abs=1e-3)
+
+
+def test_od_matrix_is_a_lookup_of_the_table(table):
+    origins, destinations = table.stations[:5], table.stations[-4:]
+    assert np.array_equal(table.od_matrix(origins, destinations),
+                          table.times[np.ix_(range(5), range(len(table.stations) - 4, len(table.stations)))])
+    with pytest.raises(KeyError):
+        table.indices([-1])
+
+
+def test_cached_table_is_published_whole(table, conns, monkeypatch):
+    stations = load_stations()
+    key = routing._network_key(conns, stations['id'], PENALTY)
+    folder = cache_path("routing", key)
+    # a folder left behind by an interrupted write is replaced, not read
+    folder.mkdir(exist_ok=True)
+    np.save(folder / "stations.npy", np.arange(3))
+    monkeypatch.setattr(routing, "_tables", {})
+    cached = routing.get_routing(conns, stations, PENALTY)
+    assert np.array_equal(cached.times, table.times) and np.array_equal(cached.pred, table.pred)
+    assert not any(p.name.startswith(".") for p in folder.parent.iterdir())
+
+
+def test_first_complete_folder_wins(tmp_path):
+    folder = tmp_path / "table"
+    # the inner block completes first, the outer writer then finds the folder published and drops its copy
+    with staged_folder(folder, "meta.json") as slow, staged_folder(folder, "meta.json") as fast:
+        (slow / "meta.json").write_text("slow")
+        (fast / "meta.json").write_text("fast")
+    assert (folder / "meta.json").read_text() == "fast"
+    assert [p.name for p in tmp_path.iterdir()] == ["table"]
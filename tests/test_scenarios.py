@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from tube_twin import paths, scenarios
+from tube_twin.routing import get_routing
+
+
+def test_cached_result_takes_the_name_of_the_spec():
+    first = scenarios.scenario(removed=[(107, 192, 11)], name="first")
+    second = scenarios.scenario(removed=[(107, 192, 11)], name="second")
+    assert scenarios.scenario_hash(first) == scenarios.scenario_hash(second)
+
+    assert scenarios.run_scenario(first)["summary"]["name"] == "first"
+    assert scenarios.run_scenario(second)["summary"]["name"] == "second"
+    assert list(scenarios.run_scenarios([second, first])["name"]) == ["second", "first"]
+
+
+def test_closing_a_branch_end_cuts_its_station_off(monkeypatch):
+    # 114 is only served by its connection to 140
+    closure = scenarios.scenario(removed=[(114, 140, 1)], name="closed")
+    result = scenarios.run_scenario(closure)
+    summary, stations = result["summary"], result["stations"].set_index('id')
+
+    base = get_routing()
+    row = list(base.stations).index(114)
+    reachable = np.isfinite(np.asarray(base.times)[row]).sum() - 1
+    assert reachable > 0
+    assert summary["new_unreachable_pairs"] == 2 * reachable
+    assert stations.loc[140, 'delta_through'] < 0
+    links = result["links"]
+    assert not ((links['station1'] == 114) | (links['station2'] == 114)).any()
+
+    # the rerun reads the stored result back
+    monkeypatch.setattr(scenarios, "_evaluate", lambda *args: pytest.fail("scenario evaluated twice"))
+    again = scenarios.run_scenario(closure)
+    assert again["summary"] == summary
+    assert not list((paths.CACHE_DIR / "scenarios").glob(".*"))
+
+
+def test_slowing_a_link_lengthens_journeys():
+    slowed = scenarios.run_scenario(scenarios.scenario(slowed={(107, 192, 11): 10.0}))["summary"]
+    assert slowed["delta_mean_journey_time"] > 0 and slowed["new_unreachable_pairs"] == 0
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from tube_twin import simulation
+from tube_twin.data import load_connections, load_stations
+from tube_twin.routing import build_routing
+
+
+@pytest.fixture(scope="module")
+def routing():
+    return build_routing(load_connections(), load_stations()['id'])
+
+
+@pytest.fixture(scope="module")
+def flows(routing):
+    return simulation.simulate(routing=routing, keep_trips=True, walk=False)
+
+
+def test_gravity_balancing_meets_entry_and_exit_totals():
+    rng = np.random.default_rng(0)
+    entries, exits = rng.uniform(10, 100, (3, 20)), rng.uniform(10, 100, (3, 20))
+    cost = rng.uniform(1, 30, (20, 20))
+    trips = simulation.gravity_od(entries, exits, cost, iterations=500, tol=1e-9)
+    assert np.allclose(np.diagonal(trips, axis1=1, axis2=2), 0)
+    assert np.allclose(trips.sum(axis=2), entries, rtol=1e-4)
+    # exits are rescaled to the slot's entries before balancing
+    scaled = exits * entries.sum(axis=1, keepdims=True) / exits.sum(axis=1, keepdims=True)
+    assert np.allclose(trips.sum(axis=1), scaled, rtol=1e-4)
+
+
+def test_unreachable_pairs_get_no_trips():
+    cost = np.array([[0, 5, np.inf], [5, 0, np.inf], [np.inf, np.inf, 0]])
+    trips = simulation.gravity_od(np.ones((1, 3)), np.ones((1, 3)), cost)
+    assert trips[0, :2, 2].sum() == 0 and trips[0, 2, :2].sum() == 0
+
+
+def test_incidence_follows_the_routed_paths(routing):
+    link_inc, station_inc = simulation.path_incidence(routing, simulation.line_links())
+    n = len(routing.stations)
+    hops = np.asarray(link_inc.sum(axis=1)).ravel()
+    passed = np.asarray(station_inc.sum(axis=1)).ravel()
+    rng = np.random.default_rng(1)
+    for o, d in rng.integers(0, n, (200, 2)):
+        path = routing.path(int(routing.stations[o]), int(routing.stations[d]))
+        expected = len(path) - 1 if len(path) > 1 else 0
+        assert hops[o * n + d] == expected
+        assert passed[o * n + d] == max(expected - 1, 0)
+
+
+def test_link_loads_are_trips_times_hops(routing, flows):
+    link_inc, station_inc = simulation.path_incidence(routing, flows.line_links)
+    n = len(routing.stations)
+    trips = flows.trips.reshape(len(flows.slots), n * n).astype('float64')
+    hops = np.asarray(link_inc.sum(axis=1)).ravel()
+    passed = np.asarray(station_inc.sum(axis=1)).ravel()
+    assert np.allclose(flows.line_load.sum(axis=1), trips @ hops, rtol=1e-4)
+    assert np.allclose(flows.link_load.sum(axis=1), trips @ hops, rtol=1e-4)
+    assert np.allclose(flows.through.sum(axis=1), trips @ passed, rtol=1e-4)
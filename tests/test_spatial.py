@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from tube_twin.data import load_stations
+from tube_twin.spatial import SAME_SITE, build_station_index, haversine, walking_links
+
+
+@pytest.fixture(scope="module")
+def stations():
+    return load_stations().dropna(subset=['latitude', 'longitude']).sort_values('id')
+
+
+@pytest.fixture(scope="module")
+def index(stations):
+    return build_station_index(stations)
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(0)
+    return rng.uniform(51.4, 51.65, 200), rng.uniform(-0.45, 0.15, 200)
+
+
+def brute_force(stations, lat, lon):
+    # (points, stations) haversine distances
+    return haversine(lat[:, None], lon[:, None], stations['latitude'].to_numpy()[None, :],
+                     stations['longitude'].to_numpy()[None, :])
+
+
+def test_haversine_of_a_known_distance():
+    # one degree of latitude along a meridian
+    assert haversine(51.0, 0.0, 52.0, 0.0) == pytest.approx(111_195, rel=1e-3)
+
+
+def test_nearest_matches_brute_force(stations, index, points):
+    lat, lon = points
+    distance, ids = index.nearest(lat, lon, k=3)
+    expected = np.sort(brute_force(stations, lat, lon), axis=1)[:, :3]
+    assert np.allclose(distance, expected, rtol=1e-6, atol=1e-3)
+    # ids may differ between stations sharing coordinates, their distances may not
+    all_distances = brute_force(stations, lat, lon)
+    chosen = all_distances[np.arange(len(lat))[:, None], np.searchsorted(stations['id'].to_numpy(), ids)]
+    assert np.allclose(chosen, distance, atol=1e-3)
+
+
+def test_within_and_catchment_match_brute_force(stations, index, points):
+    lat, lon = points
+    all_distances = brute_force(stations, lat, lon)
+    for found, row in zip(index.within(lat, lon, 1000), all_distances):
+        assert set(found.tolist()) == set(stations['id'].to_numpy()[row <= 1000].tolist())
+    catchment = index.catchment(lat, lon, max_distance=800, chunk=64)
+    nearest = all_distances.min(axis=1)
+    assert np.array_equal(catchment == -1, nearest > 800)
+    counts = index.catchment_counts(lat, lon)
+    assert counts.sum() == len(lat)
+
+
+def test_walking_links_are_the_close_pairs(stations, index):
+    links = walking_links(max_distance=750, index=index)
+    lat, lon, ids = (stations[c].to_numpy() for c in ('latitude', 'longitude', 'id'))
+    distances = haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    close = (distances <= 750) & (distances >= SAME_SITE)
+    expected = {(int(ids[i]), int(ids[j])) for i, j in zip(*np.nonzero(close))}
+    assert set(zip(links['station1'], links['station2'])) == expected
+    assert np.allclose(links['distance'], distances[np.searchsorted(ids, links['station1']),
+                                                    np.searchsorted(ids, links['station2'])])
@@ -0,0 +1,4 @@
+"""
+London Tube Twin - shared data, network, simulation and forecasting code used by the Streamlit pages, and run
+headlessly with python -m tube_twin (see tube_twin.batch).
+"""
@@ -0,0 +1,81 @@
+"""
+Command line of the tube_twin package, runs its batch work without Streamlit.
+
+    python -m tube_twin simulate|forecast|centrality|network|scenarios [options]   (see tube_twin.batch)
+    python -m tube_twin train|ingest|benchmark|startup [options]                   (the module's own CLI)
+"""
+import argparse
+import importlib
+import sys
+
+from tube_twin.batch import run_job
+
+# commands handled by the CLI of their own module
+MODULES = {
+    "train": ("tube_twin.train", "pre-train per-station SARIMAX models into the model registry"),
+    "ingest": ("tube_twin.ingest", "ingest CSV exports into partitioned Parquet"),
+    "benchmark": ("tube_twin.benchmark", "rolling-origin backtest of the forecast models"),
+    "startup": ("tube_twin.startup", "time to first render of every dashboard page"),
+}
+
+
+def _link(text):
+    station1, station2, line = (int(part) for part in text.split(":"))
+    return station1, station2, line
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog="python -m tube_twin", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, help) in MODULES.items():
+        commands.add_parser(name, help=help, add_help=False)
+
+    def job(name, help):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument("--out", default=None, help="output folder, under the cache directory by default")
+        return sub
+
+    simulate = job("simulate", "simulate quarter-hour passenger flows of whole days")
+    simulate.add_argument("--days", nargs="+", default=None, help="day types, all by default")
+    simulate.add_argument("--months", nargs="+", default=None, help="YYYY-MM months the demand is scaled to")
+    simulate.add_argument("--beta", type=float, default=None, help="gravity model deterrence per minute")
+    simulate.add_argument("--workers", type=int, default=None)
+
+    forecast = job("forecast", "forecast the monthly taps of every station")
+    forecast.add_argument("--horizon", type=int, default=6, help="months forecast")
+    forecast.add_argument("--model", default="holt_winters",
+                          choices=["seasonal_naive", "holt_winters", "ridge", "sarimax"])
+    forecast.add_argument("--stations", type=int, nargs="*", help="only forecast these NLC codes")
+    forecast.add_argument("--alpha", type=float, default=0.05, help="significance level of the intervals")
+    forecast.add_argument("--workers", type=int, default=None, help="stations fitted in parallel (sarimax)")
+
+    centrality = job("centrality", "centrality metrics of every station")
+    centrality.add_argument("-k", type=int, default=None, help="sampled sources of the betweenness, exact if unset")
+
+    network = job("network", "nodes and edges of the attributed station graph per month")
+    network.add_argument("--months", nargs="+", default=None, help="YYYY-MM months, all by default")
+
+    scenarios = job("scenarios", "simulate disruption scenarios")
+    scenarios.add_argument("--close", dest="removed", type=_link, nargs="+", default=(),
+                           metavar="STATION1:STATION2:LINE", help="links closed together in one scenario")
+    scenarios.add_argument("--single-link-failures", action="store_true",
+                           help="one scenario per connection of the network")
+    scenarios.add_argument("--day", default="MTT", help="day type simulated")
+    scenarios.add_argument("--workers", type=int, default=None)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in MODULES:
+        return importlib.import_module(MODULES[argv[0]][0]).main(argv[1:])
+    args = vars(parser().parse_args(argv))
+    command, out = args.pop("command"), args.pop("out")
+    if command == "scenarios" and not args["removed"] and not args["single_link_failures"]:
+        parser().error("scenarios needs --close or --single-link-failures")
+    run_job(command, out=out, **args)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,56 @@
+"""
+Shared bootstrap of the dashboard pages.
+
+Every page starts with setup_page(): it sets the page config, starts the page's timing (see tube_twin.instrument)
+and draws the faint background. The background image is read and base64-encoded once per process and data
+version instead of on every rerun of every page.
+
+    setup_page("Graph Insights", "🌍", "insights")
+"""
+import base64
+import os
+from functools import lru_cache
+
+import streamlit as st
+
+from tube_twin.instrument import start_run
+from tube_twin.paths import ROOT
+
+BACKGROUND = ROOT / "faint_bg.jpg"
+
+
+@lru_cache(maxsize=4)
+def _background_css(path, stamp):
+    with open(path, "rb") as image_file:
+        encoded_string = base64.b64encode(image_file.read()).decode()
+    return f"""
+    <style>
+    .stApp {{
+        background-image: url(data:image/jpg;base64,{encoded_string});
+        background-size: cover;
+    }}
+    </style>
+    """
+
+
+def background_css(path=BACKGROUND):
+    """
+      the CSS drawing an image as the app background, encoded once until the image file changes
+    """
+    stat = os.stat(path)
+    return _background_css(str(path), (stat.st_mtime_ns, stat.st_size))
+
+
+def setup_page(title, icon, name=None, background=BACKGROUND):
+    """
+      first call of every page: page config, page timing under name and the background image
+
+      parameters: title, icon - browser tab title and icon
+                  name - short page name its runs are timed (and profiled) under, no timing when None
+                  background - image drawn behind the page, None for none
+    """
+    st.set_page_config(page_title=title, page_icon=icon)
+    if name is not None:
+        start_run(name)
+    if background is not None:
+        st.markdown(background_css(background), unsafe_allow_html=True)
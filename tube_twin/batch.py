@@ -0,0 +1,192 @@
+"""
+Headless batch jobs over the tube_twin library.
+
+Each job runs the same code as the dashboard pages without Streamlit and writes its tables as Parquet files plus a
+manifest.json (settings, row counts, wall time) into one output folder, by default a time-stamped folder under
+<cache>/batch/<job>/. Jobs made of independent runs (days and months of the simulation, scenarios, stations of
+the accurate forecasts) fan out over a process pool, so they can be scheduled nightly on a compute node.
+
+    python -m tube_twin simulate --days MTT SAT --months 2021-01 2021-02
+    python -m tube_twin forecast --horizon 6 --model holt_winters
+    python -m tube_twin scenarios --single-link-failures --workers 8
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from tube_twin.paths import cache_path
+
+
+def output_folder(job, out=None):
+    """
+      the folder a job writes to: out when given, else <cache>/batch/<job>/<timestamp>
+    """
+    if out is None:
+        return cache_path("batch", job, datetime.now().strftime("%Y%m%d-%H%M%S"), "manifest.json").parent
+    folder = Path(out)
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+def write_outputs(job, frames, settings, seconds, out=None):
+    """
+      writes every dataframe of frames as <name>.parquet and a manifest.json describing the run, returns the folder
+
+      parameters: job - job name, recorded in the manifest
+                  frames - dict of output name -> dataframe
+                  settings - JSON serialisable parameters of the run
+                  seconds - wall time of the run
+                  out - output folder, see output_folder()
+    """
+    folder = output_folder(job, out)
+    for name, frame in frames.items():
+        frame.to_parquet(folder / f"{name}.parquet", index=False)
+    manifest = {"job": job, "created": datetime.now().isoformat(timespec="seconds"), "seconds": seconds,
+                "settings": settings, "outputs": {name: len(frame) for name, frame in frames.items()}}
+    # manifest last, it marks the folder as complete
+    with open(folder / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return folder
+
+
+def _pool_map(fn, tasks, workers):
+    if (workers or os.cpu_count() or 1) == 1 or len(tasks) < 2:
+        return [fn(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        return list(pool.map(fn, *zip(*tasks)))
+
+
+def _simulate_run(day, label, year, month, beta):
+    from tube_twin.simulation import simulate
+
+    flows = simulate(day=day, year=year, month=month, beta=beta)
+    tag = {'day': day, 'month': label}
+    lines = flows.line_loads().rename_axis('slot').reset_index().melt('slot', var_name='line', value_name='load')
+    return flows.station_frame().assign(**tag), flows.link_frame().assign(**tag), lines.assign(**tag)
+
+
+def simulate_job(days=None, months=None, beta=None, workers=None):
+    """
+      simulates every day type for every month, returns {'stations': ..., 'links': ..., 'lines': ...} long
+      dataframes tagged with 'day' and 'month' (None for the unscaled 2020 profiles)
+
+      parameters: days - day types, all of DAY_TYPES by default
+                  months - 'YYYY-MM' labels of month_options() the demand is rescaled to, none by default
+                  beta - gravity model deterrence per minute, DEFAULT_BETA by default
+                  workers - simulations run in parallel, defaults to the number of CPUs
+    """
+    from tube_twin.network import month_options
+    from tube_twin.profiles import DAY_TYPES
+    from tube_twin.simulation import DEFAULT_BETA
+
+    options = month_options() if months else {}
+    tasks = [(day, label, *(options[label] if label else (None, None)), beta or DEFAULT_BETA)
+             for day in days or DAY_TYPES for label in months or [None]]
+    results = _pool_map(_simulate_run, tasks, workers)
+    return {name: pd.concat([result[i] for result in results], ignore_index=True)
+            for i, name in enumerate(('stations', 'links', 'lines'))}
+
+
+def forecast_job(horizon, model="holt_winters", stations=None, workers=None, alpha=0.05):
+    """
+      forecasts every station over the next horizon months, returns {'forecasts': ...}
+
+      parameters: model - one of tube_twin.forecasters.FORECASTERS, or 'sarimax' for the accurate per-station
+                          models of tube_twin.forecast (registry models are reused, stations run in parallel)
+                  stations - optional NLC codes to restrict the run to
+    """
+    from tube_twin.data import load_forecasting_data
+
+    df = load_forecasting_data()
+    names = df.groupby('NLC')['Rail Station Name'].first()
+    names = {int(nlc): name for nlc, name in names.items() if not stations or int(nlc) in stations}
+    if model == "sarimax":
+        from tube_twin.forecast import forecast_all
+
+        forecasts = forecast_all(horizon, df, names, workers=workers, alpha=alpha)
+    else:
+        from tube_twin.forecasters import fast_forecast_all
+
+        forecasts = fast_forecast_all(horizon, df, names, model=model, alpha=alpha)
+    return {'forecasts': forecasts}
+
+
+def centrality_job(k=None):
+    """
+      the centrality table of the network with station names, returns {'centrality': ...}
+
+      parameters: k - sampled sources of the betweenness approximation, exact when None
+    """
+    from tube_twin.centrality import centrality_table
+    from tube_twin.data import load_stations
+
+    table = centrality_table(k=k).rename_axis('id').reset_index()
+    names = load_stations().set_index('id')['name']
+    table.insert(1, 'name', table['id'].map(names))
+    return {'centrality': table}
+
+
+def network_job(months=None):
+    """
+      the attributed nodes and the edges of the station graph of every month, returns {'nodes': ..., 'edges': ...}
+
+      parameters: months - 'YYYY-MM' labels of month_options(), all months by default
+    """
+    from tube_twin.network import get_network, month_options
+
+    options = month_options()
+    nodes, edges = [], []
+    for label in months or options:
+        G, positions = get_network(*options[label])
+        frame = pd.DataFrame.from_dict(dict(G.nodes(data=True)), orient='index').rename_axis('id').reset_index()
+        frame['degree'] = frame['id'].map(dict(G.degree()))
+        frame['longitude'] = frame['id'].map(lambda n: positions[n][0])
+        frame['latitude'] = frame['id'].map(lambda n: positions[n][1])
+        nodes.append(frame.assign(month=label))
+        columns = ['edge_color', 'lines', 'line_color']
+        edges.append(pd.DataFrame([(u, v, *(data[c] for c in columns)) for u, v, data in G.edges(data=True)],
+                                  columns=['station1', 'station2', *columns]).assign(month=label))
+    return {'nodes': pd.concat(nodes, ignore_index=True), 'edges': pd.concat(edges, ignore_index=True)}
+
+
+def scenarios_job(removed=(), single_link_failures=False, day='MTT', workers=None):
+    """
+      runs disruption scenarios, returns {'summaries': ...} with one row per scenario
+
+      parameters: removed - (station1, station2, line) links closed together in one scenario
+                  single_link_failures - also run one scenario per connection of the network
+                  day - day type simulated
+                  workers - scenarios run in parallel, defaults to the number of CPUs
+    """
+    from tube_twin import scenarios
+
+    specs = []
+    if removed:
+        specs.append(scenarios.scenario(removed=removed))
+    if single_link_failures:
+        specs.extend(scenarios.single_link_failures())
+    if not specs:
+        raise ValueError("no scenario given, pass closed links or single_link_failures=True")
+    return {'summaries': scenarios.run_scenarios(specs, day=day, workers=workers)}
+
+
+def run_job(job, out=None, log=print, **settings):
+    """
+      runs one of JOBS with settings and writes its outputs, returns the output folder
+    """
+    started = time.perf_counter()
+    frames = JOBS[job](**settings)
+    seconds = time.perf_counter() - started
+    folder = write_outputs(job, frames, settings, seconds, out)
+    log(f"{job}: {', '.join(f'{name} {len(frame)} rows' for name, frame in frames.items())} "
+        f"in {seconds:.1f}s, written to {folder}")
+    return folder
+
+
+JOBS = {"simulate": simulate_job, "forecast": forecast_job, "centrality": centrality_job,
+        "network": network_job, "scenarios": scenarios_job}
@@ -0,0 +1,211 @@
+"""
+Rolling-origin backtests of the station forecasts.
+
+Every station of Forecasting_Data/data/data.parquet is backtested under each model configuration (seasonal
+period, size of the order grid, optimizer iterations): the series is cut at several origins, the order search
+runs on the months before the cut and the following months are forecast and compared with what was observed.
+Fit and predict wall time, peak Python memory of the fit and MAPE/RMSE are recorded per station, configuration
+and origin, and written as a CSV of all runs plus a JSON summary per configuration. Tracing allocations slows a
+fit down several times, so the timed fit runs untraced and the peak memory (tracemalloc) comes from a second,
+traced fit of the same data; workers import statsmodels before their first timed fit.
+
+    python -m tube_twin.benchmark --seasonal 4 12 --max-order 2 3 --folds 3 --horizon 3
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from tube_twin.data import load_forecasting_data
+from tube_twin.forecast import MAXITER, SEASONAL_PERIOD, _smoothed, search_order
+from tube_twin.paths import cache_path
+from tube_twin.train import station_series
+
+FOLDS = 3
+HORIZON = 3
+
+
+def configurations(seasonal=(SEASONAL_PERIOD,), max_orders=(4,), maxiters=(MAXITER,)):
+    """
+      every combination of seasonal period, grid size and optimizer iterations, as dicts with a 'config' label
+    """
+    return [{"config": f"s={s},order<{m},maxiter={i}", "s": s, "max_order": m, "maxiter": i}
+            for s, m, i in product(seasonal, max_orders, maxiters)]
+
+
+def origins(n, folds=FOLDS, horizon=HORIZON):
+    """
+      cut points of a rolling-origin backtest over a series of length n, oldest first; every cut leaves horizon
+      months to forecast
+    """
+    return [n - horizon * k for k in range(folds, 0, -1) if n - horizon * k > 0]
+
+
+def errors(actual, predicted):
+    """
+      MAPE (in %, over non-zero actuals) and RMSE of a forecast
+    """
+    actual = np.asarray(actual, dtype='float64')
+    predicted = np.asarray(predicted, dtype='float64')
+    nonzero = actual != 0
+    mape = float(np.mean(np.abs((actual[nonzero] - predicted[nonzero]) / actual[nonzero])) * 100) \
+        if nonzero.any() else float('nan')
+    rmse = float(np.sqrt(np.mean((actual - predicted) ** 2)))
+    return mape, rmse
+
+
+def _warm_up():
+    # loads statsmodels in a worker so its import is not timed as part of the first fit
+    from statsmodels.tsa.statespace.sarimax import SARIMAX  # noqa: F401
+
+
+def _peak_mib(train, config):
+    # peak traced memory of a fit, traced separately since tracemalloc inflates the fit time
+    tracemalloc.start()
+    try:
+        search_order(train, workers=1, max_order=config["max_order"], s=config["s"], maxiter=config["maxiter"])
+    except ValueError:
+        pass
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def backtest_station(nlc, series, config, folds=FOLDS, horizon=HORIZON, memory=True):
+    """
+      backtests one station under one configuration, returns one record per origin
+
+      records hold the fit and predict seconds, the fit's peak traced memory in MiB (from a second, traced fit,
+      NaN without memory), MAPE, RMSE and the chosen order, or an 'error' when no order converged
+    """
+    _warm_up()
+    values = np.asarray(series, dtype='float64')
+    records = []
+    for cut in origins(len(values), folds, horizon):
+        record = {"NLC": int(nlc), **config, "origin": str(series.index[cut - 1])[:7], "train_months": cut}
+        train, test = values[:cut], values[cut:cut + horizon]
+        started = time.perf_counter()
+        try:
+            order, aic, params = search_order(train, workers=1, max_order=config["max_order"], s=config["s"],
+                                              maxiter=config["maxiter"])
+        except ValueError as e:
+            record.update(fit_seconds=time.perf_counter() - started, error=str(e))
+            records.append(record)
+            continue
+        record.update(fit_seconds=time.perf_counter() - started,
+                      peak_mib=_peak_mib(train, config) if memory else float('nan'))
+
+        started = time.perf_counter()
+        predicted = _smoothed(train, order, config["s"], params).forecast(len(test))
+        record["predict_seconds"] = time.perf_counter() - started
+        mape, rmse = errors(test, predicted)
+        record.update(order=str(tuple(order)), aic=float(aic), mape=mape, rmse=rmse, error=None)
+        records.append(record)
+    return records
+
+
+def summarize(runs):
+    """
+      one row per configuration: stations and failures, median and 95th percentile fit time, median predict time,
+      median peak memory and mean/median MAPE and RMSE
+    """
+    ok = runs[runs['error'].isna()]
+    summary = runs.groupby('config', sort=False).agg(runs=('NLC', 'size'), stations=('NLC', 'nunique'),
+                                                     failures=('error', lambda e: int(e.notna().sum())))
+    summary = summary.join(ok.groupby('config', sort=False).agg(
+        fit_seconds_median=('fit_seconds', 'median'),
+        fit_seconds_p95=('fit_seconds', lambda t: t.quantile(0.95)),
+        fit_seconds_total=('fit_seconds', 'sum'),
+        predict_seconds_median=('predict_seconds', 'median'),
+        peak_mib_median=('peak_mib', 'median'),
+        mape_mean=('mape', 'mean'),
+        mape_median=('mape', 'median'),
+        rmse_mean=('rmse', 'mean'),
+        rmse_median=('rmse', 'median')))
+    return summary.reset_index()
+
+
+def run_benchmark(configs, df=None, stations=None, folds=FOLDS, horizon=HORIZON, workers=None, memory=True,
+                  log=print):
+    """
+      backtests every station under every configuration across a process pool
+
+      parameters: configs - configurations as returned by configurations()
+                  df - forecasting data, read from data.parquet when omitted
+                  stations - optional NLC codes to restrict the run to
+                  folds, horizon - number of origins and months forecast from each
+                  workers - (station, configuration) pairs run in parallel, defaults to the number of CPUs
+                  memory - also measure the peak memory of every fit, with a second traced fit
+
+      returns (runs, summary): a dataframe with one row per station, configuration and origin, and summarize(runs)
+    """
+    df = load_forecasting_data() if df is None else df
+    series = {nlc: s for nlc, s in station_series(df) if not stations or nlc in stations}
+    tasks = [(nlc, config) for config in configs for nlc in series]
+    log(f"backtesting {len(series)} stations x {len(configs)} configurations, {folds} origins of {horizon} months")
+
+    records = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_warm_up) as pool:
+        futures = {pool.submit(backtest_station, nlc, series[nlc], config, folds, horizon, memory): (nlc, config)
+                   for nlc, config in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            records.extend(future.result())
+            if done % 50 == 0 or done == len(tasks):
+                log(f"[{done}/{len(tasks)}] {time.perf_counter() - started:.1f}s")
+    runs = pd.DataFrame(records).sort_values(['config', 'NLC', 'origin'], ignore_index=True)
+    return runs, summarize(runs)
+
+
+def write_report(runs, summary, folder, **settings):
+    """
+      writes runs.csv, summary.csv and report.json (settings plus the summary records) to folder
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    runs.to_csv(folder / "runs.csv", index=False)
+    summary.to_csv(folder / "summary.csv", index=False)
+    with open(folder / "report.json", "w") as f:
+        json.dump({"created": datetime.now().isoformat(timespec="seconds"), **settings,
+                   "summary": json.loads(summary.to_json(orient="records"))}, f, indent=2)
+    return folder
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the station forecast models.")
+    parser.add_argument("--seasonal", type=int, nargs="+", default=[SEASONAL_PERIOD], help="seasonal periods")
+    parser.add_argument("--max-order", type=int, nargs="+", default=[4], help="grid sizes, orders below this")
+    parser.add_argument("--maxiter", type=int, nargs="+", default=[MAXITER], help="optimizer iterations per fit")
+    parser.add_argument("--folds", type=int, default=FOLDS, help="forecast origins per station")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="months forecast from each origin")
+    parser.add_argument("--stations", type=int, nargs="*", help="only backtest these NLC codes")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced fits measuring peak memory")
+    parser.add_argument("--out", default=None, help="report folder, under the cache directory by default")
+    args = parser.parse_args(argv)
+
+    configs = configurations(args.seasonal, args.max_order, args.maxiter)
+    runs, summary = run_benchmark(configs, stations=args.stations, folds=args.folds, horizon=args.horizon,
+                                  workers=args.workers, memory=not args.no_memory)
+    if args.out is None:
+        folder = cache_path("benchmark", datetime.now().strftime("%Y%m%d-%H%M%S"), "report.json").parent
+    else:
+        folder = Path(args.out)
+    write_report(runs, summary, folder, folds=args.folds, horizon=args.horizon, configs=configs,
+                 stations=args.stations, memory=not args.no_memory)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summary.round(3).to_string(index=False))
+    print(f"report written to {folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,276 @@
+"""
+Precomputed centrality metrics of the tube network.
+
+Degree, betweenness and closeness (both weighted by the journey time of each connection) and eigenvector
+centrality are computed once per version of the connections data and persisted under the cache directory.
+
+Betweenness keeps, for every source station, the dependency row of Brandes' algorithm together with the
+all-pairs journey time matrix. When a few edges change (a closed or slowed link in a scenario) only the sources
+whose shortest paths can be affected by those edges are recomputed, every other row is reused. For large graphs
+betweenness can be estimated from k randomly chosen pivot sources instead of all of them.
+"""
+import hashlib
+from heapq import heappop, heappush
+from itertools import count
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from tube_twin.data import load_connections, load_stations
+from tube_twin.instrument import cache_event, timed
+from tube_twin.paths import cache_path
+
+METRICS = ['degree', 'betweenness', 'closeness', 'eigenvector']
+
+
+def weighted_graph(conns_df, nodes=None):
+    """
+      undirected station graph with a 'time' weight on every edge, the fastest line wins where several lines
+      connect the same two stations
+
+      parameters: conns_df - dataframe of connections with 'station1', 'station2' and 'time'
+                  nodes - optional station ids to include even when they have no connection
+    """
+    G = nx.Graph()
+    if nodes is not None:
+        G.add_nodes_from(int(n) for n in nodes)
+    fastest = conns_df.groupby(['station1', 'station2'])['time'].min()
+    for (u, v), time in fastest.items():
+        u, v, time = int(u), int(v), float(time)
+        if not G.has_edge(u, v) or G[u][v]['time'] > time:
+            G.add_edge(u, v, time=time)
+    return G
+
+
+def _brandes_source(adj, s):
+    # single-source shortest paths with path counting and dependency accumulation (Brandes 2001)
+    n = len(adj)
+    dist = np.full(n, np.inf)
+    sigma = np.zeros(n)
+    preds = [[] for _ in range(n)]
+    order = []
+    seen = {s: 0.0}
+    sigma[s] = 1.0
+    tie = count()
+    heap = [(0.0, next(tie), s, s)]
+    while heap:
+        d, _, pred, v = heappop(heap)
+        if np.isfinite(dist[v]):
+            continue
+        if v != s:
+            sigma[v] += sigma[pred]
+        order.append(v)
+        dist[v] = d
+        for w, weight in adj[v]:
+            vw = d + weight
+            if np.isinf(dist[w]) and (w not in seen or vw < seen[w]):
+                seen[w] = vw
+                heappush(heap, (vw, next(tie), v, w))
+                sigma[w] = 0.0
+                preds[w] = [v]
+            elif vw == seen.get(w):
+                sigma[w] += sigma[v]
+                preds[w].append(v)
+    delta = np.zeros(n)
+    for w in reversed(order):
+        for v in preds[w]:
+            delta[v] += sigma[v] / sigma[w] * (1.0 + delta[w])
+    delta[s] = 0.0
+    return delta
+
+
+class CentralityStore:
+    """
+      centrality metrics of one graph plus the per-source state needed to update them incrementally
+
+      parameters: G - undirected graph with a journey time attribute on every edge
+                  weight - name of that edge attribute
+                  k - number of pivot sources for sampled betweenness, None uses every station
+                  seed - random seed used to pick the pivots
+    """
+
+    def __init__(self, G, weight='time', k=None, seed=None):
+        self.weight = weight
+        self.nodes = np.array(sorted(G.nodes()))
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.edges = {self._key(u, v): float(d[weight]) for u, v, d in G.edges(data=True)}
+        n = len(self.nodes)
+        if k is None or k >= n:
+            self.sources = np.arange(n)
+        else:
+            self.sources = np.sort(np.random.default_rng(seed).choice(n, size=k, replace=False))
+        self.dist = dijkstra(self._matrix(), directed=False)
+        adj = self._adjacency()
+        self.dependency = np.zeros((n, n))
+        for s in self.sources:
+            self.dependency[s] = _brandes_source(adj, s)
+        self._refresh()
+
+    @staticmethod
+    def _key(u, v):
+        return (u, v) if u <= v else (v, u)
+
+    def _matrix(self):
+        n = len(self.nodes)
+        if not self.edges:
+            return csr_matrix((n, n))
+        rows, cols = zip(*((self.index[u], self.index[v]) for u, v in self.edges))
+        return csr_matrix((list(self.edges.values()), (rows, cols)), shape=(n, n))
+
+    def _adjacency(self):
+        adj = [[] for _ in self.nodes]
+        for (u, v), weight in self.edges.items():
+            adj[self.index[u]].append((self.index[v], weight))
+            adj[self.index[v]].append((self.index[u], weight))
+        return adj
+
+    def graph(self):
+        """
+          the graph the metrics currently describe
+        """
+        G = nx.Graph()
+        G.add_nodes_from(self.nodes.tolist())
+        G.add_weighted_edges_from(((u, v, w) for (u, v), w in self.edges.items()), weight=self.weight)
+        return G
+
+    def _refresh(self):
+        # derives the per-station metrics from the stored rows, matching networkx's normalisation
+        n = len(self.nodes)
+        G = self.graph()
+        scale = 1.0 / ((n - 1) * (n - 2)) if n > 2 else 1.0
+        betweenness = self.dependency[self.sources].sum(axis=0) * scale * n / len(self.sources)
+
+        finite = np.isfinite(self.dist)
+        reachable = finite.sum(axis=1)
+        total = np.where(finite, self.dist, 0.0).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            closeness = np.where(total > 0, (reachable - 1) / total * (reachable - 1) / max(n - 1, 1), 0.0)
+
+        eigenvector = nx.eigenvector_centrality(G, max_iter=1000)
+        self.metrics = pd.DataFrame({
+            'degree': [G.degree(node) for node in self.nodes],
+            'betweenness': betweenness,
+            'closeness': closeness,
+            'eigenvector': [eigenvector[node] for node in self.nodes],
+        }, index=pd.Index(self.nodes, name='id'))
+
+    def _affected_sources(self, changes):
+        # sources whose shortest path tree can contain a changed edge, judged on the current distances
+        affected = np.zeros(len(self.nodes), dtype=bool)
+        for (u, v), (old, new) in changes.items():
+            du, dv = self.dist[:, self.index[u]], self.dist[:, self.index[v]]
+            reaches = np.isfinite(du) | np.isfinite(dv)
+            if new > old:
+                # slower or removed: only trees that used the edge change
+                affected |= reaches & (np.isclose(du + old, dv) | np.isclose(dv + old, du))
+            else:
+                # faster or new: trees that can reach one end quicker (or equally fast) through it change
+                affected |= reaches & ((du + new <= dv + 1e-9) | (dv + new <= du + 1e-9))
+        return np.flatnonzero(affected)
+
+    def update_edges(self, removed=(), changed=None):
+        """
+          applies edge changes and recomputes only the sources they can affect, returns the recomputed sources
+
+          parameters: removed - (station1, station2) pairs taken out of the network
+                      changed - dict of (station1, station2) -> new journey time, for slowed, faster or new links
+        """
+        changes = {}
+        for u, v in removed:
+            key = self._key(u, v)
+            if key in self.edges:
+                changes[key] = (self.edges.pop(key), np.inf)
+        for (u, v), weight in (changed or {}).items():
+            key = self._key(u, v)
+            old = self.edges.get(key, np.inf)
+            if old != weight:
+                changes[key] = (old, float(weight))
+                self.edges[key] = float(weight)
+        if not changes:
+            return np.array([], dtype=int)
+
+        affected = self._affected_sources(changes)
+        if len(affected):
+            rows = dijkstra(self._matrix(), directed=False, indices=affected)
+            self.dist[affected] = rows
+            self.dist[:, affected] = rows.T
+            adj = self._adjacency()
+            for s in np.intersect1d(affected, self.sources):
+                self.dependency[s] = _brandes_source(adj, s)
+        self._refresh()
+        return self.nodes[affected]
+
+    def copy(self):
+        """
+          independent copy, e.g. to apply scenario edge changes without touching a shared store
+        """
+        store = CentralityStore.__new__(CentralityStore)
+        store.__dict__.update(self.__dict__)
+        store.edges, store.index = dict(self.edges), dict(self.index)
+        store.dist, store.dependency = self.dist.copy(), self.dependency.copy()
+        store.metrics = self.metrics.copy()
+        return store
+
+    def save(self, path):
+        np.savez_compressed(path, nodes=self.nodes, sources=self.sources, dist=self.dist,
+                            dependency=self.dependency, weight=self.weight,
+                            edges=np.array([[u, v, w] for (u, v), w in self.edges.items()]).reshape(-1, 3))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            store = cls.__new__(cls)
+            store.weight = str(f['weight'])
+            store.nodes = f['nodes']
+            store.index = {node: i for i, node in enumerate(store.nodes)}
+            store.edges = {(int(u), int(v)): float(w) for u, v, w in f['edges']}
+            store.sources, store.dist, store.dependency = f['sources'], f['dist'], f['dependency']
+        store._refresh()
+        return store
+
+
+def _graph_key(G, k, seed):
+    h = hashlib.sha1(repr((k, seed)).encode())
+    h.update(repr(sorted(G.nodes())).encode())
+    h.update(repr(sorted((min(u, v), max(u, v), d['time']) for u, v, d in G.edges(data=True))).encode())
+    return h.hexdigest()[:16]
+
+
+_stores = {}
+
+
+def get_store(conns_df=None, stations_df=None, k=None, seed=0):
+    """
+      the centrality store of the network, loaded from disk when this network was computed before
+
+      the store is shared within the process, use .copy() before calling update_edges on it
+
+      parameters: conns_df, stations_df - network to describe, the bundled datasets when omitted
+                  k - number of pivot sources for sampled betweenness, None for exact betweenness
+                  seed - random seed used to pick the pivots
+    """
+    conns_df = load_connections() if conns_df is None else conns_df
+    stations_df = load_stations() if stations_df is None else stations_df
+    G = weighted_graph(conns_df, nodes=stations_df['id'])
+    key = _graph_key(G, k, seed)
+    cache_event("centrality.memory", key in _stores)
+    if key not in _stores:
+        path = cache_path("centrality", f"{key}.npz")
+        cache_event("centrality.disk", path.exists())
+        if path.exists():
+            _stores[key] = CentralityStore.load(path)
+        else:
+            with timed("centrality.compute"):
+                _stores[key] = CentralityStore(G, k=k, seed=seed)
+            _stores[key].save(path)
+    return _stores[key]
+
+
+def centrality_table(conns_df=None, stations_df=None, k=None):
+    """
+      dataframe of degree, betweenness, closeness and eigenvector centrality indexed by station id
+    """
+    return get_store(conns_df, stations_df, k=k).metrics[METRICS].copy()
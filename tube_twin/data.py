@@ -0,0 +1,187 @@
+"""
+Shared loading of the dashboard datasets.
+
+Each dataset is parsed from CSV once, with compact dtypes, and written to a Parquet copy under the cache
+directory. Later loads read the Parquet copy, and within a process the parsed frame is kept in memory and shared
+by every session and page. A copy is rebuilt only when its source file changes: the mtime and size are checked on
+every load, and the file hash decides whether a touched file really has new content.
+
+Frames returned here are shared, treat them as read-only and .copy() before modifying.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from tube_twin.instrument import cache_event, timed
+from tube_twin.paths import FORECASTING_DATA, GRAPH_DATA, cache_path
+
+STATIONS_DTYPES = {'id': 'int32', 'latitude': 'float64', 'longitude': 'float64', 'NLC': 'Int32',
+                   'name': 'category', 'display_name': 'string', 'zone': 'float32',
+                   'total_lines': 'Int8', 'rail': 'Int8'}
+CONNECTIONS_DTYPES = {'station1': 'int32', 'station2': 'int32', 'line': 'int16', 'time': 'int16'}
+LINES_DTYPES = {'line': 'int16', 'name': 'category', 'colour': 'string', 'stripe': 'string'}
+CROWDING_DTYPES = {'Month-Year': 'string', 'Rail Station Name': 'category', 'NLC': 'int32',
+                   'Month Name (Travel Date)': 'category', 'Calendar Year (Travel Date)': 'int16',
+                   'Count of Taps': 'int64'}
+STATION_CODES_DTYPES = {'NLC': 'int32', 'Station': 'string'}
+ENTRY_EXIT_DTYPES = {'Rail Station Name': 'category', 'Travel Location No': 'int32',
+                     'Month Name (Travel Date)': 'category', 'Calendar Year (Travel Date)': 'int16',
+                     'Transaction Type': 'category', 'Count of Taps': 'int64'}
+QUARTER_HOUR_DTYPES = {'Mode': 'category', 'NLC': 'int32', 'ASC': 'string', 'Station': 'category',
+                       'Coverage': 'category', 'year': 'int16', 'day': 'category', 'dir': 'category'}
+
+_lock = threading.Lock()
+_frames = {}
+
+
+def files_stamp(*paths):
+    """
+      short key that changes whenever one of the files is modified (mtime or size), for caches derived from them
+    """
+    parts = []
+    for path in paths:
+        stat = os.stat(path)
+        parts.append(f"{path}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _columnar_copy(source, parse):
+    # returns the parsed frame from its Parquet copy, re-parsing the source when its content changed
+    stat = os.stat(source)
+    stamp = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    parquet = cache_path("data", f"{source.stem}.parquet")
+    meta_path = parquet.with_suffix(".meta.json")
+    meta = {}
+    if meta_path.exists() and parquet.exists():
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if meta and all(meta.get(k) == v for k, v in stamp.items()):
+        cache_event("data.parquet", True)
+        with timed("data.read_parquet"):
+            return pd.read_parquet(parquet)
+    digest = _file_hash(source)
+    cache_event("data.parquet", meta.get("sha256") == digest)
+    if meta.get("sha256") == digest:
+        # touched but unchanged, only refresh the recorded mtime
+        frame = pd.read_parquet(parquet)
+    else:
+        with timed("data.parse_csv"):
+            frame = parse(source)
+        frame.to_parquet(parquet, index=False)
+    with open(meta_path, "w") as f:
+        json.dump({**stamp, "sha256": digest}, f)
+    return frame
+
+
+def _load(source, parse):
+    # process-wide cache keyed by source path, invalidated when the file's mtime or size changes
+    stat = os.stat(source)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _frames.get(source)
+        cache_event("data.frames", cached is not None and cached[0] == stamp)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        frame = _columnar_copy(source, parse)
+        _frames[source] = (stamp, frame)
+        return frame
+
+
+def load_stations(path=GRAPH_DATA / "london.stations.csv"):
+    """
+      London Underground stations with coordinates, NLC code, zone and number of lines
+    """
+    return _load(path, lambda p: pd.read_csv(p, dtype=STATIONS_DTYPES))
+
+
+def load_connections(path=GRAPH_DATA / "london.connections.csv"):
+    """
+      links between adjacent stations with their line and travel time in minutes
+    """
+    return _load(path, lambda p: pd.read_csv(p, dtype=CONNECTIONS_DTYPES))
+
+
+def load_lines(path=GRAPH_DATA / "london.lines.csv"):
+    """
+      line names and colours, keyed by the line ids used in the connections
+    """
+    return _load(path, lambda p: pd.read_csv(p, dtype=LINES_DTYPES))
+
+
+def connection_labels():
+    """
+      readable label of every connection, as a dict of 'Station - Station (Line)' -> (station1, station2, line)
+    """
+    names = dict(zip(load_stations()['id'], load_stations()['name']))
+    line_names = dict(zip(load_lines()['line'], load_lines()['name']))
+    return {f"{names[u]} - {names[v]} ({line_names.get(line, line)})": (u, v, line)
+            for u, v, line in load_connections()[['station1', 'station2', 'line']].itertuples(index=False)}
+
+
+def load_crowding(path=GRAPH_DATA / "station_counts_grouped_per_station.csv"):
+    """
+      monthly count of taps per station NLC
+    """
+    return _load(path, lambda p: pd.read_csv(p, dtype=CROWDING_DTYPES))
+
+
+def load_station_codes(path=GRAPH_DATA / "station_nlc_codes.csv"):
+    """
+      station names and their NLC codes, as offered in the forecasting page
+    """
+    return _load(path, lambda p: pd.read_csv(p, usecols=['NLC', 'Station'], dtype=STATION_CODES_DTYPES))
+
+
+def load_entry_exit(path=GRAPH_DATA / "Entry_and_Exit data.csv"):
+    """
+      monthly entry and exit taps per station ('Travel Location No' is the NLC)
+    """
+    return _load(path, lambda p: pd.read_csv(p, dtype=ENTRY_EXIT_DTYPES))
+
+
+def _read_quarter_hours(path):
+    # the header has blanks after the commas (' day', ' dir'), the 96 slot columns are counts
+    df = pd.read_csv(path, skipinitialspace=True, dtype=QUARTER_HOUR_DTYPES)
+    slots = [c for c in df.columns if c not in QUARTER_HOUR_DTYPES]
+    return df.astype({c: 'int32' for c in slots})
+
+
+def load_quarter_hours(path=GRAPH_DATA / "2020.csv"):
+    """
+      quarter-hour entry (dir IN) and exit (dir OUT) counts per station and day type, one column per slot
+      from '0500-0515' to '0445-0500'
+    """
+    return _load(path, _read_quarter_hours)
+
+
+def _read_forecasting_data(path):
+    df = pd.read_parquet(path).astype({'NLC': 'int32', 'Calendar Year (Travel Date)': 'int16'})
+    df['timestamp'] = [datetime.strptime(i, '%Y-%m') for i in df.reset_index()['Month-Year']]
+    return df.set_index('timestamp')
+
+
+def load_forecasting_data(path=FORECASTING_DATA / "data.parquet"):
+    """
+      monthly entry data used for modelling, indexed by a timestamp built from 'Month-Year'
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _frames.get(path)
+        if cached is None or cached[0] != stamp:
+            # already columnar, only the parsed frame is kept in memory
+            cached = _frames[path] = (stamp, _read_forecasting_data(path))
+        return cached[1]
@@ -0,0 +1,246 @@
+"""
+SARIMAX order search and per-station models for the crowding forecast page.
+
+The (p,q)x(P,Q) grid is fitted across a process pool, fits that fail to converge within a bounded number of
+optimizer iterations are dropped, and the winning order together with its fitted parameters is stored in the
+model registry (see tube_twin.registry) so a prediction only has to re-apply the stored parameters.
+Models are normally pre-trained offline with `python -m tube_twin.train`.
+
+statsmodels is imported on the first fit, so pages importing this module do not pay for it until they forecast.
+"""
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from tube_twin import registry
+from tube_twin.data import load_forecasting_data
+from tube_twin.instrument import cache_event, timed
+
+# differencing and seasonal period used by the forecasting page
+D_ORDER = 1
+SEASONAL_D_ORDER = 1
+SEASONAL_PERIOD = 4
+# optimizer iterations allowed per candidate before it is treated as non-converging
+MAXITER = 50
+# size of the (p, q, P, Q) grid of the canonical models, smaller grids only serve the callers that asked for them
+MAX_ORDER = 4
+
+
+def parameter_grid(max_order=MAX_ORDER):
+    """
+      all (p, q, P, Q) combinations searched for a station, 0 <= order < max_order
+    """
+    orders = range(0, max_order, 1)
+    return list(product(orders, orders, orders, orders))
+
+
+def _fit_order(task):
+    # fits one candidate order, returns None when the fit raises or stops before converging
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    param, d, D, s, endog, maxiter = task
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = SARIMAX(endog,
+                            order=(param[0], d, param[1]),
+                            seasonal_order=(param[2], D, param[3], s)).fit(disp=False, maxiter=maxiter)
+    except Exception:
+        return None
+    if not model.mle_retvals.get('converged', True) or not np.isfinite(model.aic):
+        return None
+    return param, model.aic, model.params.tolist()
+
+
+def sarimax(parameters_list, d, D, s, exog, workers=None, maxiter=MAXITER):
+    """
+      fits every candidate order in a process pool and ranks the converged fits by AIC
+
+      parameters: parameters_list - (p, q, P, Q) tuples to try
+                  d, D, s - differencing, seasonal differencing and seasonal period
+                  exog - series to model
+                  workers - pool size, defaults to the number of CPUs; 1 fits in-process
+                  maxiter - optimizer iterations after which a fit is abandoned as non-converging
+
+      returns a dataframe with '(p,q)x(P,Q)', 'AIC' and 'params' columns, lowest AIC first
+    """
+    endog = np.asarray(exog, dtype='float64')
+    tasks = [(tuple(param), d, D, s, endog, maxiter) for param in parameters_list]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        fits = map(_fit_order, tasks)
+        results = [r for r in fits if r is not None]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            results = [r for r in pool.map(_fit_order, tasks, chunksize=chunksize) if r is not None]
+
+    if not results:
+        raise ValueError("no SARIMAX order converged for this series")
+    result_df = pd.DataFrame(results, columns=['(p,q)x(P,Q)', 'AIC', 'params'])
+    # Sort in ascending order, lower AIC is better
+    return result_df.sort_values(by='AIC', ascending=True).reset_index(drop=True)
+
+
+def _smoothed(series, order, s, params):
+    # applies stored parameters to a series, no optimisation involved
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    p, q, P, Q = order
+    model = SARIMAX(np.asarray(series, dtype='float64'),
+                    order=(p, D_ORDER, q), seasonal_order=(P, SEASONAL_D_ORDER, Q, s))
+    return model.smooth(np.asarray(params))
+
+
+def load_model(nlc, series):
+    """
+      rebuilds a station's model from its registry entry without refitting,
+      returns None when the station has no entry or the entry was trained on different data
+    """
+    entry = registry.lookup(nlc, series, max_order=MAX_ORDER)
+    if entry is None:
+        return None
+    return _smoothed(series, entry["order"], entry["s"], entry["params"])
+
+
+@timed("forecast.search_order")
+def search_order(series, workers=None, max_order=MAX_ORDER, s=SEASONAL_PERIOD, maxiter=MAXITER):
+    """
+      runs the order search for a series, returns the winning (p, q, P, Q), its AIC and fitted parameters
+
+      parameters: max_order - size of the (p, q, P, Q) grid searched, see parameter_grid
+                  s - seasonal period
+                  maxiter - optimizer iterations allowed per candidate
+    """
+    result_df = sarimax(parameter_grid(max_order), D_ORDER, SEASONAL_D_ORDER, s, series,
+                        workers=workers, maxiter=maxiter)
+    param, aic, params = result_df.loc[0, ['(p,q)x(P,Q)', 'AIC', 'params']]
+    return param, aic, params
+
+
+def train_model(nlc, series, workers=None):
+    """
+      runs the order search for a station and registers the winning model, returns the registry entry
+    """
+    param, aic, params = search_order(series, workers=workers)
+    return registry.register(nlc, series, param, aic, params, SEASONAL_PERIOD, max_order=MAX_ORDER)
+
+
+def best_model(nlc, series, workers=None):
+    """
+      returns the fitted model for a station from the registry, fitting online only when its entry is missing or stale
+    """
+    model = load_model(nlc, series)
+    cache_event("forecast.registry", model is not None)
+    if model is None:
+        train_model(nlc, series, workers=workers)
+        model = load_model(nlc, series)
+    return model
+
+
+def months_ahead(date, last):
+    """
+      number of months between the last observed month and the month of date (1 = the next month)
+    """
+    return (date.year - last.year) * 12 + (date.month - last.month)
+
+
+@timed("forecast.forecasting")
+def forecasting(date, series, nlc, workers=None):
+    """
+      forecasts a station's monthly taps for one date, or for every month of a (from, to) pair of dates
+
+      parameters: date - list holding one or two dates
+                  series - the station's observed 'Count of Taps' series, indexed by month
+                  nlc - station NLC code the fitted model is cached under
+    """
+    model = best_model(nlc, series, workers=workers)
+    last = len(series) - 1
+    start = last + months_ahead(date[0], series.index[-1])
+    end = last + months_ahead(date[-1], series.index[-1])
+    if start < 0 or end < start:
+        raise ValueError("forecast dates must not be before the first observed month")
+    return model.predict(start=start, end=end).tolist()
+
+
+def _station_forecast(nlc, series, horizon, alpha, max_order):
+    # forecast for one station from its registry entry, searching an order first when it has none won on a grid
+    # at least max_order wide; None when no order converges for the station
+    entry = registry.lookup(nlc, series, max_order=max_order)
+    if entry is None:
+        try:
+            param, aic, params = search_order(series, workers=1, max_order=max_order)
+        except ValueError:
+            return None
+        model = _smoothed(series, param, SEASONAL_PERIOD, params)
+        trained = (param, aic, params)
+    else:
+        model = _smoothed(series, entry["order"], entry["s"], entry["params"])
+        trained = None
+    prediction = model.get_forecast(horizon)
+    interval = np.asarray(prediction.conf_int(alpha=alpha))
+    return np.asarray(prediction.predicted_mean), interval[:, 0], interval[:, 1], trained
+
+
+def forecast_all(horizon, df=None, stations=None, workers=None, alpha=0.05, max_order=MAX_ORDER, progress=None):
+    """
+      forecasts every station over the next horizon months, fitting stations in parallel
+
+      parameters: horizon - number of months after each station's last observation
+                  df - forecasting data, read from data.parquet when omitted
+                  stations - dict of NLC -> station name to forecast, defaults to every NLC in df
+                  workers - number of stations processed in parallel, defaults to the number of CPUs
+                  alpha - significance level of the confidence interval
+                  max_order - grid size searched for stations missing from the model registry, entries won on a
+                              smaller grid are searched again and models of a smaller grid are registered as such
+                  progress - optional callable(done, total, stations_per_second) invoked as stations finish
+
+      returns a tidy dataframe with one row per station and month:
+      'NLC', 'Station', 'Month', 'forecast', 'lower', 'upper' (stations where no order converges are left out)
+    """
+    df = load_forecasting_data() if df is None else df
+    if stations is None:
+        stations = df.groupby('NLC')['Rail Station Name'].first().to_dict()
+    series_by_nlc = {int(nlc): group['Count of Taps'] for nlc, group in df.groupby('NLC')
+                     if int(nlc) in stations}
+
+    frames = []
+    finished = []
+    started = time.perf_counter()
+
+    def collect(nlc, result):
+        finished.append(nlc)
+        if result is not None:
+            mean, lower, upper, trained = result
+            series = series_by_nlc[nlc]
+            if trained is not None:
+                # register from the calling process only, the index has a single writer; the grid is recorded so a
+                # reduced search never passes for a canonical model
+                registry.register(nlc, series, *trained, SEASONAL_PERIOD, max_order=max_order)
+            months = pd.date_range(series.index[-1], periods=horizon + 1, freq='MS')[1:]
+            frames.append(pd.DataFrame({'NLC': nlc, 'Station': stations[nlc], 'Month': months,
+                                        'forecast': mean, 'lower': lower, 'upper': upper}))
+        if progress is not None:
+            done = len(finished)
+            progress(done, len(series_by_nlc), done / max(time.perf_counter() - started, 1e-9))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for nlc, series in series_by_nlc.items():
+            collect(nlc, _station_forecast(nlc, series, horizon, alpha, max_order))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_station_forecast, nlc, series, horizon, alpha, max_order): nlc
+                       for nlc, series in series_by_nlc.items()}
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+
+    if not frames:
+        return pd.DataFrame(columns=['NLC', 'Station', 'Month', 'forecast', 'lower', 'upper'])
+    return pd.concat(frames, ignore_index=True).sort_values(['NLC', 'Month'], ignore_index=True)
@@ -0,0 +1,154 @@
+"""
+Lean Bokeh rendering of the station graph, shared by the graph views of the pages.
+
+Instead of from_networkx, which serializes every node and edge attribute of the graph into each plot, the graph
+is turned once into a node ColumnDataSource holding only the columns a view asks for, an edge source with the
+start and end of every edge, and a layout provider with the node coordinates. Numbers go out as compact binary
+arrays: ids as int32, coordinates rounded to 5 decimals (about a metre), attributes as float32 and metrics
+rounded to 4 significant digits. Metrics such as degree, betweenness or load are plain node columns, so a single
+plot can switch between them in the browser and several renderers of one document can share the same sources.
+
+    sources = graph_sources(G, positions, metrics=centrality_table())
+    st.bokeh_chart(metric_view(sources, {"degree": "Degree", "betweenness": "Betweenness"}), ...)
+"""
+import numpy as np
+from bokeh.layouts import column
+from bokeh.models import (CDSView, Circle, ColumnDataSource, CustomJS, GlyphRenderer, GraphRenderer,
+                          LinearColorMapper, MultiLine, Select, StaticLayoutProvider)
+from bokeh.palettes import Purples8, Spectral8, Viridis8
+from bokeh.plotting import figure
+
+COORD_DIGITS = 5
+METRIC_DIGITS = 4
+MIN_SIZE, MAX_SIZE = 5, 20
+NODE_COLUMNS = ("Name", "Zone", "Passenger_Count")
+PALETTES = {"degree": Spectral8, "betweenness": Purples8[::-1]}
+
+# sizes and colours the nodes by the metric column chosen in the select
+METRIC_JS = """
+const name = select.value;
+const values = nodes.data[name];
+let low = Infinity, high = -Infinity;
+for (const v of values) { if (isFinite(v)) { low = Math.min(low, v); high = Math.max(high, v); } }
+const span = high > low ? high - low : 1;
+const size = new Float32Array(values.length);
+for (let i = 0; i < values.length; i++) {
+    size[i] = isFinite(values[i]) ? min_size + (max_size - min_size) * (values[i] - low) / span : min_size;
+}
+nodes.data['size'] = size;
+mapper.low = low;
+mapper.high = high;
+mapper.palette = palettes[name] || palettes['default'];
+glyph.fill_color = {field: name, transform: mapper};
+nodes.change.emit();
+"""
+
+
+def compact(values, digits=METRIC_DIGITS):
+    """
+      float32 copy of values rounded to digits significant digits of the largest magnitude, NaN kept
+    """
+    values = np.asarray(values, dtype='float64')
+    top = np.nanmax(np.abs(values), initial=0.0) if values.size else 0.0
+    decimals = digits - 1 - int(np.floor(np.log10(top))) if top > 0 and np.isfinite(top) else digits
+    return np.round(values, decimals).astype('float32')
+
+
+class GraphSources:
+    """
+      the Bokeh sources of one graph: nodes (an 'index' column of node ids plus the chosen attributes and
+      metrics), edges ('start', 'end' and the chosen edge attributes) and the layout provider of the coordinates
+    """
+
+    def __init__(self, nodes, edges, layout):
+        self.nodes = nodes
+        self.edges = edges
+        self.layout = layout
+
+    def add_metric(self, name, values):
+        """
+          adds or replaces a node column from a mapping of node id -> value (missing nodes get NaN)
+        """
+        ids = self.nodes.data['index']
+        self.nodes.data[name] = compact([values.get(int(node), np.nan) for node in ids])
+
+
+def _node_values(G, attribute):
+    # numeric attributes as float32 (exact for counts up to 16 million), anything else as strings
+    values = [data.get(attribute) for _, data in G.nodes(data=True)]
+    if all(v is None or isinstance(v, (int, float, np.number)) for v in values):
+        return np.asarray([np.nan if v is None else v for v in values], dtype='float32')
+    return ["" if v is None else str(v) for v in values]
+
+
+def graph_sources(G, positions, node_columns=NODE_COLUMNS, edge_columns=("edge_color",), metrics=None):
+    """
+      the lean Bokeh sources of a graph
+
+      parameters: G, positions - graph and node positions as returned by get_network
+                  node_columns, edge_columns - node and edge attributes of G sent to the browser
+                  metrics - optional dataframe indexed by node id whose columns become node metric columns
+    """
+    ids = np.asarray([int(node) for node in G.nodes], dtype='int32')
+    nodes = ColumnDataSource({'index': ids, **{name: _node_values(G, name) for name in node_columns}})
+    edge_list = list(G.edges(data=True))
+    edges = ColumnDataSource({
+        'start': np.asarray([int(u) for u, _, _ in edge_list], dtype='int32'),
+        'end': np.asarray([int(v) for _, v, _ in edge_list], dtype='int32'),
+        **{name: [data.get(name) for _, _, data in edge_list] for name in edge_columns},
+    })
+    layout = StaticLayoutProvider(graph_layout={
+        int(node): [round(float(x), COORD_DIGITS), round(float(y), COORD_DIGITS)]
+        for node, (x, y) in positions.items() if node in G
+    })
+    sources = GraphSources(nodes, edges, layout)
+    if metrics is not None:
+        for name in metrics.columns:
+            sources.add_metric(name, metrics[name].to_dict())
+    return sources
+
+
+def graph_renderer(sources, size=7, fill_color="grey", fill_alpha=1.0, line_color="edge_color", line_width=1):
+    """
+      a GraphRenderer drawing the shared sources; size, fill_color and line_color take constants or column names
+    """
+    nodes = GlyphRenderer(data_source=sources.nodes, view=CDSView(source=sources.nodes),
+                          glyph=Circle(size=size, fill_color=fill_color, fill_alpha=fill_alpha))
+    edges = GlyphRenderer(data_source=sources.edges, view=CDSView(source=sources.edges),
+                          glyph=MultiLine(line_color=line_color, line_alpha=0.8, line_width=line_width))
+    return GraphRenderer(layout_provider=sources.layout, node_renderer=nodes, edge_renderer=edges)
+
+
+def graph_figure(tooltips=None, width=700, height=500):
+    """
+      an empty figure for graph renderers, with the toolbar of the pages' graph plots
+    """
+    return figure(tooltips=tooltips, width=width, height=height, tools="pan,wheel_zoom,save,reset",
+                  active_scroll='wheel_zoom')
+
+
+def metric_view(sources, metrics, tooltips=None, width=700, height=500, title="Metric"):
+    """
+      graph plot whose node size and colour follow one of several metric columns, chosen in the browser
+
+      parameters: sources - graph_sources() holding the metric columns
+                  metrics - dict of metric column -> label shown in the selector, the first one is shown first
+    """
+    first = next(iter(metrics))
+    values = np.asarray(sources.nodes.data[first], dtype='float64')
+    low, high = np.nanmin(values), np.nanmax(values)
+    span = high - low if high > low else 1.0
+    scaled = (np.nan_to_num(values, nan=low) - low) / span
+    sources.nodes.data['size'] = compact(MIN_SIZE + (MAX_SIZE - MIN_SIZE) * scaled)
+    mapper = LinearColorMapper(palette=PALETTES.get(first, Viridis8), low=low, high=high)
+
+    plot = graph_figure(tooltips, width, height)
+    graph = graph_renderer(sources, size='size', fill_color={'field': first, 'transform': mapper})
+    plot.renderers.append(graph)
+
+    select = Select(title=title, value=first, options=[(name, label) for name, label in metrics.items()])
+    select.js_on_change('value', CustomJS(args=dict(select=select, nodes=sources.nodes, mapper=mapper,
+                                                    glyph=graph.node_renderer.glyph, min_size=MIN_SIZE,
+                                                    max_size=MAX_SIZE, palettes={**PALETTES, 'default': Viridis8}),
+                                          code=METRIC_JS))
+    return column(select, plot, sizing_mode="stretch_width")
@@ -0,0 +1,279 @@
+"""
+Streaming ingestion of raw TfL tap exports and quarter-hour counts into partitioned Parquet.
+
+Exports are read in fixed-size chunks and pushed through a chain of generators: station names are normalized and
+mapped to NLC codes, months that are already stored are skipped, and every chunk is reduced to partial sums per
+month (or year, for quarter-hour counts) straight away. Only the sums of the few most recently seen periods are
+kept: exports list their rows period by period, so a period that drops out of that window is complete and is
+written to its own partition and released. Memory therefore stays flat however many periods are fed in; should
+an unordered export bring rows of a period written before, they are added to its partition. New exports only add
+partitions and never rewrite history.
+
+    python -m tube_twin.ingest monthly "Graph_Data/Entry_and_Exit data.csv"
+    python -m tube_twin.ingest quarter-hour Graph_Data/2020.csv
+
+Monthly exports need the columns of Entry_and_Exit data.csv: a station name ('Rail Station Name') and/or NLC
+('Travel Location No' or 'NLC'), 'Month Name (Travel Date)', 'Calendar Year (Travel Date)', 'Transaction Type'
+and 'Count of Taps'. Quarter-hour exports are wide tables like 2020.csv with one column per slot.
+"""
+import argparse
+import calendar
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from tube_twin.data import CROWDING_DTYPES, load_entry_exit, load_station_codes, load_stations
+from tube_twin.paths import cache_path
+
+CHUNKSIZE = 100_000
+# periods whose partial sums are kept at the same time, older ones are written out
+OPEN_PERIODS = 4
+MONTH_NUMBERS = {name: i for i, name in enumerate(calendar.month_name) if name}
+QUARTER_HOUR_KEYS = ['Mode', 'NLC', 'Station', 'year', 'day', 'dir']
+MONTHLY_KEYS = ['year', 'month', 'NLC', 'Transaction Type']
+
+
+def monthly_root():
+    """
+      folder of the year=/month= partitions of the ingested monthly counts
+    """
+    return cache_path("ingest", "monthly", "year=0").parent
+
+
+def quarter_hour_root():
+    """
+      folder of the year= partitions of the ingested quarter-hour counts
+    """
+    return cache_path("ingest", "quarter_hour", "year=0").parent
+
+
+def normalize_name(name):
+    """
+      station name reduced to a comparable key: lower case, '&' as 'and', no mode suffix or punctuation
+    """
+    name = str(name).lower().replace('&', ' and ')
+    name = re.sub(r'\((.*?)\)', ' ', name)
+    name = re.sub(r'\b(lu|dlr|lo|tfl|rail|underground|station)\b', ' ', name)
+    return ' '.join(re.sub(r'[^a-z0-9 ]', ' ', name).split())
+
+
+def station_lookup():
+    """
+      normalized station name -> NLC, from every dataset that pairs names with codes
+    """
+    stations = load_stations().dropna(subset=['NLC'])
+    codes = load_station_codes()
+    ee = load_entry_exit()[['Rail Station Name', 'Travel Location No']].drop_duplicates()
+    lookup = {}
+    for names, nlcs in ((ee['Rail Station Name'], ee['Travel Location No']),
+                        (stations['name'], stations['NLC']),
+                        (codes['Station'], codes['NLC'])):
+        lookup.update(zip(map(normalize_name, names), map(int, nlcs)))
+    return lookup
+
+
+def read_chunks(paths, chunksize=CHUNKSIZE, **read_csv_kwargs):
+    """
+      yields the rows of one or more CSV exports in chunks of at most chunksize rows
+    """
+    for path in paths:
+        yield from pd.read_csv(path, chunksize=chunksize, skipinitialspace=True, **read_csv_kwargs)
+
+
+def with_nlc(chunks, lookup=None, unmatched=None):
+    """
+      yields chunks with an int 'NLC' column, taken from the export or looked up from the station name;
+      rows that cannot be matched are dropped and their names counted in the unmatched dict
+    """
+    lookup = station_lookup() if lookup is None else lookup
+    for chunk in chunks:
+        chunk = chunk.rename(columns={'Travel Location No': 'NLC'})
+        if 'NLC' not in chunk.columns:
+            chunk['NLC'] = chunk['Rail Station Name'].map(lambda n: lookup.get(normalize_name(n)))
+        missing = chunk['NLC'].isna()
+        if missing.any() and unmatched is not None:
+            for name, n in chunk.loc[missing, 'Rail Station Name'].value_counts().items():
+                unmatched[name] = unmatched.get(name, 0) + int(n)
+        yield chunk[~missing].astype({'NLC': 'int32'})
+
+
+def with_month(chunks, skip=()):
+    """
+      yields chunks with integer 'year' and 'month' columns, dropping rows of the (year, month) pairs in skip
+    """
+    skip = set(skip)
+    for chunk in chunks:
+        chunk = chunk.assign(year=chunk['Calendar Year (Travel Date)'].astype('int16'),
+                             month=chunk['Month Name (Travel Date)'].map(MONTH_NUMBERS).astype('int8'))
+        if skip:
+            stored = pd.Series(list(zip(chunk['year'], chunk['month'])), index=chunk.index).isin(skip)
+            chunk = chunk[~stored]
+        if len(chunk):
+            yield chunk
+
+
+def monthly_sums(chunks, names=None):
+    """
+      partial sums of 'Count of Taps' per (NLC, transaction type) of every chunk, yielded as ((year, month), sums)
+      pairs; the names dict collects the last station name seen for every NLC
+    """
+    for chunk in chunks:
+        if names is not None and 'Rail Station Name' in chunk.columns:
+            last = chunk.drop_duplicates('NLC', keep='last')
+            names.update(zip(last['NLC'].tolist(), last['Rail Station Name'].astype(str).tolist()))
+        partial = chunk.groupby(MONTHLY_KEYS, observed=True)['Count of Taps'].sum()
+        for period, sums in partial.groupby(level=['year', 'month'], sort=False):
+            yield tuple(int(v) for v in period), sums.droplevel(['year', 'month'])
+
+
+def period_sums(partials, open_periods=OPEN_PERIODS):
+    """
+      adds up the (period, sums) pairs of partials, yields (period, total) once a period is not among the
+      open_periods most recently seen ones, and the remaining periods when partials ends
+    """
+    totals = OrderedDict()
+    for period, sums in partials:
+        if period in totals:
+            totals[period] = totals[period].add(sums, fill_value=0)
+            totals.move_to_end(period)
+            continue
+        totals[period] = sums
+        while len(totals) > open_periods:
+            yield totals.popitem(last=False)
+    yield from totals.items()
+
+
+def stored_partitions(root, *levels):
+    """
+      the partitions already written below root, as tuples of ints (e.g. (year, month))
+    """
+    pattern = "/".join(f"{level}=*" for level in levels)
+    return {tuple(int(part.split("=")[1]) for part in p.relative_to(root).parts)
+            for p in Path(root).glob(pattern)} if Path(root).exists() else set()
+
+
+def _partition_folder(root, levels, values):
+    return Path(root).joinpath(*(f"{level}={int(v)}" for level, v in zip(levels, values)))
+
+
+def write_partitions(totals, root, levels, to_frame):
+    """
+      writes every (period, sums) pair of totals as the Parquet file of its partition (e.g. year=2021/month=3),
+      returns the partitions written
+
+      a period that comes back after it was written is added to what this run wrote for it, partitions stored
+      by earlier runs are replaced, so callers drop the periods they want to keep before aggregating
+
+      parameters: totals - (period values, Series of sums) pairs, e.g. from period_sums()
+                  levels - partition level of every period value, e.g. ('year', 'month')
+                  to_frame - callable turning a Series of sums into the dataframe stored
+    """
+    written = {}
+    for values, sums in totals:
+        folder = _partition_folder(root, levels, values)
+        if values in written:
+            stored = pd.read_parquet(folder / "part-0.parquet").set_index(list(sums.index.names))[sums.name]
+            sums = stored.add(sums, fill_value=0)
+        folder.mkdir(parents=True, exist_ok=True)
+        tmp = folder / "part-0.parquet.tmp"
+        to_frame(sums).to_parquet(tmp, index=False)
+        tmp.replace(folder / "part-0.parquet")
+        written[values] = True
+    return list(written)
+
+
+def ingest_monthly(paths, root=None, chunksize=CHUNKSIZE, overwrite=False, log=print):
+    """
+      aggregates tap exports to monthly counts per station and stores the months not ingested before
+
+      parameters: paths - CSV exports to read
+                  root - folder of the year=/month= partitions, monthly_root() by default
+                  chunksize - rows read at a time
+                  overwrite - re-ingest months that are already stored
+    """
+    root = monthly_root() if root is None else root
+    unmatched, names = {}, {}
+    skip = () if overwrite else stored_partitions(root, 'year', 'month')
+    chunks = with_month(with_nlc(read_chunks(paths, chunksize), unmatched=unmatched), skip=skip)
+
+    def to_frame(sums):
+        frame = sums.astype('int64').reset_index()
+        frame.insert(1, 'Rail Station Name', frame['NLC'].map(names))
+        return frame
+
+    written = write_partitions(period_sums(monthly_sums(chunks, names)), root, ('year', 'month'), to_frame)
+    log(f"wrote {len(written)} month partitions, skipped {len(skip)} already stored")
+    if unmatched:
+        log(f"{sum(unmatched.values())} rows of {len(unmatched)} unknown stations dropped, e.g. {list(unmatched)[:5]}")
+    return written
+
+
+def read_monthly(root=None):
+    """
+      the ingested monthly counts in the layout of station_counts_grouped_per_station.csv (entries plus exits)
+    """
+    root = monthly_root() if root is None else root
+    parts = []
+    for year, month in sorted(stored_partitions(root, 'year', 'month')):
+        part = pd.read_parquet(Path(root) / f"year={year}" / f"month={month}" / "part-0.parquet")
+        part = part.groupby(['NLC', 'Rail Station Name'], as_index=False, dropna=False)['Count of Taps'].sum()
+        parts.append(part.assign(**{'Month-Year': f"{year}-{month:02d}",
+                                    'Month Name (Travel Date)': calendar.month_name[month],
+                                    'Calendar Year (Travel Date)': year}))
+    columns = list(CROWDING_DTYPES)
+    if not parts:
+        return pd.DataFrame(columns=columns).astype(CROWDING_DTYPES)
+    return pd.concat(parts, ignore_index=True)[columns].astype(CROWDING_DTYPES)
+
+
+def quarter_hour_sums(chunks):
+    """
+      melts wide quarter-hour rows to (keys, slot, count) and yields the partial sums of every chunk as
+      ((year,), sums) pairs
+    """
+    for chunk in chunks:
+        slots = [c for c in chunk.columns if c[:4].isdigit()]
+        long = chunk.melt(id_vars=QUARTER_HOUR_KEYS, value_vars=slots, var_name='slot', value_name='count')
+        partial = long.groupby(QUARTER_HOUR_KEYS + ['slot'], observed=True)['count'].sum()
+        for year, sums in partial.groupby(level='year', sort=False):
+            yield (int(year),), sums.droplevel('year')
+
+
+def ingest_quarter_hours(paths, root=None, chunksize=CHUNKSIZE, overwrite=False, log=print):
+    """
+      stores quarter-hour counts in long format, one partition per year not ingested before
+    """
+    root = quarter_hour_root() if root is None else root
+    skip = set() if overwrite else {year for (year,) in stored_partitions(root, 'year')}
+
+    def new_years(chunks):
+        for chunk in chunks:
+            chunk = chunk[~chunk['year'].isin(skip)]
+            if len(chunk):
+                yield chunk
+
+    sums = period_sums(quarter_hour_sums(new_years(read_chunks(paths, chunksize))))
+    written = write_partitions(sums, root, ('year',), lambda sums: sums.astype('int32').reset_index())
+    log(f"wrote {len(written)} year partitions, skipped {len(skip)} already stored")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest raw TfL exports into partitioned Parquet.")
+    parser.add_argument("kind", choices=["monthly", "quarter-hour"])
+    parser.add_argument("paths", nargs="+", help="CSV exports to ingest")
+    parser.add_argument("--root", type=Path, default=None, help="output folder of the partitions")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--overwrite", action="store_true", help="re-ingest periods that are already stored")
+    args = parser.parse_args(argv)
+    if args.kind == "monthly":
+        ingest_monthly(args.paths, root=args.root, chunksize=args.chunksize, overwrite=args.overwrite)
+    else:
+        ingest_quarter_hours(args.paths, root=args.root, chunksize=args.chunksize, overwrite=args.overwrite)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
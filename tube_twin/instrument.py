@@ -0,0 +1,268 @@
+"""
+Timing and cache instrumentation of the dashboard's hot paths.
+
+Stages are wrapped in timed(), usable as a context manager or a decorator, and caches report hits and misses
+with cache_event(). Both are kept in process-wide, thread-safe counters (the recent durations of every stage
+are kept for percentiles and histograms) that the Diagnostics page reads. Recording only touches the standard
+library, pandas is imported by the reports. The counters can also be exported:
+
+    TUBE_TWIN_METRICS_PORT=9464   serves the counters in the Prometheus text format on http://127.0.0.1:9464/metrics
+    TUBE_TWIN_METRICS_LOG=path    appends one JSON line per timed stage to path
+
+A single page run can be profiled with cProfile: arm it with request_profile(), the next page that calls
+start_run() is profiled until it calls finish_run(), and the stats are kept for last_profile().
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# durations kept per stage for percentiles and histograms
+WINDOW = 1000
+# upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_durations = defaultdict(lambda: deque(maxlen=WINDOW))
+_totals = defaultdict(lambda: [0, 0.0])
+_cache = defaultdict(lambda: [0, 0])
+_profile = {"armed": False, "running": None, "last": None}
+_log_path = os.environ.get("TUBE_TWIN_METRICS_LOG")
+# page run in progress on the current (script) thread
+_run = threading.local()
+
+
+def record(stage, seconds):
+    """
+      adds one duration of a stage to the counters (and to the JSON log when one is configured)
+    """
+    with _lock:
+        _durations[stage].append(seconds)
+        total = _totals[stage]
+        total[0] += 1
+        total[1] += seconds
+    if _log_path:
+        with open(_log_path, "a") as f:
+            f.write(json.dumps({"time": time.time(), "stage": stage, "seconds": seconds}) + "\n")
+
+
+class timed(ContextDecorator):
+    """
+      times a block or a function call as a stage
+
+        with timed("network.build"):
+            ...
+
+        @timed("forecast.search_order")
+        def search_order(...):
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        # a fresh timer per decorated call, so concurrent and nested calls do not share a start time
+        return type(self)(self.stage)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        record(self.stage, self.seconds)
+        return False
+
+
+def cache_event(cache, hit):
+    """
+      counts a hit (hit=True) or a miss of a named cache
+    """
+    with _lock:
+        _cache[cache][0 if hit else 1] += 1
+
+
+def stage_stats():
+    """
+      one row per stage: 'calls' and 'total_s' since the process started, 'mean_s', 'p50_s', 'p95_s' and 'max_s'
+      over the recent window
+    """
+    import pandas as pd
+
+    with _lock:
+        rows = [(stage, _totals[stage][0], _totals[stage][1], np.asarray(d)) for stage, d in _durations.items()]
+    return pd.DataFrame([{'stage': stage, 'calls': calls, 'total_s': total, 'mean_s': d.mean(),
+                          'p50_s': np.percentile(d, 50), 'p95_s': np.percentile(d, 95), 'max_s': d.max()}
+                         for stage, calls, total, d in rows],
+                        columns=['stage', 'calls', 'total_s', 'mean_s', 'p50_s', 'p95_s', 'max_s'])
+
+
+def cache_stats():
+    """
+      one row per cache with its 'hits', 'misses' and 'hit_rate'
+    """
+    import pandas as pd
+
+    with _lock:
+        rows = [(cache, hits, misses) for cache, (hits, misses) in _cache.items()]
+    df = pd.DataFrame(rows, columns=['cache', 'hits', 'misses'])
+    df['hit_rate'] = df['hits'] / (df['hits'] + df['misses']).where(lambda n: n > 0)
+    return df
+
+
+def histogram(stage, buckets=BUCKETS):
+    """
+      number of recent durations of a stage in each latency bucket, as a Series indexed by the bucket's upper bound
+    """
+    import pandas as pd
+
+    with _lock:
+        d = np.asarray(_durations.get(stage, ()))
+    edges = np.asarray(buckets + (np.inf,))
+    counts = np.bincount(np.searchsorted(edges, d), minlength=len(edges))[:len(edges)]
+    labels = [f"≤{b:g}s" for b in buckets] + [f">{buckets[-1]:g}s"]
+    return pd.Series(counts, index=labels, name=stage)
+
+
+def prometheus_text():
+    """
+      every stage and cache counter in the Prometheus text exposition format
+    """
+    lines = ["# HELP tube_twin_stage_seconds Duration of instrumented dashboard stages.",
+             "# TYPE tube_twin_stage_seconds histogram"]
+    with _lock:
+        stages = [(stage, list(d), tuple(_totals[stage])) for stage, d in _durations.items()]
+        caches = [(cache, hits, misses) for cache, (hits, misses) in _cache.items()]
+    for stage, durations, (calls, total) in stages:
+        # buckets over the recent window, sum and count over the life of the process
+        d = np.asarray(durations)
+        for bound in BUCKETS:
+            lines.append(f'tube_twin_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {int((d <= bound).sum())}')
+        lines.append(f'tube_twin_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {len(d)}')
+        lines.append(f'tube_twin_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'tube_twin_stage_seconds_count{{stage="{stage}"}} {calls}')
+    lines += ["# HELP tube_twin_cache_requests_total Cache lookups by outcome.",
+              "# TYPE tube_twin_cache_requests_total counter"]
+    for cache, hits, misses in caches:
+        lines.append(f'tube_twin_cache_requests_total{{cache="{cache}",result="hit"}} {hits}')
+        lines.append(f'tube_twin_cache_requests_total{{cache="{cache}",result="miss"}} {misses}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """
+      clears every counter
+    """
+    with _lock:
+        _durations.clear()
+        _totals.clear()
+        _cache.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("/metrics", ""):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """
+      serves prometheus_text() on http://host:port/metrics from a daemon thread, once per process;
+      the port defaults to TUBE_TWIN_METRICS_PORT and nothing is started when neither is set
+    """
+    global _server
+    port = port or os.environ.get("TUBE_TWIN_METRICS_PORT")
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        except OSError:
+            # another worker of the same host already serves the port
+            return None
+    threading.Thread(target=_server.serve_forever, name="tube-twin-metrics", daemon=True).start()
+    return _server
+
+
+def request_profile():
+    """
+      arms cProfile for the next page run that calls start_run()
+    """
+    with _lock:
+        _profile["armed"] = True
+
+
+def start_run(page):
+    """
+      marks the start of a page run, timed as stage 'page.<page>'; profiles it when a profile was requested
+    """
+    start_metrics_server()
+    _run.page, _run.started = page, time.perf_counter()
+    with _lock:
+        if not _profile["armed"] or _profile["running"] is not None:
+            return
+        _profile["armed"] = False
+        profiler = cProfile.Profile()
+        _profile["running"] = (page, threading.get_ident(), profiler)
+    profiler.enable()
+
+
+def finish_run():
+    """
+      marks the end of a page run, stopping and keeping the profile when this thread is being profiled
+    """
+    page, started = getattr(_run, "page", None), getattr(_run, "started", None)
+    if page is None:
+        return
+    _run.page = None
+    seconds = time.perf_counter() - started
+    record(f"page.{page}", seconds)
+    with _lock:
+        running = _profile["running"]
+        if running is None or running[1] != threading.get_ident():
+            return
+        _profile["running"] = None
+    profiler = running[2]
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+    with _lock:
+        _profile["last"] = {"page": page, "seconds": seconds, "finished": time.time(), "stats": out.getvalue()}
+
+
+def profile_armed():
+    """
+      whether the next page run will be profiled
+    """
+    with _lock:
+        return _profile["armed"]
+
+
+def last_profile():
+    """
+      the last captured profile as a dict with 'page', 'seconds', 'finished' and the cProfile 'stats' text,
+      None when no run was profiled yet
+    """
+    with _lock:
+        return _profile["last"]
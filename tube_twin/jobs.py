@@ -0,0 +1,187 @@
+"""
+Background forecast jobs.
+
+A forecast request is submitted to a small thread pool shared by every session of the server process and gets a
+job id derived from the station, the requested dates and a fingerprint of the station's data. Asking for the same
+forecast again, from any session, returns the same id instead of starting a second search. Job state and results
+are written under the cache directory, so a finished forecast survives reruns and server restarts and can be
+picked up by any session that polls its id.
+
+    job_id = submit_forecast(nlc, [date(2022, 6, 1)])
+    job = job_status(job_id)     # {'state': 'queued' | 'running' | 'done' | 'failed', 'result': [...], ...}
+"""
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from threading import Lock, Thread
+
+from tube_twin import registry
+from tube_twin.data import load_forecasting_data
+from tube_twin.forecast import forecasting
+from tube_twin.paths import cache_path
+
+# forecasts running at the same time per server process, each one already fans its grid search out to processes
+JOB_WORKERS = 2
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+INTERRUPTED = "interrupted"
+# seconds between two touches of the status files of the jobs a process runs, and age after which a job of
+# another host whose status file was not touched counts as abandoned
+HEARTBEAT = 30
+LEASE = 4 * HEARTBEAT
+HOST = socket.gethostname()
+
+_lock = Lock()
+_pool = None
+_futures = {}
+
+
+def _heartbeat():
+    # the cache may be shared by several hosts, which cannot probe each other's pids: jobs of this process keep
+    # the mtime of their status file fresh instead
+    while True:
+        time.sleep(HEARTBEAT)
+        with _lock:
+            running = list(_futures)
+        for job_id in running:
+            try:
+                os.utime(_status_path(job_id))
+            except OSError:
+                pass
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="tube-twin-job")
+        Thread(target=_heartbeat, name="tube-twin-job-heartbeat", daemon=True).start()
+    return _pool
+
+
+def _status_path(job_id):
+    return cache_path("jobs", job_id, "status.json")
+
+
+def _write_status(job_id, **fields):
+    path = _status_path(job_id)
+    status = read_job(job_id) or {}
+    status.update(fields)
+    # write-then-rename so polling sessions never see a half written file
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as f:
+        json.dump(status, f)
+    os.replace(f.name, path)
+    return status
+
+
+def read_job(job_id):
+    """
+      the stored status of a job, None when it was never submitted
+    """
+    path = _status_path(job_id)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def station_series(nlc, df=None):
+    """
+      the monthly 'Count of Taps' series of a station, as forecast by the forecasting page
+    """
+    df = load_forecasting_data() if df is None else df
+    return df['Count of Taps'][df['NLC'] == int(nlc)].copy()
+
+
+def forecast_job_id(nlc, dates, series):
+    """
+      id of the forecast of a station for the given dates on the given data
+    """
+    payload = json.dumps({"kind": "forecast", "nlc": int(nlc), "dates": [str(d) for d in dates],
+                          "data": registry.fingerprint(series)}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _run_forecast(job_id, nlc, dates):
+    _write_status(job_id, state=RUNNING, started=time.time())
+    try:
+        result = forecasting(dates, station_series(nlc), nlc)
+    except Exception as e:
+        return _write_status(job_id, state=FAILED, finished=time.time(), error=f"{type(e).__name__}: {e}",
+                             traceback=traceback.format_exc())
+    return _write_status(job_id, state=DONE, finished=time.time(), result=[float(v) for v in result])
+
+
+def _forget(job_id, future):
+    # called once the job has written its outcome
+    with _lock:
+        if _futures.get(job_id) is future:
+            del _futures[job_id]
+
+
+def _is_live(job_id, status):
+    # a queued or running job is still in this process' pool, belongs to another process of this host that is
+    # alive, or to another host that still touches its status file
+    if job_id in _futures:
+        return not _futures[job_id].done()
+    if status.get("host") != HOST:
+        try:
+            return time.time() - _status_path(job_id).stat().st_mtime < LEASE
+        except OSError:
+            return False
+    if status.get("pid") == os.getpid():
+        return False
+    try:
+        os.kill(status["pid"], 0)
+    except (KeyError, OSError, OverflowError):
+        return False
+    return True
+
+
+def submit_forecast(nlc, dates, retry_failed=False):
+    """
+      submits the forecast of a station's monthly taps for one date or a (from, to) pair of dates, returns the job id
+
+      a job that is already done, queued or running (in any session or process) is not started again;
+      a failed job is only resubmitted with retry_failed, or when the process running it went away
+    """
+    dates = [d.date() if isinstance(d, datetime) else d for d in dates]
+    if not all(isinstance(d, date) for d in dates):
+        raise TypeError("dates must be datetime.date objects")
+    job_id = forecast_job_id(nlc, dates, station_series(nlc))
+    with _lock:
+        status = read_job(job_id)
+        if status is not None:
+            if status["state"] == DONE:
+                return job_id
+            if status["state"] == FAILED and not retry_failed and status["error"] != INTERRUPTED:
+                return job_id
+            if status["state"] in (QUEUED, RUNNING) and _is_live(job_id, status):
+                return job_id
+        _write_status(job_id, id=job_id, kind="forecast", nlc=int(nlc), dates=[d.isoformat() for d in dates],
+                      state=QUEUED, submitted=time.time(), host=HOST, pid=os.getpid(), started=None,
+                      finished=None, result=None, error=None, traceback=None)
+        future = _executor().submit(_run_forecast, job_id, int(nlc), dates)
+        _futures[job_id] = future
+    future.add_done_callback(lambda f: _forget(job_id, f))
+    return job_id
+
+
+def job_status(job_id):
+    """
+      status of a job as a dict with 'state' ('queued', 'running', 'done' or 'failed'), 'result' once done,
+      'error' once failed and 'elapsed' seconds since it was submitted or until it finished
+    """
+    with _lock:
+        status = read_job(job_id)
+        if status is None:
+            raise KeyError(f"unknown job {job_id}")
+        if status["state"] in (QUEUED, RUNNING) and not _is_live(job_id, status):
+            # the process running it went away without recording an outcome
+            status = _write_status(job_id, state=FAILED, error=INTERRUPTED, finished=time.time())
+    status["elapsed"] = (status.get("finished") or time.time()) - status["submitted"]
+    return status
@@ -0,0 +1,154 @@
+"""
+Station map layer for the folium map page.
+
+Stations are turned into one GeoJSON FeatureCollection straight from the station dataframe, with the month's
+passenger count (or, for time-of-day views, the count of one quarter-hour slot of the 2020 profiles) and a circle
+radius scaled from it as feature properties. The whole layer is drawn by a single folium.GeoJson of circle
+markers, optionally with the station pins in a client-side marker cluster and the walking links between nearby
+stations (see tube_twin.spatial), so the map stays light with thousands of stations. Rendered map HTML is cached
+per month and data version.
+"""
+from functools import lru_cache
+
+import folium
+import numpy as np
+from folium.plugins import FastMarkerCluster
+
+from tube_twin.data import files_stamp, load_stations
+from tube_twin.instrument import cache_event, timed
+from tube_twin.monthly import get_monthly
+from tube_twin.network import stations_crowding_df
+from tube_twin.paths import GRAPH_DATA
+from tube_twin.profiles import get_profiles
+from tube_twin.spatial import walking_links
+
+LONDON = [51.529865, -0.128092]
+CIRCLE_COLOR = '#3186cc'
+WALK_COLOR = '#e8590c'
+MIN_RADIUS, MAX_RADIUS = 3, 18
+
+# station pins, built in the browser by the cluster plugin instead of one Marker element per station
+PIN_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'train', prefix: 'fa', markerColor: 'green'});
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: icon}).bindPopup(row[2]);
+};
+"""
+
+
+def circle_radius(counts):
+    """
+      circle radius per station, the area grows with the passenger count; stations without a count get the minimum
+    """
+    counts = np.nan_to_num(np.asarray(counts, dtype='float64'), nan=0.0)
+    top = counts.max(initial=0.0)
+    scaled = np.sqrt(counts / top) if top > 0 else np.zeros_like(counts)
+    return np.round(MIN_RADIUS + (MAX_RADIUS - MIN_RADIUS) * scaled, 1)
+
+
+def stations_geojson(stations_df, counts=None):
+    """
+      GeoJSON FeatureCollection with one point per station
+
+      parameters: stations_df - dataframe with 'latitude', 'longitude', 'name' and 'zone' columns
+                  counts - optional passenger count per row of stations_df, sizes the circles
+    """
+    counts = np.full(len(stations_df), np.nan) if counts is None else np.asarray(counts, dtype='float64')
+    lon = stations_df['longitude'].to_numpy(dtype='float64').round(5).tolist()
+    lat = stations_df['latitude'].to_numpy(dtype='float64').round(5).tolist()
+    names = stations_df['name'].astype(str).tolist()
+    zones = stations_df['zone'].astype('float64').fillna(0).tolist()
+    count_values = [None if np.isnan(c) else int(c) for c in counts]
+    radius = circle_radius(counts).tolist()
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [x, y]},
+             "properties": {"name": n, "zone": z, "count": c, "radius": r}}
+            for x, y, n, z, c, r in zip(lon, lat, names, zones, count_values, radius)
+        ],
+    }
+
+
+def walking_geojson(stations_df, links):
+    """
+      GeoJSON FeatureCollection with one line per walking link, each pair of stations drawn once
+
+      parameters: stations_df - dataframe with 'id', 'latitude', 'longitude' and 'name' columns
+                  links - walking links with 'station1', 'station2', 'distance' and 'time', see walking_links()
+    """
+    stations = stations_df.drop_duplicates('id').set_index('id')
+    links = links[links['station1'] < links['station2']]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature",
+             "geometry": {"type": "LineString",
+                          "coordinates": [[round(float(stations.at[u, 'longitude']), 5),
+                                           round(float(stations.at[u, 'latitude']), 5)],
+                                          [round(float(stations.at[v, 'longitude']), 5),
+                                           round(float(stations.at[v, 'latitude']), 5)]]},
+             "properties": {"from": str(stations.at[u, 'name']), "to": str(stations.at[v, 'name']),
+                            "metres": int(distance), "minutes": round(float(time), 1)}}
+            for u, v, distance, time in links[['station1', 'station2', 'distance', 'time']].itertuples(index=False)
+        ],
+    }
+
+
+def station_map(geojson, pins=True, width="100%", height=700, walks=None):
+    """
+      folium map of the stations: one GeoJSON layer of circles sized by passenger count, plus clustered pins and,
+      given a walking_geojson(), dashed walking links
+    """
+    london_map = folium.Map(zoom_start=12, width=width, height=height, location=LONDON)
+    if walks is not None:
+        folium.GeoJson(
+            walks,
+            name="Walking links",
+            style_function=lambda feature: {"color": WALK_COLOR, "weight": 3, "dashArray": "4 6"},
+            tooltip=folium.GeoJsonTooltip(fields=["from", "to", "metres", "minutes"],
+                                          aliases=["From", "To", "Metres", "Walk (min)"]),
+        ).add_to(london_map)
+    folium.GeoJson(
+        geojson,
+        name="Stations",
+        marker=folium.CircleMarker(color=CIRCLE_COLOR, fill_color=CIRCLE_COLOR, fill=True, fill_opacity=0.4),
+        style_function=lambda feature: {"radius": feature["properties"]["radius"]},
+        tooltip=folium.GeoJsonTooltip(fields=["name", "zone", "count"], aliases=["Station", "Zone", "Passengers"]),
+    ).add_to(london_map)
+    if pins:
+        rows = [[lat, lon, f["properties"]["name"]] for f in geojson["features"]
+                for lon, lat in [f["geometry"]["coordinates"]]]
+        FastMarkerCluster(rows, callback=PIN_CALLBACK, name="Pins").add_to(london_map)
+    return london_map
+
+
+@lru_cache(maxsize=16)
+def _map_html(year, month, pins, slot, day, walking, stamp):
+    stations_df = load_stations()
+    final_df = stations_crowding_df(stations_df, get_monthly(), year, month)
+    if slot is None:
+        counts = final_df['Count of Taps']
+    else:
+        counts = final_df['NLC'].map(get_profiles().at(slot, day))
+    walks = walking_geojson(stations_df, walking_links()) if walking else None
+    london_map = station_map(stations_geojson(final_df, counts), pins=pins, walks=walks)
+    with timed("map.folium_render"):
+        return london_map.get_root().render()
+
+
+def map_html(year, month, pins=True, slot=None, day='MTT', walking=False):
+    """
+      rendered HTML of the station map for a month, cached per process until the source data changes
+
+      with a slot ('0800-0815'), circles show the entries plus exits of that quarter-hour on day type day instead
+      of the month's passenger count; with walking, the walking links between nearby stations are drawn too
+    """
+    stamp = files_stamp(GRAPH_DATA / "london.stations.csv", GRAPH_DATA / "station_counts_grouped_per_station.csv",
+                        GRAPH_DATA / "2020.csv")
+    hits = _map_html.cache_info().hits
+    with timed("map.html"):
+        html = _map_html(int(year), str(month), pins, slot, day, walking, stamp)
+    cache_event("map.html", _map_html.cache_info().hits > hits)
+    return html
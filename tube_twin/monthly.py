@@ -0,0 +1,178 @@
+"""
+Monthly passenger counts as a pre-pivoted station x month matrix.
+
+station_counts_grouped_per_station.csv is pivoted once into an int64 matrix with one row per NLC (sorted) and
+one column per calendar month from the first to the last one reported ('YYYY-MM' labels), plus a mask of the
+(station, month) pairs that were observed. A month missing from the file is a column nobody observed, so column
+offsets stay month offsets.
+A month, a station or any slice of them is then an index lookup instead of a boolean filter over the whole table,
+and sweeps over every month (animations, comparisons, year-over-year deltas, rolling statistics) are single array
+operations. The matrix is built once per process and data version.
+
+    monthly = get_monthly()
+    monthly.month("2021-01")                 # Series of counts indexed by NLC
+    monthly.station(541)                     # Series of counts indexed by month label
+    monthly.yoy()                            # (stations, months) change on the same month a year earlier
+"""
+import calendar
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from tube_twin.data import files_stamp, load_crowding
+from tube_twin.instrument import cache_event, timed
+from tube_twin.paths import GRAPH_DATA
+
+SOURCE = GRAPH_DATA / "station_counts_grouped_per_station.csv"
+
+
+class MonthlyMatrix:
+    """
+      counts[i, j] is the 'Count of Taps' of station nlc[i] in month labels[j] ('YYYY-MM'), observed[i, j]
+      whether that month was reported for the station (unreported counts are 0); names[i] is the station's name
+      and reported[j] whether any station reported month labels[j]
+    """
+
+    def __init__(self, nlc, labels, counts, observed, names):
+        self.nlc = nlc
+        self.labels = labels
+        self.counts = counts
+        self.observed = observed
+        self.names = names
+        self.reported = observed.any(axis=0)
+        self.column = {label: j for j, label in enumerate(labels)}
+        self.row = {int(code): i for i, code in enumerate(nlc)}
+
+    @property
+    def periods(self):
+        """
+          (year, month name) of every column, the month arguments of get_network and stations_crowding_df
+        """
+        return [(int(label[:4]), calendar.month_name[int(label[5:7])]) for label in self.labels]
+
+    def month_index(self, month, year=None):
+        """
+          column of a month given as a 'YYYY-MM' label, or as a month name (or number) with its year
+        """
+        if year is None:
+            return self.column[str(month)]
+        number = month if isinstance(month, (int, np.integer)) else list(calendar.month_name).index(str(month))
+        return self.column[f"{int(year):04d}-{number:02d}"]
+
+    def values(self):
+        """
+          float copy of the counts with NaN where a month was not observed
+        """
+        return np.where(self.observed, self.counts, np.nan)
+
+    def frame(self):
+        """
+          the matrix as a dataframe, NLC index and month label columns, NaN where not observed
+        """
+        return pd.DataFrame(self.values(), index=pd.Index(self.nlc, name='NLC'), columns=self.labels)
+
+    def month(self, month, year=None):
+        """
+          counts of every station reporting in a month, as a Series indexed by NLC
+        """
+        j = self.month_index(month, year)
+        seen = self.observed[:, j]
+        return pd.Series(self.counts[seen, j], index=pd.Index(self.nlc[seen], name='NLC'), name='Count of Taps')
+
+    def station(self, nlc):
+        """
+          counts of one station in every month it reported, as a Series indexed by month label (empty for an
+          unknown NLC)
+        """
+        i = self.row.get(None if nlc is None else int(nlc))
+        if i is None:
+            return pd.Series([], index=pd.Index([], name='Month-Year'), dtype='int64', name='Count of Taps')
+        seen = self.observed[i]
+        return pd.Series(self.counts[i, seen], index=pd.Index(np.asarray(self.labels)[seen], name='Month-Year'),
+                         name='Count of Taps')
+
+    def rows_for(self, nlc):
+        """
+          float (len(nlc), months) counts of the given NLC codes, in their order; NaN for unknown codes (or
+          missing ones) and months that were not observed
+        """
+        nlc = np.asarray(nlc, dtype='float64')
+        found = np.searchsorted(self.nlc, np.nan_to_num(nlc, nan=-1)).clip(max=len(self.nlc) - 1)
+        known = self.nlc[found] == nlc
+        values = self.values()[found]
+        values[~known] = np.nan
+        return values
+
+    def totals(self):
+        """
+          network total of every month, as a Series indexed by month label (NaN for months nobody reported)
+        """
+        return pd.Series(np.where(self.reported, self.counts.sum(axis=0), np.nan), index=self.labels,
+                         name='Count of Taps')
+
+    def yoy(self, ratio=False, periods=12):
+        """
+          (stations, months) change on the count periods months earlier (the same month a year before), as a
+          difference or, with ratio, as a relative change; NaN where either month is missing
+        """
+        values = self.values()
+        change = np.full_like(values, np.nan)
+        before, after = values[:, :-periods], values[:, periods:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change[:, periods:] = np.where(before > 0, after / before - 1, np.nan) if ratio else after - before
+        return pd.DataFrame(change, index=pd.Index(self.nlc, name='NLC'), columns=self.labels)
+
+    def rolling(self, window=3, stat='mean'):
+        """
+          (stations, months) rolling 'mean', 'sum' or 'std' over the window months ending at each month, computed
+          on strided views of the matrix; NaN unless all window months were observed
+        """
+        reducers = {'mean': np.mean, 'sum': np.sum, 'std': lambda a, axis: np.std(a, axis=axis, ddof=1)}
+        if stat not in reducers:
+            raise ValueError(f"unknown rolling statistic {stat!r}, use 'mean', 'sum' or 'std'")
+        result = np.full(self.counts.shape, np.nan)
+        windows = np.lib.stride_tricks.sliding_window_view(self.values(), window, axis=1)
+        result[:, window - 1:] = reducers[stat](windows, axis=2)
+        return pd.DataFrame(result, index=pd.Index(self.nlc, name='NLC'), columns=self.labels)
+
+
+@timed("monthly.build")
+def build_monthly(crowding_df):
+    """
+      pivots a crowding dataframe ('Month-Year', 'NLC', 'Rail Station Name', 'Count of Taps') into a MonthlyMatrix,
+      counts reported twice for a station and month are added up and months missing from the file are kept as
+      unobserved columns
+    """
+    nlc, row = np.unique(crowding_df['NLC'].to_numpy(dtype='int64'), return_inverse=True)
+    # columns are month offsets from the first month, months missing in between get a column of their own
+    months = pd.PeriodIndex(crowding_df['Month-Year'].astype(str), freq='M').asi8
+    first = int(months.min()) if len(months) else 0
+    column = months - first
+    labels = pd.period_range(pd.Period(ordinal=first, freq='M'), periods=int(column.max(initial=-1)) + 1, freq='M')
+    labels = labels.strftime('%Y-%m')
+    counts = np.zeros((len(nlc), len(labels)), dtype='int64')
+    np.add.at(counts, (row, column), crowding_df['Count of Taps'].to_numpy(dtype='int64'))
+    observed = np.zeros(counts.shape, dtype=bool)
+    observed[row, column] = True
+    # the last name reported for every station
+    names = np.empty(len(nlc), dtype=object)
+    names[row] = crowding_df['Rail Station Name'].astype(str).to_numpy()
+    return MonthlyMatrix(nlc.astype('int32'), labels.tolist(), counts, observed, names)
+
+
+_lock = Lock()
+_matrices = {}
+
+
+def get_monthly():
+    """
+      the MonthlyMatrix of the bundled crowding data, built once per process and data version
+    """
+    stamp = files_stamp(SOURCE)
+    with _lock:
+        cache_event("monthly.memory", stamp in _matrices)
+        if stamp not in _matrices:
+            _matrices.clear()
+            _matrices[stamp] = build_monthly(load_crowding())
+        return _matrices[stamp]
@@ -0,0 +1,205 @@
+"""
+Multi-layer model of the tube network, one layer per line.
+
+Every (station, line) pair served by a connection is a node. Consecutive stations of a line are joined by one
+edge per line in each direction, weighted by the connection's 'time', so stations served by several lines keep a
+parallel edge per line, and the nodes of the same station are joined by interchange edges. The graph is held as
+CSR arrays over the layer nodes (indptr, indices, time and the line of every edge, -1 for interchanges) plus the
+line names and colours of london.lines.csv, which keeps per-line analytics, line-coloured rendering and
+line-level load aggregation to array operations.
+
+    net = get_multilayer()
+    net.line_summary()                     # stations, links and minutes of track per line
+    net.adjacency(penalty=5.0)             # scipy CSR matrix over the layer nodes, as routed on
+"""
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from tube_twin.data import files_stamp, load_connections, load_lines
+from tube_twin.instrument import cache_event
+from tube_twin.paths import GRAPH_DATA
+
+SOURCES = ("london.connections.csv", "london.lines.csv")
+# line id of the interchange edges
+INTERCHANGE = -1
+
+
+def _node_keys(station, line):
+    # one sortable int64 per (station, line), in the order of the layer nodes
+    return np.asarray(station, dtype='int64') * 100000 + np.asarray(line, dtype='int64')
+
+
+class MultiLayerNetwork:
+    """
+      layer nodes node_station[i], node_line[i] (sorted by station, then line) and their directed edges in CSR
+      form: the edges leaving node i are indices[indptr[i]:indptr[i + 1]], with their minutes in time and their
+      line in edge_line (INTERCHANGE for changes of line within a station)
+
+      lines, line_names, line_colours describe every line of london.lines.csv, colours as '#RRGGBB'
+    """
+
+    def __init__(self, node_station, node_line, indptr, indices, time, edge_line, lines, line_names, line_colours):
+        self.node_station = node_station
+        self.node_line = node_line
+        self.indptr = indptr
+        self.indices = indices
+        self.time = time
+        self.edge_line = edge_line
+        self.lines = lines
+        self.line_names = line_names
+        self.line_colours = line_colours
+
+    @property
+    def n_nodes(self):
+        return len(self.node_station)
+
+    @property
+    def stations(self):
+        """
+          sorted ids of the stations with at least one layer node
+        """
+        return np.unique(self.node_station)
+
+    def node(self, station, line):
+        """
+          index of the layer node of a station on a line
+        """
+        i = np.searchsorted(_node_keys(self.node_station, self.node_line), _node_keys(station, line))
+        if i == self.n_nodes or self.node_station[i] != station or self.node_line[i] != line:
+            raise KeyError(f"station {station} is not served by line {line}")
+        return int(i)
+
+    def edge_sources(self):
+        """
+          layer node every edge leaves from, aligned with indices
+        """
+        return np.repeat(np.arange(self.n_nodes, dtype='int32'), np.diff(self.indptr))
+
+    def adjacency(self, penalty=0.0):
+        """
+          weighted CSR matrix over the layer nodes, interchange edges cost penalty minutes
+        """
+        weights = np.where(self.edge_line == INTERCHANGE, np.float32(penalty), self.time)
+        # scipy drops explicit zeros as missing edges, free interchanges get a negligible cost instead
+        weights = np.maximum(weights, np.float32(1e-6))
+        return csr_matrix((weights, self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def line_links(self):
+        """
+          directed line edges as an (E, 3) int32 array of (from station, to station, line), in CSR order
+        """
+        mask = self.edge_line != INTERCHANGE
+        sources, targets = self.edge_sources()[mask], self.indices[mask]
+        return np.column_stack([self.node_station[sources], self.node_station[targets],
+                                self.edge_line[mask]]).astype('int32')
+
+    def line_link_times(self):
+        """
+          minutes of every directed line edge, aligned with line_links()
+        """
+        return self.time[self.edge_line != INTERCHANGE]
+
+    def layer(self, line):
+        """
+          one line as a CSR matrix of minutes between its stations, with the sorted station ids of its rows
+        """
+        links = self.line_links()
+        links, times = links[links[:, 2] == line], self.line_link_times()[links[:, 2] == line]
+        stations = np.unique(links[:, :2])
+        rows, cols = np.searchsorted(stations, links[:, 0]), np.searchsorted(stations, links[:, 1])
+        return csr_matrix((times, (rows, cols)), shape=(len(stations), len(stations))), stations
+
+    def station_lines(self):
+        """
+          number of lines serving each station, as a Series indexed by station id
+        """
+        return pd.Series(self.node_station).value_counts().sort_index().rename('lines')
+
+    def line_summary(self):
+        """
+          one row per line: 'line', 'name', 'colour', 'stations', 'links' (undirected), 'time' (minutes over all
+          its links) and 'interchanges' (its stations served by another line too)
+        """
+        links = self.line_links()
+        forward = links[links[:, 0] < links[:, 1]]
+        times = self.line_link_times()[links[:, 0] < links[:, 1]]
+        shared = self.station_lines()
+        rows = []
+        for line, name, colour in zip(self.lines, self.line_names, self.line_colours):
+            on_line = self.node_station[self.node_line == line]
+            own = forward[:, 2] == line
+            rows.append({'line': int(line), 'name': name, 'colour': colour, 'stations': len(on_line),
+                         'links': int(own.sum()), 'time': float(times[own].sum()),
+                         'interchanges': int((shared.reindex(on_line) > 1).sum())})
+        return pd.DataFrame(rows)
+
+    def line_colour(self):
+        """
+          dict of line id -> '#RRGGBB' colour
+        """
+        return dict(zip(self.lines.tolist(), self.line_colours.tolist()))
+
+    def line_name(self):
+        """
+          dict of line id -> line name
+        """
+        return dict(zip(self.lines.tolist(), self.line_names.tolist()))
+
+
+def build_multilayer(conns_df, lines_df):
+    """
+      builds the multi-layer network of a set of connections
+
+      parameters: conns_df - dataframe of connections with 'station1', 'station2', 'line' and 'time', a pair served
+                             by several lines has one row per line
+                  lines_df - dataframe of lines with 'line', 'name' and 'colour'
+    """
+    legs = conns_df.groupby(['station1', 'station2', 'line'], as_index=False)['time'].min()
+    ends = legs[['station1', 'station2', 'line', 'time']].to_numpy(dtype='int64')
+    pairs = np.unique(np.concatenate([ends[:, [0, 2]], ends[:, [1, 2]]]), axis=0)
+    node_station, node_line = pairs[:, 0].astype('int32'), pairs[:, 1].astype('int16')
+    # nodes are sorted by (station, line), a combined key finds them with one searchsorted
+    keys = _node_keys(node_station, node_line)
+    a = np.searchsorted(keys, _node_keys(ends[:, 0], ends[:, 2]))
+    b = np.searchsorted(keys, _node_keys(ends[:, 1], ends[:, 2]))
+
+    # interchange edges between every two nodes of a station: node i is paired with each node of its station
+    starts = np.flatnonzero(np.r_[True, node_station[1:] != node_station[:-1]])
+    counts = np.diff(np.r_[starts, len(node_station)])
+    size = np.repeat(counts, counts)
+    u = np.repeat(np.arange(len(node_station)), size)
+    v = np.repeat(np.repeat(starts, counts), size) + np.arange(len(u)) - np.repeat(np.cumsum(size) - size, size)
+    u, v = u[u != v], v[u != v]
+
+    rows = np.concatenate([a, b, u])
+    cols = np.concatenate([b, a, v])
+    time = np.concatenate([ends[:, 3], ends[:, 3], np.zeros(len(u))]).astype('float32')
+    edge_line = np.concatenate([ends[:, 2], ends[:, 2], np.full(len(u), INTERCHANGE)]).astype('int16')
+    order = np.lexsort((cols, rows))
+    indptr = np.searchsorted(rows[order], np.arange(len(node_station) + 1)).astype('int32')
+
+    lines_df = lines_df.sort_values('line')
+    return MultiLayerNetwork(node_station, node_line, indptr, cols[order].astype('int32'), time[order],
+                             edge_line[order], lines_df['line'].to_numpy(dtype='int16'),
+                             lines_df['name'].astype(str).to_numpy(),
+                             np.array([f"#{c}" for c in lines_df['colour'].astype(str)]))
+
+
+_lock = Lock()
+_networks = {}
+
+
+def get_multilayer():
+    """
+      multi-layer network of the bundled datasets, built once per process and data version
+    """
+    stamp = files_stamp(*(GRAPH_DATA / name for name in SOURCES))
+    with _lock:
+        cache_event("multilayer.memory", stamp in _networks)
+        if stamp not in _networks:
+            _networks.clear()
+            _networks[stamp] = build_multilayer(load_connections(), load_lines())
+        return _networks[stamp]
@@ -0,0 +1,133 @@
+"""
+The attributed tube network shared by the map and graph insight pages.
+
+A graph is built once per (year, month): stations become nodes carrying their name, zone and passenger count,
+connections become edges coloured by whether they cross a zone boundary and carrying the names and colour of
+the lines running along them (tube_twin.multilayer keeps one edge per line). Built graphs are kept in an
+in-memory LRU cache and pickled under the cache directory, so switching pages or months reuses them instead of
+rebuilding.
+Both caches are keyed by the source data files as well, a changed dataset gets a fresh graph.
+"""
+import pickle
+from collections import OrderedDict
+from threading import Lock
+
+import networkx as nx
+
+from tube_twin.data import files_stamp, load_connections, load_lines, load_stations
+from tube_twin.instrument import cache_event, timed
+from tube_twin.monthly import MonthlyMatrix, build_monthly, get_monthly
+from tube_twin.multilayer import build_multilayer
+from tube_twin.paths import GRAPH_DATA, cache_path
+
+SAME_ZONE_COLOR, DIFFERENT_ZONE_COLOR = "green", "red"
+# number of (year, month) graphs kept in memory per process
+CACHE_SIZE = 12
+SOURCES = ("london.stations.csv", "london.connections.csv", "london.lines.csv",
+           "station_counts_grouped_per_station.csv")
+
+_lock = Lock()
+_graphs = OrderedDict()
+
+
+@timed("network.stations_crowding_df")
+def stations_crowding_df(stations_df, crowding_df, year, month):
+    """
+      creates a dataframe with station details with their respective crowding information to be simulated from the graph network
+
+      parameters: stations_df - dataframe of London Underground station details
+                  crowding_df - MonthlyMatrix of the monthly crowding information of stations, or the crowding
+                                dataframe it is pivoted from
+                  year - year of interest
+                  month - month of interest
+    """
+    monthly = crowding_df if isinstance(crowding_df, MonthlyMatrix) else build_monthly(crowding_df)
+    # the month's column of the matrix, looked up for every station by NLC
+    counts = monthly.month(month, year)
+    final_df = stations_df.dropna(subset=['latitude', 'longitude'], axis=0)
+    return final_df.assign(**{'Count of Taps': final_df['NLC'].map(counts).astype('float64')})
+
+
+def month_options():
+    """
+      months with crowding data, as a dict of 'YYYY-MM' label -> (year, month name) accepted by get_network
+    """
+    monthly = get_monthly()
+    return {label: period for label, period, reported in zip(monthly.labels, monthly.periods, monthly.reported)
+            if reported}
+
+
+@timed("network.build")
+def build_network(stations_df, conns_df, crowding_df, year, month):
+    """
+      builds the station graph for a month, returns the graph and the (longitude, latitude) position of every node
+
+      parameters: stations_df - dataframe of London Underground station details
+                  conns_df - dataframe of connections between stations
+                  crowding_df - MonthlyMatrix (or dataframe) with monthly crowding information of stations
+                  year, month - month whose passenger counts are attached to the nodes
+    """
+    final_df = stations_crowding_df(stations_df, crowding_df, year, month)
+
+    G = nx.Graph()
+    G.add_nodes_from(final_df['id'])
+    G.add_edges_from(list(zip(conns_df['station1'], conns_df['station2'])))
+
+    # getting geographical coordinates
+    cordinates = list(zip(stations_df['longitude'], stations_df['latitude']))
+    positions = dict(zip(stations_df['id'], cordinates))
+
+    # setting node attributes
+    nx.set_node_attributes(G, name="Name", values=dict(zip(final_df.id, final_df.name)))
+    nx.set_node_attributes(G, name="Zone", values=dict(zip(final_df.id, final_df.zone)))
+    nx.set_node_attributes(G, name="Passenger_Count", values=dict(zip(final_df['id'], final_df['Count of Taps'])))
+
+    # visualizing stations based on zones
+    edge_attrs = {}
+    for start_node, end_node in G.edges():
+        same_zone = G.nodes[start_node]["Zone"] == G.nodes[end_node]["Zone"]
+        edge_attrs[(start_node, end_node)] = SAME_ZONE_COLOR if same_zone else DIFFERENT_ZONE_COLOR
+    nx.set_edge_attributes(G, edge_attrs, "edge_color")
+
+    # lines collapsed into the edge, for line-coloured rendering and tooltips
+    layers = build_multilayer(conns_df, load_lines())
+    names, colours = layers.line_name(), layers.line_colour()
+    lines = {}
+    for u, v, line in layers.line_links():
+        lines.setdefault((min(u, v), max(u, v)), set()).add(int(line))
+    edge_lines = {edge: sorted(lines[tuple(sorted(edge))]) for edge in G.edges()}
+    nx.set_edge_attributes(G, {edge: ", ".join(names[l] for l in ids) for edge, ids in edge_lines.items()}, "lines")
+    nx.set_edge_attributes(G, {edge: colours[ids[0]] for edge, ids in edge_lines.items()}, "line_color")
+
+    return G, positions
+
+
+def _load_or_build(year, month, stamp):
+    path = cache_path("network", f"{year}-{month}-{stamp}.pickle")
+    cache_event("network.disk", path.exists())
+    if path.exists():
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    built = build_network(load_stations(), load_connections(), get_monthly(), year, month)
+    with open(path, "wb") as f:
+        pickle.dump(built, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return built
+
+
+def get_network(year, month):
+    """
+      the attributed station graph and node positions for a month, built at most once per process and data version
+
+      the graph is a copy, callers are free to add their own node or edge attributes to it
+    """
+    key = (int(year), str(month), files_stamp(*(GRAPH_DATA / name for name in SOURCES)))
+    with _lock:
+        cache_event("network.memory", key in _graphs)
+        if key in _graphs:
+            _graphs.move_to_end(key)
+        else:
+            _graphs[key] = _load_or_build(*key)
+            while len(_graphs) > CACHE_SIZE:
+                _graphs.popitem(last=False)
+        G, positions = _graphs[key]
+    return G.copy(), dict(positions)
@@ -0,0 +1,55 @@
+"""
+Locations of the bundled datasets and of the on-disk cache shared by the pages.
+
+The cache root can be moved with the TUBE_TWIN_CACHE environment variable, e.g. to a volume shared by
+several dashboard workers.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+GRAPH_DATA = ROOT / "Graph_Data"
+FORECASTING_DATA = ROOT / "Forecasting_Data" / "data"
+CACHE_DIR = Path(os.environ.get("TUBE_TWIN_CACHE", ROOT / ".cache"))
+
+
+def cache_path(*parts):
+    """
+      returns a path inside the cache directory, creating its parent folders on the way
+
+      parameters: parts - path components relative to the cache root
+    """
+    path = CACHE_DIR.joinpath(*map(str, parts))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@contextmanager
+def staged_folder(folder, marker):
+    """
+      a fresh temporary folder next to folder, renamed to folder once the block completes so concurrent readers and
+      writers never see a half written one; when another process published a complete folder first (one holding
+      marker) it is kept and this copy discarded, an incomplete leftover is replaced
+
+      parameters: folder - final location of the folder
+                  marker - name of a file that only a complete folder holds
+    """
+    folder.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=folder.parent, prefix=f".{folder.name}.", suffix=".tmp"))
+    try:
+        yield staging
+        try:
+            os.replace(staging, folder)
+        except OSError:
+            if (folder / marker).exists():
+                return
+            # a folder left incomplete by an interrupted run, move it out of the way and publish ours
+            stale = Path(tempfile.mkdtemp(dir=folder.parent, prefix=f".{folder.name}.", suffix=".stale"))
+            os.replace(folder, stale / folder.name)
+            shutil.rmtree(stale, ignore_errors=True)
+            os.replace(staging, folder)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
@@ -0,0 +1,146 @@
+"""
+Client-side playback of crowding over time.
+
+The whole series (monthly counts, quarter-hour loads, ...) is shipped to the browser once inside a Bokeh
+ColumnDataSource, together with a slider and a play button whose CustomJS callbacks step through the frames.
+The animation runs entirely in the browser: the Streamlit script returns as soon as the chart is sent, instead
+of pushing rows from a Python loop.
+
+    st.bokeh_chart(timeline_playback(counts), use_container_width=True)
+    st.bokeh_chart(network_playback(G, positions, loads, slots), use_container_width=True)
+"""
+import numpy as np
+import pandas as pd
+from bokeh.layouts import column, row
+from bokeh.models import Button, ColumnDataSource, CustomJS, Slider
+from bokeh.palettes import Category10_10
+from bokeh.plotting import figure
+
+from tube_twin.graph_view import graph_figure, graph_renderer, graph_sources
+
+# milliseconds between two frames while playing
+INTERVAL = 150
+MIN_SIZE, MAX_SIZE = 4, 24
+
+# starts/stops a browser timer that advances the slider, wrapping around at the end
+PLAY_JS = """
+const key = 'tube_twin_play_' + slider.id;
+if (window[key]) {
+    clearInterval(window[key]);
+    window[key] = null;
+    button.label = '► Play';
+} else {
+    if (slider.value >= slider.end) { slider.value = slider.start; }
+    window[key] = setInterval(function () {
+        if (slider.value >= slider.end) {
+            clearInterval(window[key]);
+            window[key] = null;
+            button.label = '► Play';
+        } else {
+            slider.value = slider.value + 1;
+        }
+    }, interval);
+    button.label = '❚❚ Pause';
+}
+"""
+
+# shows the series up to the slider's frame
+TIMELINE_JS = """
+const n = slider.value + 1;
+const data = {};
+for (const name of Object.keys(full.data)) { data[name] = full.data[name].slice(0, n); }
+shown.data = data;
+slider.title = title + ': ' + labels[slider.value];
+"""
+
+# copies the slider's frame, sent in tenths of a pixel, into the node sizes
+NETWORK_JS = """
+const frame = frames.data[String(slider.value)];
+nodes.data['size'] = Float32Array.from(frame, (tenths) => tenths / 10);
+nodes.change.emit();
+slider.title = title + ': ' + labels[slider.value];
+"""
+
+
+def _controls(labels, title, interval):
+    slider = Slider(start=0, end=max(len(labels) - 1, 1), value=len(labels) - 1, step=1,
+                    title=f"{title}: {labels[-1]}", sizing_mode="stretch_width")
+    button = Button(label='► Play', width=90)
+    button.js_on_click(CustomJS(args=dict(slider=slider, button=button, interval=interval), code=PLAY_JS))
+    return slider, button
+
+
+def node_sizes(loads):
+    """
+      circle size per frame and node, the area grows with the load relative to the busiest node of any frame
+    """
+    loads = np.nan_to_num(np.asarray(loads, dtype='float64'), nan=0.0).clip(min=0)
+    top = loads.max(initial=0.0)
+    scaled = np.sqrt(loads / top) if top > 0 else np.zeros_like(loads)
+    return np.round(MIN_SIZE + (MAX_SIZE - MIN_SIZE) * scaled, 1).astype('float32')
+
+
+def timeline_playback(frame, title="Month", y_label="Count of Taps", interval=INTERVAL, width=700, height=400):
+    """
+      line chart of one or more series that plays back frame by frame in the browser
+
+      parameters: frame - dataframe indexed by the frame labels (e.g. 'Month-Year'), one column per line
+                  title - name of the frame axis shown on the slider
+                  interval - milliseconds between frames while playing
+    """
+    labels = [str(label) for label in frame.index]
+    full = ColumnDataSource({'x': np.arange(len(labels)),
+                             **{f"y{i}": frame[c].to_numpy(dtype='float64') for i, c in enumerate(frame.columns)}})
+    shown = ColumnDataSource({name: values for name, values in full.data.items()})
+
+    plot = figure(width=width, height=height, tools="pan,wheel_zoom,save,reset", active_scroll='wheel_zoom',
+                  x_range=(-0.5, len(labels) - 0.5), y_axis_label=y_label)
+    ticks = list(range(0, len(labels), max(len(labels) // 12, 1)))
+    plot.xaxis.ticker = ticks
+    plot.xaxis.major_label_overrides = {i: labels[i] for i in ticks}
+    plot.xaxis.major_label_orientation = 0.8
+    top = np.nanmax(frame.to_numpy(dtype='float64'), initial=0.0)
+    plot.y_range.start, plot.y_range.end = 0, top * 1.05 if top > 0 else 1
+    for i, name in enumerate(frame.columns):
+        color = Category10_10[i % len(Category10_10)]
+        plot.line('x', f"y{i}", source=shown, line_width=2, color=color, legend_label=str(name))
+        plot.circle('x', f"y{i}", source=shown, size=4, color=color)
+    plot.legend.location = "top_left"
+
+    slider, button = _controls(labels, title, interval)
+    slider.js_on_change('value', CustomJS(args=dict(slider=slider, full=full, shown=shown, labels=labels,
+                                                    title=title), code=TIMELINE_JS))
+    return column(plot, row(button, slider, sizing_mode="stretch_width"), sizing_mode="stretch_width")
+
+
+def network_playback(G, positions, loads, labels, title="Time", tooltips=None, interval=INTERVAL,
+                     width=700, height=500, node_columns=("Name", "Zone")):
+    """
+      network graph whose node sizes play back frame by frame in the browser
+
+      parameters: G, positions - graph and node positions as returned by get_network
+                  loads - dataframe with one row per frame (indexed by labels) and one column per node id,
+                          or an array of shape (frames, nodes) in the order of G.nodes
+                  labels - frame labels shown on the slider (e.g. quarter-hour slots)
+                  tooltips - bokeh hover tooltips over the node_columns attributes of G
+    """
+    nodes = list(G.nodes)
+    if isinstance(loads, pd.DataFrame):
+        loads = loads.reindex(columns=nodes).to_numpy(dtype='float64')
+    sizes = node_sizes(loads)
+    labels = [str(label) for label in labels]
+
+    plot = graph_figure(tooltips, width, height)
+    sources = graph_sources(G, positions, node_columns=node_columns)
+    node_source = sources.nodes
+    # the node source keeps the order of G.nodes
+    node_source.data['size'] = sizes[-1]
+    plot.renderers.append(graph_renderer(sources, size='size', fill_alpha=0.7))
+
+    # sizes have one decimal and stay below 25.5 pixels, frames go out as uint8 tenths of a pixel
+    tenths = np.round(sizes * 10).astype('uint8')
+    frames = ColumnDataSource({str(t): tenths[t] for t in range(len(tenths))})
+    slider, button = _controls(labels, title, interval)
+    slider.js_on_change('value', CustomJS(args=dict(slider=slider, nodes=node_source, frames=frames, labels=labels,
+                                                    title=title), code=NETWORK_JS))
+    return column(plot, row(button, slider, sizing_mode="stretch_width"), sizing_mode="stretch_width")
@@ -0,0 +1,149 @@
+"""
+Quarter-hour crowding profiles of 2020.csv as a dense array.
+
+The wide table (one row per station, day type and direction, one column per slot) is reshaped once into an int32
+array of shape (stations, day types, directions, slots), saved as .npy under the cache directory and
+memory-mapped on load. Questions such as "all stations at 08:00-08:15 on a Monday to Thursday" or "the peak
+quarter-hour of every station" are then plain slices and reductions over that array.
+
+    profiles = get_profiles()
+    profiles.at("0800-0815", day="MTT", direction="IN")     # Series NLC -> entries
+    profiles.peaks(day="SAT")                                # busiest slot per station
+"""
+import json
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from tube_twin.data import files_stamp, load_quarter_hours
+from tube_twin.paths import GRAPH_DATA, cache_path, staged_folder
+
+DAY_TYPES = ('MTT', 'FRI', 'SAT', 'SUN')
+DIRECTIONS = ('IN', 'OUT')
+
+
+class ProfileStore:
+    """
+      quarter-hour counts of one mode, counts[i, d, k, t] is the number of taps at station nlc[i] on day type
+      DAY_TYPES[d], direction DIRECTIONS[k] ('IN' entries, 'OUT' exits) in slot slots[t]
+    """
+
+    def __init__(self, nlc, names, slots, counts):
+        self.nlc = nlc
+        self.names = names
+        self.slots = list(slots)
+        self.counts = counts
+        self.position = {int(n): i for i, n in enumerate(nlc)}
+        self._slot_position = {s: t for t, s in enumerate(self.slots)}
+
+    def _axes(self, day, direction):
+        d = DAY_TYPES.index(day)
+        return d, slice(None) if direction is None else DIRECTIONS.index(direction)
+
+    def slot_index(self, slot):
+        """
+          position of a slot label ('0800-0815') or of the slot containing a time ('08:05', '0805')
+        """
+        if slot in self._slot_position:
+            return self._slot_position[slot]
+        hhmm = str(slot).replace(':', '')[:4]
+        for t, label in enumerate(self.slots):
+            start, end = label.split('-')
+            if start <= hhmm < end or (end < start and (hhmm >= start or hhmm < end)):
+                return t
+        raise KeyError(f"no quarter-hour slot for {slot!r}")
+
+    def day(self, day='MTT', direction=None):
+        """
+          (stations, slots) counts of a day type; entries plus exits when direction is None
+        """
+        d, k = self._axes(day, direction)
+        block = self.counts[:, d, k, :]
+        return np.asarray(block.sum(axis=1) if direction is None else block)
+
+    def at(self, slot, day='MTT', direction=None):
+        """
+          count of every station in one slot, as a Series indexed by NLC
+        """
+        d, k = self._axes(day, direction)
+        t = self.slot_index(slot)
+        values = self.counts[:, d, k, t]
+        values = values.sum(axis=1) if direction is None else values
+        return pd.Series(np.asarray(values), index=pd.Index(self.nlc, name='NLC'), name=self.slots[t])
+
+    def station(self, nlc, day='MTT', direction=None):
+        """
+          the day's profile of one station, as a Series indexed by slot
+        """
+        d, k = self._axes(day, direction)
+        values = self.counts[self.position[int(nlc)], d, k, :]
+        values = values.sum(axis=0) if direction is None else values
+        return pd.Series(np.asarray(values), index=pd.Index(self.slots, name='slot'), name=int(nlc))
+
+    def peaks(self, day='MTT', direction=None):
+        """
+          busiest slot of every station, dataframe indexed by NLC with 'Station', 'slot', 'count' and
+          'share' (the peak slot's fraction of the day)
+        """
+        counts = self.day(day, direction)
+        t = counts.argmax(axis=1)
+        peak = counts[np.arange(len(t)), t]
+        total = counts.sum(axis=1)
+        return pd.DataFrame({'Station': self.names, 'slot': np.asarray(self.slots)[t], 'count': peak,
+                             'share': np.divide(peak, total, out=np.zeros(len(t)), where=total > 0)},
+                            index=pd.Index(self.nlc, name='NLC'))
+
+    def matrix(self, nlc, day='MTT', direction='IN'):
+        """
+          (slots, len(nlc)) counts of the given NLC codes in this order, zero for codes without a profile
+        """
+        rows = np.array([self.position.get(int(n), -1) if n == n else -1 for n in nlc], dtype='int64')
+        block = self.day(day, direction).T
+        return np.where(rows >= 0, block[:, rows.clip(min=0)], 0)
+
+
+def build_profiles(q, mode='LU'):
+    """
+      ProfileStore of the rows of one mode of a load_quarter_hours() dataframe
+    """
+    q = q[q['Mode'] == mode]
+    slots = [c for c in q.columns if c[:4].isdigit()]
+    nlc = np.unique(q['NLC'].to_numpy(dtype='int32'))
+    counts = np.zeros((len(nlc), len(DAY_TYPES), len(DIRECTIONS), len(slots)), dtype='int32')
+    i = np.searchsorted(nlc, q['NLC'].to_numpy(dtype='int32'))
+    d = q['day'].map({day: n for n, day in enumerate(DAY_TYPES)}).to_numpy(dtype='int64')
+    k = q['dir'].map({direction: n for n, direction in enumerate(DIRECTIONS)}).to_numpy(dtype='int64')
+    np.add.at(counts, (i, d, k), q[slots].to_numpy(dtype='int32'))
+    names = q.drop_duplicates('NLC').set_index('NLC')['Station'].astype(str).reindex(nlc).to_numpy(dtype=object)
+    return ProfileStore(nlc, names, slots, counts)
+
+
+_lock = Lock()
+# mode -> (stamp of 2020.csv, ProfileStore), a newer 2020.csv replaces the store of each mode
+_stores = {}
+
+
+def get_profiles(mode='LU'):
+    """
+      ProfileStore of one mode ('LU', 'LO', 'DLR' or 'EZL'), built once and memory-mapped from the cache directory
+      afterwards until 2020.csv changes
+    """
+    stamp = files_stamp(GRAPH_DATA / '2020.csv')
+    with _lock:
+        cached = _stores.get(mode)
+        if cached is None or cached[0] != stamp:
+            folder = cache_path("profiles", f"{mode}-{stamp}")
+            if not (folder / "meta.json").exists():
+                store = build_profiles(load_quarter_hours(), mode)
+                with staged_folder(folder, "meta.json") as staging:
+                    np.save(staging / "nlc.npy", store.nlc)
+                    np.save(staging / "counts.npy", store.counts)
+                    with open(staging / "meta.json", "w") as f:
+                        json.dump({"slots": store.slots, "names": list(store.names)}, f)
+            with open(folder / "meta.json") as f:
+                meta = json.load(f)
+            cached = _stores[mode] = (stamp, ProfileStore(np.load(folder / "nlc.npy"),
+                                                          np.asarray(meta["names"], dtype=object), meta["slots"],
+                                                          np.load(folder / "counts.npy", mmap_mode='r')))
+        return cached[1]
@@ -0,0 +1,134 @@
+"""
+Versioned on-disk registry of fitted per-station SARIMAX models.
+
+Every station NLC has a folder holding one JSON file per trained version (order, fitted parameters, AIC,
+training time and a fingerprint of the series it was trained on) and a shared index.json pointing at the
+latest version of each station. An entry is stale once the station's data no longer matches its fingerprint.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, the process-wide lock still serializes the threads of one process
+    fcntl = None
+
+import numpy as np
+
+from tube_twin.paths import cache_path
+
+# bump when the layout of an entry changes, older registries are then ignored rather than misread
+REGISTRY_VERSION = 1
+
+# serializes the read-modify-write of index.json between the threads of a process (e.g. the job pool)
+_lock = Lock()
+
+
+def _root():
+    return cache_path("registry", f"v{REGISTRY_VERSION}", "index.json").parent
+
+
+def fingerprint(series):
+    """
+      short hash of a station series (months and counts), used to detect that a stored model is stale
+    """
+    h = hashlib.sha256()
+    h.update(",".join(map(str, series.index)).encode())
+    h.update(np.asarray(series, dtype='float64').tobytes())
+    return h.hexdigest()[:16]
+
+
+def read_index():
+    """
+      latest registry entry for every station, keyed by NLC as a string
+    """
+    path = _root() / "index.json"
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path, payload):
+    # write-then-rename so concurrent readers never see a half written file, the temporary file gets a unique
+    # name so concurrent writers never share it
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, prefix=path.name, suffix=".tmp", delete=False) as f:
+        json.dump(payload, f)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+@contextmanager
+def _locked():
+    # the thread lock plus an exclusive lock on index.lock, the cache may be shared by several processes
+    with _lock, open(_root() / "index.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def register(nlc, series, param, aic, params, s, trained_at=None, max_order=None):
+    """
+      stores a new model version for a station and points the index at it
+
+      parameters: nlc - station NLC code
+                  series - series the model was fitted on
+                  param - (p, q, P, Q) order
+                  aic - AIC of the fit
+                  params - fitted parameter vector
+                  s - seasonal period
+                  trained_at - ISO timestamp, defaults to now
+                  max_order - size of the order grid the model won, see forecast.parameter_grid
+    """
+    key = str(int(nlc))
+    with _locked():
+        index = read_index()
+        version = index.get(key, {}).get("version", 0) + 1
+        entry = {
+            "nlc": int(nlc),
+            "version": version,
+            "order": [int(v) for v in param],
+            "s": int(s),
+            "aic": float(aic),
+            "params": [float(v) for v in params],
+            "fingerprint": fingerprint(series),
+            "trained_at": trained_at or datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "max_order": None if max_order is None else int(max_order),
+        }
+        station_dir = _root() / key
+        station_dir.mkdir(exist_ok=True)
+        _write_json(station_dir / f"v{version}.json", entry)
+        index[key] = {k: entry[k] for k in ("version", "order", "s", "aic", "fingerprint", "trained_at", "max_order")}
+        _write_json(_root() / "index.json", index)
+    return entry
+
+
+def lookup(nlc, series=None, max_order=None):
+    """
+      returns the latest entry of a station, or None when it is missing, was trained on other data than series or
+      won a smaller order grid than max_order (entries of an unknown grid count as smaller)
+    """
+    meta = read_index().get(str(int(nlc)))
+    if meta is None:
+        return None
+    if series is not None and meta["fingerprint"] != fingerprint(series):
+        return None
+    if max_order is not None and (meta.get("max_order") or 0) < max_order:
+        return None
+    path = _root() / str(int(nlc)) / f"v{meta['version']}.json"
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
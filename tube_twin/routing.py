@@ -0,0 +1,175 @@
+"""
+Journey-time routing over the tube network.
+
+Routes are found on the multi-layer graph of tube_twin.multilayer: every (station, line) pair is a node,
+consecutive stations of a line are linked by the connection's 'time', and changing line at a station costs an
+interchange penalty. Shortest journey times between all stations are precomputed once with scipy's Dijkstra,
+together with the predecessor tree of every origin, and stored as compact NumPy arrays under the cache
+directory. They are memory-mapped on load, so a point query is an array lookup and an OD matrix is a single
+fancy-indexing operation.
+"""
+import hashlib
+import json
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from tube_twin.data import load_connections, load_lines, load_stations
+from tube_twin.instrument import cache_event, timed
+from tube_twin.multilayer import build_multilayer
+from tube_twin.paths import cache_path, staged_folder
+
+# minutes added for every change of line within a journey
+INTERCHANGE_PENALTY = 5.0
+
+
+def _line_graph(conns_df, station_ids, penalty):
+    # the multi-layer graph of the connections plus a boarding and an alighting node per station; returns it with
+    # the node bookkeeping
+    n = len(station_ids)
+    layers = build_multilayer(conns_df, load_lines())
+    # node layout: [0, n) boarding, [n, 2n) alighting, [2n, 2n + layer nodes) (station, line)
+    layer = layers.adjacency(penalty).tocoo()
+    served = np.isin(layers.node_station, station_ids)
+    nodes = 2 * n + np.flatnonzero(served)
+    position = np.searchsorted(station_ids, layers.node_station[served])
+    rows = np.concatenate([layer.row + 2 * n, position, nodes])
+    cols = np.concatenate([layer.col + 2 * n, nodes, n + position])
+    # scipy treats explicit zeros as missing edges, boarding and alighting get a negligible cost instead
+    weights = np.concatenate([layer.data, np.full(2 * len(nodes), 1e-6)])
+
+    size = 2 * n + layers.n_nodes
+    node_station = np.concatenate([station_ids, station_ids, layers.node_station]).astype('int32')
+    node_line = np.concatenate([np.full(2 * n, -1), layers.node_line]).astype('int16')
+    return csr_matrix((weights, (rows, cols)), shape=(size, size)), node_station, node_line
+
+
+class RoutingTable:
+    """
+      all-pairs journey times and shortest paths between stations
+
+      times[i, j] is the journey time in minutes from stations[i] to stations[j] (inf when unreachable),
+      pred[i] is the predecessor tree of origin i over the line-aware graph, used to rebuild paths
+    """
+
+    def __init__(self, stations, times, pred, node_station, node_line):
+        self.stations = stations
+        self.times = times
+        self.pred = pred
+        self.node_station = node_station
+        self.node_line = node_line
+        self.position = {int(s): i for i, s in enumerate(stations)}
+        # identifies the network and penalty of tables loaded through get_routing, None for ad hoc tables
+        self.key = None
+
+    def indices(self, station_ids):
+        """
+          row/column positions of station ids in the matrices, vectorized (stations are stored sorted)
+        """
+        station_ids = np.asarray(station_ids)
+        found = np.searchsorted(self.stations, station_ids).clip(max=len(self.stations) - 1)
+        if not np.array_equal(self.stations[found], station_ids):
+            raise KeyError(f"unknown station id in {station_ids[self.stations[found] != station_ids][:5]}")
+        return found
+
+    def journey_time(self, origin, destination):
+        """
+          shortest journey time in minutes between two station ids
+        """
+        return float(self.times[self.position[origin], self.position[destination]])
+
+    def legs(self, origin, destination):
+        """
+          the shortest journey as a list of (station id, line) stops, empty when the destination is unreachable
+        """
+        i, j = self.position[origin], self.position[destination]
+        n = len(self.stations)
+        pred = self.pred[i]
+        node, stops = n + j, []
+        while node >= 0 and node != i:
+            if node >= 2 * n:
+                stops.append((int(self.node_station[node]), int(self.node_line[node])))
+            node = pred[node]
+        if node != i:
+            return []
+        return stops[::-1]
+
+    def path(self, origin, destination):
+        """
+          station ids visited on the shortest journey, interchanges appear once
+        """
+        path = []
+        for station, _ in self.legs(origin, destination):
+            if not path or path[-1] != station:
+                path.append(station)
+        return path
+
+    def od_matrix(self, origins, destinations):
+        """
+          journey times from every origin to every destination, shape (len(origins), len(destinations))
+        """
+        return np.asarray(self.times[np.ix_(self.indices(origins), self.indices(destinations))])
+
+    def od_pairs(self, origins, destinations):
+        """
+          journey times of the pairs (origins[k], destinations[k])
+        """
+        return np.asarray(self.times[self.indices(origins), self.indices(destinations)])
+
+
+def build_routing(conns_df, station_ids, penalty=INTERCHANGE_PENALTY):
+    """
+      computes the routing table of a network
+
+      parameters: conns_df - dataframe of connections with 'station1', 'station2', 'line' and 'time'
+                  station_ids - stations to route between
+                  penalty - minutes added per change of line
+    """
+    station_ids = np.asarray(sorted(int(s) for s in station_ids), dtype='int32')
+    graph, node_station, node_line = _line_graph(conns_df, station_ids, penalty)
+    n = len(station_ids)
+    dist, pred = dijkstra(graph, directed=True, indices=np.arange(n), return_predecessors=True)
+    # drop the boarding/alighting costs again, they are a few microminutes per journey
+    times = np.round(dist[:, n:2 * n], 4).astype('float32')
+    np.fill_diagonal(times, 0.0)
+    return RoutingTable(station_ids, times, pred.astype('int32'), node_station, node_line)
+
+
+def _network_key(conns_df, station_ids, penalty):
+    h = hashlib.sha1(repr(float(penalty)).encode())
+    h.update(np.asarray(sorted(int(s) for s in station_ids)).tobytes())
+    h.update(conns_df[['station1', 'station2', 'line', 'time']].to_numpy(dtype='float64').tobytes())
+    return h.hexdigest()[:16]
+
+
+_tables = {}
+
+
+def get_routing(conns_df=None, stations_df=None, penalty=INTERCHANGE_PENALTY):
+    """
+      routing table of the network, computed once and memory-mapped from the cache directory afterwards
+
+      parameters: conns_df, stations_df - network to route on, the bundled datasets when omitted
+                  penalty - minutes added per change of line
+    """
+    conns_df = load_connections() if conns_df is None else conns_df
+    stations_df = load_stations() if stations_df is None else stations_df
+    key = _network_key(conns_df, stations_df['id'], penalty)
+    cache_event("routing.memory", key in _tables)
+    if key not in _tables:
+        folder = cache_path("routing", key)
+        names = ("stations", "times", "pred", "node_station", "node_line")
+        cache_event("routing.disk", (folder / "meta.json").exists())
+        if not (folder / "meta.json").exists():
+            with timed("routing.build"):
+                table = build_routing(conns_df, stations_df['id'], penalty)
+            # the scenario pool may build the same table in several processes, each writes its own copy
+            with staged_folder(folder, "meta.json") as staging:
+                for name in names:
+                    np.save(staging / f"{name}.npy", getattr(table, name))
+                with open(staging / "meta.json", "w") as f:
+                    json.dump({"penalty": float(penalty), "stations": len(table.stations)}, f)
+        _tables[key] = RoutingTable(*(np.load(folder / f"{name}.npy", mmap_mode='r') for name in names))
+        _tables[key].key = key
+    return _tables[key]
@@ -0,0 +1,236 @@
+"""
+Disruption and what-if scenarios.
+
+A scenario closes or slows connections of london.connections.csv. Running it rebuilds the routing table on the
+modified network, re-simulates a day of passenger flows and updates the centrality store incrementally, then
+compares everything with the undisrupted network. Results are cached under the cache directory by a hash of the
+scenario and of the source data, so a repeated run only reads them back, and batches of scenarios (e.g. every
+single-link failure) run across a process pool.
+
+    closure = scenario(removed=[(107, 192, 11)], name="Victoria line Green Park - Oxford Circus closed")
+    result = run_scenario(closure)
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from tube_twin.centrality import get_store, weighted_graph
+from tube_twin.data import load_connections, load_stations
+from tube_twin.paths import GRAPH_DATA, cache_path, staged_folder
+from tube_twin.routing import INTERCHANGE_PENALTY, build_routing
+from tube_twin.simulation import DEFAULT_BETA, simulate
+
+# bump when the content of a stored result changes, so old results are recomputed
+RESULT_VERSION = 3
+
+
+def scenario(removed=(), slowed=None, name=None):
+    """
+      describes a scenario
+
+      parameters: removed - connections to close as (station1, station2) or (station1, station2, line) tuples,
+                            without a line every line between the two stations is closed
+                  slowed - dict of the same keys -> factor their journey time is multiplied by
+                  name - label shown in reports
+    """
+    def canonical(key):
+        u, v, *line = key
+        return [min(int(u), int(v)), max(int(u), int(v)), int(line[0]) if line and line[0] is not None else None]
+
+    return {
+        "name": name,
+        "removed": sorted(canonical(k) for k in removed),
+        "slowed": sorted(canonical(k) + [float(f)] for k, f in (slowed or {}).items()),
+    }
+
+
+def scenario_hash(spec, day='MTT', beta=DEFAULT_BETA, penalty=INTERCHANGE_PENALTY):
+    """
+      identifies the result of a scenario: its changes, the simulation settings and the source data files
+
+      the name is left out, the same changes under another label share one result (see run_scenario)
+    """
+    stamps = [os.stat(GRAPH_DATA / name) for name in ("london.connections.csv", "london.stations.csv", "2020.csv")]
+    payload = json.dumps({"removed": spec["removed"], "slowed": spec["slowed"], "day": day, "beta": beta,
+                          "penalty": penalty, "version": RESULT_VERSION,
+                          "data": [(s.st_mtime_ns, s.st_size) for s in stamps]}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _matches(conns_df, key):
+    u, v, line = key[:3]
+    pair = (((conns_df['station1'] == u) & (conns_df['station2'] == v)) |
+            ((conns_df['station1'] == v) & (conns_df['station2'] == u)))
+    return pair if line is None else pair & (conns_df['line'] == line)
+
+
+def apply_scenario(conns_df, spec):
+    """
+      the connections of the network after the scenario's closures and slowdowns
+    """
+    conns_df = conns_df.astype({'time': 'float64'})
+    for key in spec["slowed"]:
+        conns_df.loc[_matches(conns_df, key), 'time'] *= key[3]
+    closed = np.zeros(len(conns_df), dtype=bool)
+    for key in spec["removed"]:
+        closed |= _matches(conns_df, key).to_numpy()
+    return conns_df[~closed].reset_index(drop=True)
+
+
+def single_link_failures(conns_df=None):
+    """
+      one scenario per connection of the network, closing only that line between its two stations
+    """
+    conns_df = load_connections() if conns_df is None else conns_df
+    return [scenario(removed=[(u, v, line)], name=f"{u}-{v} line {line} closed")
+            for u, v, line in conns_df[['station1', 'station2', 'line']].itertuples(index=False)]
+
+
+def most_affected(result, n=10):
+    """
+      the n stations of a scenario result whose through traffic changed most, with their 'Station' name
+    """
+    names = dict(zip(load_stations()['id'], load_stations()['name']))
+    stations = result["stations"].assign(Station=lambda d: d['id'].map(names))
+    return stations.reindex(stations['delta_through'].abs().sort_values(ascending=False).index).head(n)
+
+
+def _result_paths(folder):
+    return folder / "summary.json", folder / "stations.parquet", folder / "links.parquet"
+
+
+def load_result(digest):
+    """
+      a stored scenario result as a dict with 'summary', 'stations' and 'links', None when it was never run
+    """
+    summary, stations, links = _result_paths(cache_path("scenarios", digest))
+    if not summary.exists():
+        return None
+    with open(summary) as f:
+        return {"summary": json.load(f), "stations": pd.read_parquet(stations), "links": pd.read_parquet(links)}
+
+
+def _simulate_network(conns_df, stations_df, day, beta, penalty):
+    routing = build_routing(conns_df, stations_df['id'], penalty)
+    flows = simulate(day=day, beta=beta, routing=routing, conns_df=conns_df, stations_df=stations_df,
+                     keep_trips=True)
+    daily_trips = flows.trips.sum(axis=0, dtype='float64')
+    return routing, flows, daily_trips
+
+
+def _evaluate(spec, day, beta, penalty):
+    stations_df = load_stations()
+    base_conns = load_connections()
+    conns_df = apply_scenario(base_conns, spec)
+    base = run_scenario(scenario(), day=day, beta=beta, penalty=penalty) if spec["removed"] or spec["slowed"] else None
+
+    routing, flows, daily_trips = _simulate_network(conns_df, stations_df, day, beta, penalty)
+    times = np.asarray(routing.times, dtype='float64')
+    reachable = np.isfinite(times)
+    passenger_minutes = float((daily_trips * np.where(reachable, times, 0.0)).sum())
+
+    # centrality only recomputes the sources the changed edges can affect
+    store = get_store().copy()
+    before = weighted_graph(base_conns, nodes=stations_df['id'])
+    after = weighted_graph(conns_df, nodes=stations_df['id'])
+    removed = [(u, v) for u, v in before.edges() if not after.has_edge(u, v)]
+    changed = {(u, v): d['time'] for u, v, d in after.edges(data=True)
+               if not before.has_edge(u, v) or before[u][v]['time'] != d['time']}
+    recomputed = store.update_edges(removed=removed, changed=changed)
+
+    stations = pd.DataFrame({'id': flows.stations,
+                             'entries': flows.entries.sum(axis=0), 'exits': flows.exits.sum(axis=0),
+                             'through': flows.through.sum(axis=0)})
+    stations = stations.join(store.metrics, on='id')
+    links = pd.DataFrame({'station1': flows.links[:, 0], 'station2': flows.links[:, 1],
+                          'load': flows.link_load.sum(axis=0)})
+    summary = {
+        "removed": len(spec["removed"]),
+        "slowed": len(spec["slowed"]),
+        "trips": float(daily_trips.sum()),
+        "mean_journey_time": passenger_minutes / max(float(daily_trips.sum()), 1e-9),
+        "unreachable_pairs": int((~reachable).sum()),
+        "max_link_load": float(links['load'].max()),
+        "recomputed_sources": int(len(recomputed)),
+    }
+    if base is not None:
+        summary["delta_mean_journey_time"] = summary["mean_journey_time"] - base["summary"]["mean_journey_time"]
+        summary["new_unreachable_pairs"] = summary["unreachable_pairs"] - base["summary"]["unreachable_pairs"]
+        summary["delta_max_link_load"] = summary["max_link_load"] - base["summary"]["max_link_load"]
+        for column in ('through', 'betweenness', 'closeness'):
+            stations[f'delta_{column}'] = stations[column].to_numpy() - base["stations"][column].to_numpy()
+        links = links.merge(base["links"].rename(columns={'load': 'base_load'}),
+                            on=['station1', 'station2'], how='left')
+    return summary, stations, links
+
+
+def run_scenario(spec, day='MTT', beta=DEFAULT_BETA, penalty=INTERCHANGE_PENALTY):
+    """
+      runs a scenario, or reads its result back when it was run before
+
+      parameters: spec - scenario as returned by scenario()
+                  day - day type simulated: 'MTT', 'FRI', 'SAT' or 'SUN'
+                  beta - gravity model deterrence per minute
+                  penalty - interchange penalty of the routing, in minutes
+
+      returns a dict with the run's 'summary' (journey times, unreachable pairs, loads, deltas to the undisrupted
+      network), per-station 'stations' and per-link 'links' dataframes
+    """
+    digest = scenario_hash(spec, day, beta, penalty)
+    result = load_result(digest)
+    if result is not None:
+        return _named(result, spec)
+    summary, stations, links = _evaluate(spec, day, beta, penalty)
+    summary["hash"] = digest
+    # written aside and renamed into place, the pool's workers may finish the same scenario concurrently
+    with staged_folder(cache_path("scenarios", digest), "summary.json") as staging:
+        summary_path, stations_path, links_path = _result_paths(staging)
+        stations.to_parquet(stations_path, index=False)
+        links.to_parquet(links_path, index=False)
+        with open(summary_path, "w") as f:
+            json.dump(summary, f)
+    return _named(load_result(digest), spec)
+
+
+def _named(result, spec):
+    # stored results are shared by every label of the same changes, the summary takes the name of this spec
+    result["summary"] = {"name": spec["name"], **result["summary"]}
+    return result
+
+
+def _run_summary(spec, day, beta, penalty):
+    return run_scenario(spec, day, beta, penalty)["summary"]
+
+
+def run_scenarios(specs, day='MTT', beta=DEFAULT_BETA, penalty=INTERCHANGE_PENALTY, workers=None, progress=None):
+    """
+      runs many scenarios across a process pool, already stored results are read back instead of recomputed
+
+      parameters: specs - scenarios as returned by scenario()
+                  workers - pool size, defaults to the number of CPUs
+                  progress - optional callable(done, total) invoked as scenarios finish
+
+      returns a dataframe with one summary row per scenario, in the order of specs
+    """
+    summaries = [None] * len(specs)
+    todo = []
+    for i, spec in enumerate(specs):
+        stored = load_result(scenario_hash(spec, day, beta, penalty))
+        if stored is None:
+            todo.append(i)
+        else:
+            summaries[i] = _named(stored, spec)["summary"]
+    if todo:
+        # the baseline is shared by every scenario, compute it once before fanning out
+        run_scenario(scenario(), day, beta, penalty)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            futures = {pool.submit(_run_summary, specs[i], day, beta, penalty): i for i in todo}
+            for done, future in enumerate(as_completed(futures), start=1):
+                summaries[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done, len(todo))
+    return pd.DataFrame(summaries)
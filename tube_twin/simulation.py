@@ -0,0 +1,327 @@
+"""
+Passenger-flow simulation on the station graph.
+
+For every quarter-hour slot of a day the station entries and exits (the 2020 quarter-hour profiles, optionally
+rescaled to a month's entry/exit totals) are turned into an origin-destination matrix with a doubly constrained
+gravity model, whose deterrence is the journey time of the routing table. The trips are then assigned
+all-or-nothing to the shortest paths, which gives the load on every directed link of every line (summed per
+station pair and per line) and the number of passengers passing through every station per slot.
+
+Stations within walking distance of each other (see tube_twin.spatial) give the gravity model a second way to
+travel: a pair's cost is the quicker of the tube journey and the walk, and trips that are quicker on foot are
+counted as walked instead of being assigned to the network.
+
+All 96 slots are handled at once: the gravity balancing is a handful of matrix products over (slot, station)
+arrays, and assignment is one product with a sparse path incidence matrix that is built once per routing table.
+"""
+import calendar
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from tube_twin.data import load_connections, load_entry_exit, load_lines, load_stations
+from tube_twin.instrument import cache_event, timed
+from tube_twin.multilayer import build_multilayer
+from tube_twin.paths import cache_path
+from tube_twin.profiles import get_profiles
+from tube_twin.routing import get_routing
+from tube_twin.spatial import walking_times
+
+# deterrence per minute of journey time in the gravity model
+DEFAULT_BETA = 0.1
+
+
+def slot_labels():
+    """
+      the 96 quarter-hour slot labels of the profiles, '0500-0515' to '0445-0500'
+    """
+    return get_profiles().slots
+
+
+def demand_profiles(station_ids, day='MTT', year=None, month=None, stations_df=None):
+    """
+      quarter-hour entries and exits of a day type, two arrays of shape (96, len(station_ids))
+
+      parameters: station_ids - stations (ids of london.stations.csv) to return, in this order
+                  day - day type of the profiles: 'MTT', 'FRI', 'SAT' or 'SUN'
+                  year, month - when given, every station's profile is rescaled so that its day total matches the
+                                month's average daily entries/exits in Entry_and_Exit data.csv
+                  stations_df - station details used to map ids to NLC codes
+    """
+    stations_df = load_stations() if stations_df is None else stations_df
+    nlc = stations_df.set_index('id')['NLC'].reindex(station_ids).to_numpy(dtype='float64', na_value=np.nan)
+
+    store = get_profiles('LU')
+    profiles = []
+    for direction, transaction in (('IN', 'Entry'), ('OUT', 'Exit')):
+        counts = store.matrix(nlc, day, direction).T.astype('float64')
+        if year is not None and month is not None:
+            ee = load_entry_exit()
+            ee = ee[(ee['Calendar Year (Travel Date)'] == int(year)) &
+                    (ee['Month Name (Travel Date)'] == str(month)) & (ee['Transaction Type'] == transaction)]
+            month_number = list(calendar.month_name).index(str(month))
+            daily = (ee.groupby('Travel Location No')['Count of Taps'].sum().reindex(nlc).to_numpy(dtype='float64')
+                     / calendar.monthrange(int(year), month_number)[1])
+            total = counts.sum(axis=1)
+            scale = np.where((total > 0) & np.isfinite(daily), daily / np.where(total > 0, total, 1), 1.0)
+            counts *= scale[:, None]
+        profiles.append(counts.T)
+    return profiles[0], profiles[1]
+
+
+def gravity_od(entries, exits, cost, beta=DEFAULT_BETA, iterations=50, tol=1e-6):
+    """
+      doubly constrained gravity model for every slot at once, returns trips of shape (slots, origins, destinations)
+
+      parameters: entries, exits - (slots, stations) trip productions and attractions
+                  cost - (stations, stations) journey times, inf where unreachable
+                  beta - deterrence per minute, trips fall off as exp(-beta * time)
+                  iterations, tol - Furness balancing stops after iterations or once the row totals are within tol
+    """
+    deterrence = np.where(np.isfinite(cost), np.exp(-beta * np.where(np.isfinite(cost), cost, 0.0)), 0.0)
+    np.fill_diagonal(deterrence, 0.0)
+    O = np.asarray(entries, dtype='float64')
+    D = np.asarray(exits, dtype='float64')
+    # exits are rescaled to the entries of the slot, every trip needs both ends
+    D_total = D.sum(axis=1, keepdims=True)
+    D = D * np.divide(O.sum(axis=1, keepdims=True), D_total, out=np.zeros_like(D_total), where=D_total > 0)
+
+    b = np.ones_like(D)
+    for _ in range(iterations):
+        denom = (b * D) @ deterrence.T
+        a = np.divide(1.0, denom, out=np.zeros_like(denom), where=denom > 0)
+        denom = (a * O) @ deterrence
+        b = np.divide(1.0, denom, out=np.zeros_like(denom), where=denom > 0)
+        # attractions now hold exactly, stop once the productions do as well
+        reach = (b * D) @ deterrence.T
+        produced = a * O * reach
+        if np.abs(produced - O)[reach > 0].max(initial=0.0) <= tol * max(O.max(initial=0.0), 1.0):
+            break
+    return ((a * O)[:, :, None] * deterrence[None] * (b * D)[:, None, :]).astype('float32')
+
+
+def network_links(conns_df=None):
+    """
+      directed links of the network as an (L, 2) array of (from station, to station), both directions of every
+      connection, lines serving the same pair share a link
+    """
+    conns_df = load_connections() if conns_df is None else conns_df
+    pairs = conns_df[['station1', 'station2']].to_numpy(dtype='int32')
+    return np.unique(np.concatenate([pairs, pairs[:, ::-1]]), axis=0)
+
+
+def line_links(conns_df=None):
+    """
+      directed links of every line as an (E, 3) array of (from station, to station, line), both directions of
+      every connection, see tube_twin.multilayer
+    """
+    conns_df = load_connections() if conns_df is None else conns_df
+    return build_multilayer(conns_df, load_lines()).line_links()
+
+
+def collapse_lines(by_line, links):
+    """
+      sparse (E, L) matrix summing the loads of the line links onto the station-pair links they run along
+    """
+    index = {(int(u), int(v)): k for k, (u, v) in enumerate(links)}
+    cols = [index[(int(u), int(v))] for u, v, _ in by_line]
+    return sparse.csr_matrix((np.ones(len(cols), dtype='float32'), (np.arange(len(cols)), cols)),
+                             shape=(len(cols), len(links)))
+
+
+def path_incidence(routing, links):
+    """
+      sparse incidence of the shortest paths between all station pairs
+
+      parameters: routing - routing table the paths are taken from
+                  links - (E, 3) directed line links of line_links(), the line of every hop is kept
+
+      returns (link_incidence, station_incidence): row o * n + d marks the line links used, respectively the
+      intermediate stations passed, on the route from station o to station d
+    """
+    key = getattr(routing, 'key', None)
+    path = cache_path("simulation", f"line-incidence-{key}-{len(links)}.npz") if key else None
+    cache_event("simulation.incidence", path is not None and path.exists())
+    if path is not None and path.exists():
+        with np.load(path) as f:
+            shapes = f['shapes']
+            link_inc = sparse.csr_matrix((f['ld'], f['li'], f['lp']), shape=tuple(shapes[0]))
+            station_inc = sparse.csr_matrix((f['sd'], f['si'], f['sp']), shape=tuple(shapes[1]))
+        return link_inc, station_inc
+
+    n = len(routing.stations)
+    pred = np.asarray(routing.pred)
+    node_station = np.asarray(routing.node_station, dtype='int64')
+    node_line = np.asarray(routing.node_line, dtype='int64')
+    # line links are found by one searchsorted on a combined (from, to, line) key
+    links = np.asarray(links, dtype='int64')
+    base = max(int(links[:, :2].max(initial=0)), int(node_station.max(initial=0))) + 1
+    lines = max(int(links[:, 2].max(initial=0)), int(node_line.max(initial=0))) + 1
+    link_keys = (links[:, 0] * base + links[:, 1]) * lines + links[:, 2]
+    order = np.argsort(link_keys)
+
+    # every (origin, destination) tree is walked back from the destination at once, one node per step; a change
+    # of station is a hop along the line of the node reached
+    rows = np.arange(n * n)
+    origin = rows // n
+    node = pred[origin, n + rows % n].astype('int64')
+    last = np.full(n * n, -1)
+    stops = np.zeros(n * n, dtype='int64')
+    hop_rows, hop_keys, stop_rows, stop_stations, stop_index = [], [], [], [], []
+    active = node >= 2 * n
+    while active.any():
+        rows, node = rows[active], node[active]
+        station = node_station[node]
+        new = station != last[rows]
+        hop = new & (last[rows] >= 0)
+        hop_rows.append(rows[hop])
+        hop_keys.append((station[hop] * base + last[rows[hop]]) * lines + node_line[node[hop]])
+        stop_rows.append(rows[new])
+        stop_stations.append(station[new])
+        stop_index.append(stops[rows[new]])
+        last[rows[new]] = station[new]
+        stops[rows[new]] += 1
+        node = pred[origin[rows], node].astype('int64')
+        active = node >= 2 * n
+        # walks ending anywhere but at the origin's boarding node are unreachable pairs
+        ended, end = rows[~active], node[~active]
+        stops[ended[end != origin[ended]]] = 0
+    valid = stops >= 2
+
+    link_rows, hop_keys = np.concatenate(hop_rows), np.concatenate(hop_keys)
+    keep = valid[link_rows]
+    link_rows = link_rows[keep]
+    link_cols = order[np.searchsorted(link_keys, hop_keys[keep], sorter=order)]
+    station_rows, stop_stations, stop_index = (np.concatenate(a) for a in (stop_rows, stop_stations, stop_index))
+    # the destination is the first stop met and the origin the last one, the ones between are passed through
+    keep = valid[station_rows] & (stop_index > 0) & (stop_index < stops[station_rows] - 1)
+    station_rows = station_rows[keep]
+    station_cols = routing.indices(stop_stations[keep])
+
+    link_inc = sparse.csr_matrix((np.ones(len(link_rows), dtype='float32'), (link_rows, link_cols)),
+                                 shape=(n * n, len(links)))
+    station_inc = sparse.csr_matrix((np.ones(len(station_rows), dtype='float32'), (station_rows, station_cols)),
+                                    shape=(n * n, n))
+    if path is not None:
+        np.savez(path, shapes=np.array([link_inc.shape, station_inc.shape]),
+                 ld=link_inc.data, li=link_inc.indices, lp=link_inc.indptr,
+                 sd=station_inc.data, si=station_inc.indices, sp=station_inc.indptr)
+    return link_inc, station_inc
+
+
+class FlowResult:
+    """
+      outcome of a simulated day, all arrays have one row per quarter-hour slot
+
+      entries, exits, through - (slots, stations) passengers entering, leaving and passing through each station
+      link_load - (slots, links) passengers on each directed link
+      line_load - (slots, line links) passengers on each directed link of each line, see line_links()
+      walked - (slots, stations) trips from each station made on foot to a nearby station, left off the network
+    """
+
+    def __init__(self, slots, stations, links, entries, exits, through, link_load, trips=None, line_links=None,
+                 line_load=None, walked=None):
+        self.slots = slots
+        self.stations = stations
+        self.links = links
+        self.entries = entries
+        self.exits = exits
+        self.through = through
+        self.link_load = link_load
+        self.trips = trips
+        self.line_links = line_links
+        self.line_load = line_load
+        self.walked = walked
+
+    def station_frame(self):
+        """
+          long dataframe with 'slot', 'id', 'entries', 'exits', 'through' and 'walked' per station and slot
+        """
+        n_slots, n = self.entries.shape
+        walked = np.zeros_like(self.entries) if self.walked is None else self.walked
+        return pd.DataFrame({'slot': np.repeat(self.slots, n), 'id': np.tile(self.stations, n_slots),
+                             'entries': self.entries.ravel(), 'exits': self.exits.ravel(),
+                             'through': self.through.ravel(), 'walked': walked.ravel()})
+
+    def link_frame(self):
+        """
+          long dataframe with 'slot', 'station1', 'station2', 'load' per directed link and slot
+        """
+        n_slots, n_links = self.link_load.shape
+        return pd.DataFrame({'slot': np.repeat(self.slots, n_links),
+                             'station1': np.tile(self.links[:, 0], n_slots),
+                             'station2': np.tile(self.links[:, 1], n_slots),
+                             'load': self.link_load.ravel()})
+
+    def station_loads(self):
+        """
+          (slots, stations) dataframe of the passengers entering, leaving or passing through each station
+        """
+        return pd.DataFrame(self.entries + self.exits + self.through, index=self.slots, columns=self.stations)
+
+    def line_loads(self, names=None):
+        """
+          (slots, lines) dataframe of the passengers on all links of each line, columns named by names (id -> name)
+        """
+        lines, column = np.unique(self.line_links[:, 2], return_inverse=True)
+        by_line = sparse.csr_matrix((np.ones(len(column), dtype='float32'), (np.arange(len(column)), column)),
+                                    shape=(len(column), len(lines)))
+        names = dict(zip(load_lines()['line'], load_lines()['name'].astype(str))) if names is None else names
+        return pd.DataFrame(np.asarray(self.line_load @ by_line), index=self.slots,
+                            columns=[names.get(int(line), str(line)) for line in lines])
+
+    def busiest_links(self, slot, n=10, names=None):
+        """
+          the n most loaded links during a slot, with 'From' and 'To' station names taken from names (id -> name)
+        """
+        links = self.link_frame()
+        links = links[links['slot'] == slot].nlargest(n, 'load')
+        names = dict(zip(load_stations()['id'], load_stations()['name'])) if names is None else names
+        return links.assign(From=links['station1'].map(names), To=links['station2'].map(names))
+
+
+def assign(trips, link_inc, station_inc):
+    """
+      all-or-nothing assignment of (slots, origins, destinations) trips, returns (link_load, through)
+    """
+    flat = trips.reshape(trips.shape[0], -1).T
+    return np.asarray((link_inc.T @ flat).T), np.asarray((station_inc.T @ flat).T)
+
+
+@timed("simulation.simulate")
+def simulate(day='MTT', year=None, month=None, beta=DEFAULT_BETA, routing=None, conns_df=None,
+             stations_df=None, keep_trips=False, walk=True):
+    """
+      simulates the passenger flows of one day in quarter-hour slots
+
+      parameters: day - day type of the demand profiles: 'MTT', 'FRI', 'SAT' or 'SUN'
+                  year, month - optional month whose entry/exit totals the profiles are rescaled to
+                  beta - gravity model deterrence per minute of journey time
+                  routing - routing table to assign on, built from conns_df/stations_df when omitted
+                  conns_df, stations_df - network to simulate, the bundled datasets when omitted
+                  keep_trips - keep the (slots, stations, stations) OD trips on the result (the tube trips only)
+                  walk - let trips between stations within walking distance go on foot when that is quicker
+    """
+    conns_df = load_connections() if conns_df is None else conns_df
+    stations_df = load_stations() if stations_df is None else stations_df
+    routing = get_routing(conns_df, stations_df) if routing is None else routing
+    stations = np.asarray(routing.stations)
+    links, by_line = network_links(conns_df), line_links(conns_df)
+
+    entries, exits = demand_profiles(stations, day=day, year=year, month=month, stations_df=stations_df)
+    times = np.asarray(routing.times)
+    if walk:
+        walking = walking_times(stations)
+        on_foot = walking < times
+        trips = gravity_od(entries, exits, np.fmin(times, walking), beta=beta)
+        walked = np.where(on_foot, trips, 0).sum(axis=2)
+        trips[:, on_foot] = 0
+    else:
+        trips = gravity_od(entries, exits, times, beta=beta)
+        walked = np.zeros_like(entries)
+    link_inc, station_inc = path_incidence(routing, by_line)
+    line_load, through = assign(trips, link_inc, station_inc)
+    link_load = np.asarray(line_load @ collapse_lines(by_line, links))
+    return FlowResult(slot_labels(), stations, links, entries, exits, through, link_load,
+                      trips if keep_trips else None, by_line, line_load, walked)
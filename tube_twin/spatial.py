@@ -0,0 +1,199 @@
+"""
+Spatial index of the stations for nearest-station, radius and catchment queries.
+
+Station coordinates are turned into points on the unit sphere and indexed with a scipy KD-tree. The straight
+line (chord) between two points on the sphere grows monotonically with their great-circle distance, so nearest
+neighbours and radius searches on the tree are exact haversine queries once distances are converted back. All
+queries take arrays of latitudes and longitudes and run vectorized (and across threads) in the tree, so large
+batches of points, e.g. millions of journey origins, are assigned to their catchment station in chunks of bounded
+memory.
+
+Stations close enough to walk between are joined by walking links, which the passenger-flow simulation offers
+the gravity model as an alternative to the tube (see tube_twin.simulation).
+
+    index = get_station_index()
+    distance, station = index.nearest([51.5074], [-0.1278], k=3)   # metres and station ids, shape (1, 3)
+    index.catchment(lat, lon, max_distance=1500)                   # nearest station id per point, -1 if too far
+"""
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from tube_twin.data import files_stamp, load_stations
+from tube_twin.instrument import cache_event, timed
+from tube_twin.paths import GRAPH_DATA
+
+EARTH_RADIUS = 6_371_008.8
+# walking links: straight-line reach in metres, walking speed in metres per minute and street detour factor
+WALK_DISTANCE = 750.0
+WALK_SPEED = 80.0
+WALK_DETOUR = 1.3
+# stations closer than this, in metres, share a site (e.g. the two Hammersmith stations) and get no walking link
+SAME_SITE = 100.0
+# points assigned per chunk by catchment(), bounds the memory of one tree query
+CHUNK = 1_000_000
+
+
+def unit_vectors(lat, lon):
+    """
+      (N, 3) points on the unit sphere of latitudes and longitudes in degrees
+    """
+    lat, lon = np.radians(np.asarray(lat, dtype='float64')), np.radians(np.asarray(lon, dtype='float64'))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def to_chord(metres):
+    """
+      chord length on the unit sphere of a great-circle distance in metres
+    """
+    return 2 * np.sin(np.minimum(np.asarray(metres, dtype='float64') / EARTH_RADIUS, np.pi) / 2)
+
+
+def to_metres(chord):
+    """
+      great-circle distance in metres of a chord length on the unit sphere (inf stays inf)
+    """
+    chord = np.asarray(chord, dtype='float64')
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isfinite(chord), 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord, 2.0) / 2), np.inf)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+      great-circle distance in metres between points given in degrees, element-wise
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype='float64')) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class StationIndex:
+    """
+      KD-tree over the stations; every query returns station ids (of london.stations.csv) and distances in metres
+    """
+
+    def __init__(self, ids, lat, lon):
+        self.ids = np.asarray(ids, dtype='int32')
+        self.lat = np.asarray(lat, dtype='float64')
+        self.lon = np.asarray(lon, dtype='float64')
+        self.tree = cKDTree(unit_vectors(self.lat, self.lon))
+
+    def nearest(self, lat, lon, k=1, max_distance=np.inf, workers=-1):
+        """
+          the k nearest stations of every point, as (distances, ids) of shape (N, k); slots without a station
+          within max_distance metres hold inf and -1
+        """
+        bound = to_chord(max_distance) if np.isfinite(max_distance) else np.inf
+        chord, found = self.tree.query(unit_vectors(lat, lon), k=[*range(1, k + 1)], distance_upper_bound=bound,
+                                       workers=workers)
+        ids = np.append(self.ids, -1)[found]
+        return to_metres(chord), ids
+
+    def within(self, lat, lon, radius, workers=-1):
+        """
+          ids of the stations within radius metres of every point, as a list of arrays sorted by distance
+        """
+        points = unit_vectors(lat, lon)
+        hits = self.tree.query_ball_point(points, to_chord(radius), workers=workers)
+        result = []
+        for point, found in zip(points, hits):
+            found = np.asarray(found, dtype='int64')
+            order = np.argsort(np.linalg.norm(self.tree.data[found] - point, axis=1))
+            result.append(self.ids[found[order]])
+        return result
+
+    def catchment(self, lat, lon, max_distance=np.inf, chunk=CHUNK, workers=-1):
+        """
+          id of the nearest station of every point, -1 for points further than max_distance metres from all of
+          them; points are processed chunk at a time
+        """
+        lat, lon = np.asarray(lat, dtype='float64').ravel(), np.asarray(lon, dtype='float64').ravel()
+        result = np.empty(len(lat), dtype='int32')
+        for start in range(0, len(lat), chunk):
+            part = slice(start, start + chunk)
+            result[part] = self.nearest(lat[part], lon[part], 1, max_distance, workers)[1][:, 0]
+        return result
+
+    def catchment_counts(self, lat, lon, max_distance=np.inf, chunk=CHUNK):
+        """
+          number of points in the catchment of every station, as a Series indexed by station id
+        """
+        station = self.catchment(lat, lon, max_distance, chunk)
+        counts = np.bincount(np.searchsorted(self.ids, station[station >= 0]), minlength=len(self.ids))
+        return pd.Series(counts, index=self.ids, name='points')
+
+    def pairs_within(self, radius):
+        """
+          station pairs within radius metres of each other, as an (P, 2) array of ids (i < j) and the distances
+        """
+        pairs = self.tree.query_pairs(to_chord(radius), output_type='ndarray')
+        chord = np.linalg.norm(self.tree.data[pairs[:, 0]] - self.tree.data[pairs[:, 1]], axis=1)
+        return self.ids[pairs], to_metres(chord)
+
+
+def build_station_index(stations_df):
+    """
+      spatial index of the stations of a dataframe with 'id', 'latitude' and 'longitude', ordered by id
+    """
+    stations_df = stations_df.dropna(subset=['latitude', 'longitude']).sort_values('id')
+    return StationIndex(stations_df['id'], stations_df['latitude'], stations_df['longitude'])
+
+
+_lock = Lock()
+_indexes = {}
+
+
+def get_station_index():
+    """
+      spatial index of london.stations.csv, built once per process and data version
+    """
+    stamp = files_stamp(GRAPH_DATA / "london.stations.csv")
+    with _lock:
+        cache_event("spatial.memory", stamp in _indexes)
+        if stamp not in _indexes:
+            _indexes.clear()
+            with timed("spatial.build"):
+                _indexes[stamp] = build_station_index(load_stations())
+        return _indexes[stamp]
+
+
+def walking_links(max_distance=WALK_DISTANCE, speed=WALK_SPEED, detour=WALK_DETOUR, min_distance=SAME_SITE,
+                  index=None):
+    """
+      stations close enough to walk between: 'station1', 'station2' (both directions), straight-line 'distance'
+      in metres and walking 'time' in minutes along streets; stations on the same site are left out
+    """
+    index = get_station_index() if index is None else index
+    pairs, distance = index.pairs_within(max_distance)
+    pairs, distance = pairs[distance >= min_distance], distance[distance >= min_distance]
+    time = distance * detour / speed
+    return pd.DataFrame({'station1': np.concatenate([pairs[:, 0], pairs[:, 1]]),
+                         'station2': np.concatenate([pairs[:, 1], pairs[:, 0]]),
+                         'distance': np.tile(distance, 2), 'time': np.tile(time, 2)})
+
+
+def nearest_stations(lat, lon, k=5):
+    """
+      the k stations nearest to one point with their 'name', straight-line 'metres' and walking 'minutes'
+    """
+    distance, ids = get_station_index().nearest([lat], [lon], k=k)
+    names = load_stations().drop_duplicates('id').set_index('id')['name']
+    return pd.DataFrame({'id': ids[0], 'name': names.reindex(ids[0]).astype(str).to_numpy(), 'metres': distance[0],
+                         'minutes': distance[0] * WALK_DETOUR / WALK_SPEED})
+
+
+def walking_times(station_ids, links=None):
+    """
+      (stations, stations) walking minutes between the stations of station_ids, inf where they are not linked
+    """
+    links = walking_links() if links is None else links
+    station_ids = np.asarray(station_ids)
+    times = np.full((len(station_ids), len(station_ids)), np.inf)
+    position = pd.Series(np.arange(len(station_ids)), index=station_ids)
+    known = links['station1'].isin(position.index) & links['station2'].isin(position.index)
+    times[position[links.loc[known, 'station1']].to_numpy(),
+          position[links.loc[known, 'station2']].to_numpy()] = links.loc[known, 'time'].to_numpy()
+    np.fill_diagonal(times, 0.0)
+    return times
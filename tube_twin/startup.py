@@ -0,0 +1,89 @@
+"""
+Cold-start benchmark of the dashboard pages.
+
+Every page is run in a fresh interpreter with Streamlit's AppTest, the way a newly started server process renders
+it for its first visitor: the time until the script has run to the end is the page's time to first render. The
+report also splits off the time spent importing Streamlit and lists which heavy libraries the page pulled in.
+
+    python -m tube_twin.startup [--repeat 3] [--pages map forecasting]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from tube_twin.paths import ROOT
+
+PAGES = {
+    "home": "🚇London_Tube🚊.py",
+    "map": "pages/1_🌍_London_Map_&_Simulation.py",
+    "insights": "pages/2_🌏_Graph_Insights.py",
+    "forecasting": "pages/3_⏳_Time_series_Crowding_Forecasting.py",
+}
+HEAVY_MODULES = ("statsmodels", "networkx", "folium", "bokeh", "scipy.stats", "sklearn")
+
+# runs in the child interpreter, prints one JSON line
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2])).run()
+finished = time.perf_counter()
+print(json.dumps({"streamlit_import_s": imported - started, "run_s": finished - imported,
+                  "exceptions": [str(e.value) for e in at.exception],
+                  "heavy": [m for m in sys.argv[3].split(",") if m in sys.modules]}))
+"""
+
+
+def measure(page, timeout=300):
+    """
+      runs one page in a fresh interpreter, returns its timings: 'total_s' (interpreter start to end of the run),
+      'streamlit_import_s', 'run_s', the heavy modules it imported and any exceptions
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", _CHILD, str(ROOT / PAGES[page]), str(timeout),
+                          ",".join(HEAVY_MODULES)], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - started
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    return {"page": page, "total_s": total, **result}
+
+
+def run_startup_benchmark(pages=None, repeat=3, log=print):
+    """
+      measures every page repeat times, returns one row per run
+    """
+    rows = []
+    for page in pages or PAGES:
+        for i in range(repeat):
+            row = measure(page)
+            rows.append({**row, "run": i, "heavy": ",".join(row["heavy"]), "exceptions": len(row["exceptions"])})
+            log(f"{page} #{i}: {row['total_s']:.2f}s")
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time to first render of every dashboard page from a cold start.")
+    parser.add_argument("--pages", nargs="*", choices=list(PAGES), help="pages to measure, all by default")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per page")
+    parser.add_argument("--json", help="also write the runs to this JSON file")
+    args = parser.parse_args(argv)
+    runs = run_startup_benchmark(args.pages, args.repeat)
+    summary = runs.groupby('page', sort=False).agg(total_s=('total_s', 'median'),
+                                                   streamlit_import_s=('streamlit_import_s', 'median'),
+                                                   run_s=('run_s', 'median'), heavy=('heavy', 'first'),
+                                                   exceptions=('exceptions', 'max'))
+    print(summary.round(3).to_string())
+    if args.json:
+        runs.to_json(args.json, orient="records", indent=2)
+    return 1 if summary['exceptions'].any() else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,84 @@
+"""
+Offline batch training of the per-station forecast models.
+
+Goes through every NLC in Forecasting_Data/data/data.parquet, runs the SARIMAX order search for stations whose
+registry entry is missing or stale and registers the winners, so the forecasting page only serves stored models.
+
+    python -m tube_twin.train [--workers N] [--stations NLC ...] [--force]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tube_twin import registry
+from tube_twin.forecast import MAX_ORDER, SEASONAL_PERIOD, load_forecasting_data, search_order
+
+
+def _search_station(nlc, series):
+    # one station per worker process, its order search runs in-process
+    return search_order(series, workers=1)
+
+
+def station_series(df):
+    """
+      yields (nlc, 'Count of Taps' series) for every station in the forecasting data
+    """
+    for nlc, group in df.groupby('NLC', sort=True):
+        yield int(nlc), group['Count of Taps'].copy()
+
+
+def train_all(df=None, stations=None, workers=None, force=False, log=print):
+    """
+      trains and registers a model for every station that needs one
+
+      parameters: df - forecasting data, read from data.parquet when omitted
+                  stations - optional NLC codes to restrict the run to
+                  workers - number of stations searched in parallel, defaults to the number of CPUs
+                  force - retrain even when the station's registry entry is up to date
+                  log - callable receiving one progress line per station
+
+      returns a dict of NLC -> registry entry (or the error message for stations that failed)
+    """
+    df = load_forecasting_data() if df is None else df
+    todo = {}
+    for nlc, series in station_series(df):
+        if stations and nlc not in stations:
+            continue
+        if not force and registry.lookup(nlc, series, max_order=MAX_ORDER) is not None:
+            continue
+        todo[nlc] = series
+    log(f"training {len(todo)} station models")
+
+    results = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = {pool.submit(_search_station, nlc, series): nlc for nlc, series in todo.items()}
+        for done, future in enumerate(as_completed(futures), start=1):
+            nlc = futures[future]
+            try:
+                param, aic, params = future.result()
+            except Exception as e:
+                results[nlc] = str(e)
+                log(f"[{done}/{len(todo)}] {nlc}: failed ({e})")
+                continue
+            # registered from the parent only, so the index has a single writer
+            results[nlc] = registry.register(nlc, todo[nlc], param, aic, params, SEASONAL_PERIOD,
+                                              max_order=MAX_ORDER)
+            log(f"[{done}/{len(todo)}] {nlc}: order {tuple(param)} AIC {aic:.1f}")
+    log(f"done in {time.perf_counter() - started:.1f}s")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-train per-station SARIMAX models into the model registry.")
+    parser.add_argument("--workers", type=int, default=None, help="stations searched in parallel")
+    parser.add_argument("--stations", type=int, nargs="*", help="only train these NLC codes")
+    parser.add_argument("--force", action="store_true", help="retrain stations whose entry is still fresh")
+    args = parser.parse_args(argv)
+    results = train_all(stations=args.stations, workers=args.workers, force=args.force)
+    return 1 if any(isinstance(r, str) for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,31 +1,12 @@
 import streamlit as st
-from PIL import Image
-import base64
 
-st.set_page_config(
-    page_title="London Tube Twin",
-    page_icon="🚉",
-)
-
-st.write("# London Tube Twin 🚉")
+from tube_twin.app import setup_page
+from tube_twin.instrument import finish_run
 
-# # background image
-def add_bg_from_local(image_file):
-    with open(image_file, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read())
-    st.markdown(
-    f"""
-    <style>
-    .stApp {{
-        background-image: url(data:image/{"jpg"};base64,{encoded_string.decode()});
-        background-size: cover;
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True
-    )
+# page config, background and page timing (see tube_twin.app)
+setup_page("London Tube Twin", "🚉", "home")
 
-add_bg_from_local('faint_bg.jpg')
+st.write("# London Tube Twin 🚉")
 
 st.sidebar.success("Jump onboard above.")
 
@@ -42,4 +23,6 @@ st.markdown(
     - A passenger count forecast at each station (entry and exit), in monthly increments since 2018 to 2021,
       based on counts at other stations
 """
-)
\ No newline at end of file
+)
+
+finish_run()